@@ -1,5 +1,6 @@
 import sys
 import os
+import logging
 
 import pygame
 from pygame.image import load
@@ -9,12 +10,17 @@ from src.editor import Editor
 from src.utilities import utilities
 from src.level import Level
 from src.transition import Transition
+from src.timer import scheduler
+from src.playlist import Playlist
+from src.quality import governor
+from src.profiling import profiler
+from src import level_file
 
 
 class Main:
     """Main game class"""
-    def __init__(self):
-        """Initialize the game"""
+    def __init__(self, pack=None):
+        """Initialize the game, play the level files of the pack in order if given"""
         # Initialize the pygame
         pygame.init()
 
@@ -23,6 +29,11 @@ class Main:
         # Set the game timer
         self.clock = pygame.time.Clock()
 
+        # Let only the events used by the editor and the level into the queue (mouse motion floods it otherwise)
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP,
+                                  pygame.MOUSEWHEEL])
+
         # Import the assets
         self._import_assets()
 
@@ -42,11 +53,26 @@ class Main:
         # Transition between editor and the level
         self.transition = Transition(self._toggle_editor)
 
+        # Play the level pack first, the next level file gets decoded in the background while the current level runs
+        self.playlist = None
+        if pack:
+            self.playlist = Playlist(pack, self._switch, self._next_level, self._level_assets())
+            self.level = self.playlist.advance()
+            # Stay in the editor if none of the levels can be played
+            if self.level:
+                self.editor_on = False
+                self.editor.pause()
+            else:
+                self.playlist = None
+
     def run(self):
         """Run the game loop"""
         while True:
-            # Delta time for FPS
-            delta_time = self.clock.tick() / 1000
+            # Delta time for FPS, the clock is read once and the scheduler runs the due timers (it can pause and
+            # scale the time), the quality governor watches the frame times
+            frame_time = self.clock.tick()
+            governor.record(frame_time)
+            delta_time = scheduler.tick(frame_time) / 1000
 
             # Run the editor when it's active
             if self.editor_on:
@@ -56,10 +82,17 @@ class Main:
                 self.level.run(delta_time)
 
             # Draw the transition effect
-            self.transition.display(delta_time)
+            with profiler.probe("transition"):
+                self.transition.display(delta_time)
+
+            # Draw the frame profiler's graph over everything (when it's on)
+            profiler.display(self.surface)
 
             # Update the surface
-            self._update_surface()
+            with profiler.probe("display"):
+                self._update_surface()
+            # End the frame's timing
+            profiler.frame()
 
     def _update_surface(self):
         """Update the main surface and draw everything onto it"""
@@ -67,95 +100,51 @@ class Main:
 
     def _import_assets(self):
         """Import all general assets"""
-        # Import land tiles
-        self.land_tiles = utilities.import_folder_dict("../graphics/terrain/land")
-        # Import bottom water tile
-        self.water_bottom = (load(os.path.join(settings.BASE_PATH, "../graphics/terrain/water/water_bottom.png"))
-                             .convert_alpha())
-        # Get the entire water animation
-        self.water_top = utilities.import_folder("../graphics/terrain/water/animation")
-
-        # Import every coin graphic
-        self.gold_coin = utilities.import_folder("../graphics/items/gold")
-        self.silver_coin = utilities.import_folder("../graphics/items/silver")
-        self.diamond_coin = utilities.import_folder("../graphics/items/diamond")
-
-        # Import enemies
-        # Spikes
-        self.spikes = (load(os.path.join(settings.BASE_PATH, "../graphics/enemies/spikes/spikes.png"))
-                       .convert_alpha())
-        # Get all the tooth assets
-        self.tooth = {}
-        for folder in list(os.walk(os.path.join(settings.BASE_PATH, "../graphics/enemies/tooth")))[0][1]:
-            # Import the tooth enemy and add it to the dictionary
-            self.tooth[folder] = utilities.import_folder(f"../graphics/enemies/tooth/{folder}")
-
-        # Get shells assets (only for the left one, to get the right one just flip it)
-        self.shell = {}
-        for folder in list(os.walk(os.path.join(settings.BASE_PATH, "../graphics/enemies/shell_left")))[0][1]:
-            self.shell[folder] = utilities.import_folder(f"../graphics/enemies/shell_left/{folder}")
-        # Shell's bullets
-        self.pearl = load(os.path.join(settings.BASE_PATH, "../graphics/enemies/pearl/pearl.png")).convert_alpha()
-
-        # Import the player's assets
-        self.player_assets = {}
-        for folder in list(os.walk(os.path.join(settings.BASE_PATH, "../graphics/player")))[0][1]:
-            self.player_assets[folder] = utilities.import_folder(f"../graphics/player/{folder}")
-
-        # Get the cloud's assets
-        self.clouds = utilities.import_folder(f"../graphics/clouds")
-
-        # Palm assets dictionary
-        self.palms = {}
-        # Go through each of the palm folders and then import them
-        for folder in list(os.walk(os.path.join(settings.BASE_PATH, "../graphics/terrain/palm")))[0][1]:
-            # Import the palm, add it to the dictionary
-            self.palms[folder] = utilities.import_folder(f"../graphics/terrain/palm/{folder}")
-
-        # Import the particles
-        self.particle = utilities.import_folder("../graphics/items/particle")
+        # Assets of the levels
+        self.assets = utilities.import_level_assets()
+        # Land tiles, used by the editor too
+        self.land_tiles = self.assets["land"]
 
     def _toggle_editor(self):
         """Toggle the editor"""
         self.editor_on = not self.editor_on
+        # Editor's timers run only while it's shown
+        if self.editor_on:
+            self.editor.resume()
+        else:
+            self.editor.pause()
 
     def _switch(self, grid=None):
         """Switch between the level and the editor, saving the map"""
         # Turn on the transition
         self.transition.active = True
 
+        # Stop playing the level pack
+        if self.playlist:
+            self.playlist.stop()
+            self.playlist = None
+
         # If a grid exists
         if grid:
-            self.level = Level(grid, self._switch, {
-                # Terrains
-                "land": self.land_tiles,
-                "water_bottom": self.water_bottom,
-                "water_top": self.water_top,
-
-                # Coins
-                "gold_coin": self.gold_coin,
-                "silver_coin": self.silver_coin,
-                "diamond_coin": self.diamond_coin,
-
-                # Enemies
-                "spikes": self.spikes,
-                "tooth": self.tooth,
-                "shell": self.shell,
-                "pearl": self.pearl,
-                # Player
-                "player": self.player_assets,
-
-                # Clouds
-                "clouds": self.clouds,
+            self.level = Level(grid, self._switch, self._level_assets())
+            self.level.start()
 
-                # All the palms
-                "palms": self.palms,
+    def _next_level(self):
+        """Go to the next level of the pack, back to the editor after the last one"""
+        level = self.playlist.advance()
+        if level:
+            self.level = level
+        else:
+            self._switch()
 
-                # Particles
-                "particle": self.particle
-            })
+    def _level_assets(self):
+        """Get the assets used by the levels"""
+        return self.assets
 
 
 if __name__ == "__main__":
-    main = Main()
+    # Show the quality tier changes
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+    # Level files and directories of the level pack can be given as the arguments
+    main = Main(level_file.level_pack(sys.argv[1:]))
     main.run()
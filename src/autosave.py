@@ -0,0 +1,288 @@
+import os
+import atexit
+import queue
+import logging
+import struct
+import threading
+
+import numpy
+
+from src.settings import settings
+from src import level_file
+from src.timer import scheduler
+
+
+# Damaged autosaves are logged
+logger = logging.getLogger(__name__)
+
+# Journal header: magic, chunk size and generation of the snapshot that the journal continues
+JOURNAL_HEADER = struct.Struct("<4sHI")
+JOURNAL_MAGIC = b"PYMJ"
+# Journal record: kind, chunk column, chunk row and the size of the data after it
+RECORD = struct.Struct("<Biii")
+# Kinds of the records, a chunk with its tile layers or every object
+CHUNK_RECORD = 0
+OBJECTS_RECORD = 1
+
+# Tile store layers kept for every chunk (terrain, water, coin, enemy and the water on top flag)
+SAVED_LAYERS = [0, 1, 2, 3, 5]
+
+
+class AutosaveWriter(threading.Thread):
+    """Background thread that writes the autosave files"""
+    def __init__(self):
+        """Initialize the writer"""
+        super().__init__(daemon=True)
+        # Functions writing the files, called in order
+        self.jobs = queue.Queue()
+
+    def run(self):
+        """Run the jobs until stopped"""
+        while True:
+            # Wait for the job, None stops the writer
+            job = self.jobs.get()
+            if job is None:
+                break
+            job()
+
+    def stop(self):
+        """Stop the writer once every job is done"""
+        self.jobs.put(None)
+        self.join()
+
+
+class Autosave:
+    """Saves the editor's map in the background, edited chunks are added to a journal, compacted into snapshots"""
+    def __init__(self, map_data, objects, directory=settings.AUTOSAVE_PATH, interval=settings.AUTOSAVE_INTERVAL,
+                 compact_size=settings.AUTOSAVE_COMPACT_SIZE):
+        """Initialize the autosave, objects function gets rows of X, Y and tile ID of every map object"""
+        # Saved tiles and the objects
+        self.map_data = map_data
+        self.objects = objects
+
+        # Paths of the files
+        self.directory = os.path.join(settings.BASE_PATH, directory)
+        self.journal_path = os.path.join(self.directory, "journal")
+
+        # Chunks and objects changed since the last save
+        self.dirty_chunks = set()
+        self.objects_dirty = False
+        self.map_data.listeners.append(self._mark_region)
+
+        # Size of the journal, it gets compacted into a snapshot once it grows beyond the limit
+        self.compact_size = compact_size
+        self.journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        # Generation of the current snapshot
+        self.generation = _read_generation(self.journal_path) or 0
+
+        # Write the files in the background
+        self.writer = AutosaveWriter()
+        self.writer.start()
+        # Save the changes on an interval
+        self.call = scheduler.schedule(interval, self.save, repeat=True)
+        # Write the last changes when the game exits, from the editor, the level or anywhere else
+        atexit.register(self.stop)
+
+    def mark_objects(self):
+        """Save the objects with the next save"""
+        self.objects_dirty = True
+
+    def forget_changes(self):
+        """Forget the changes made so far, they are saved already"""
+        self.dirty_chunks.clear()
+        self.objects_dirty = False
+
+    def recover(self):
+        """Read the autosaved level data, None if there is none or it's damaged (the damaged journal is set aside, so
+        the next saves start a new one instead of appending to it)"""
+        try:
+            level = load_autosave(self.directory)
+            problem = "no journal header"
+        except Exception as error:
+            level = None
+            problem = f"{type(error).__name__}: {error}"
+
+        if level is None and os.path.exists(self.journal_path):
+            logger.warning("Autosave in %s can't be read (%s), starting with an empty map", self.directory, problem)
+            os.replace(self.journal_path, self.journal_path + ".damaged")
+            self.journal_size = 0
+            # New journal shouldn't continue the snapshot either, it might be the damaged part
+            self.generation += 1
+        return level
+
+    def save(self):
+        """Copy the changed chunks and objects, let the writer save them"""
+        if not self.dirty_chunks and not self.objects_dirty:
+            return
+
+        # Size of the journal records
+        chunk_bytes = len(SAVED_LAYERS) * self.map_data.chunk_size ** 2
+        size = len(self.dirty_chunks) * (RECORD.size + chunk_bytes)
+
+        # Compact everything into a new snapshot once the journal gets too big
+        if self.journal_size + size > self.compact_size:
+            chunks = {chunk_pos: chunk.data[SAVED_LAYERS] for chunk_pos, chunk in self.map_data.chunks.items()}
+            self.generation += 1
+            generation = self.generation
+            objects = self.objects()
+            self.writer.jobs.put(lambda: self._write_snapshot(generation, chunks, objects))
+            self.journal_size = 0
+
+        # Otherwise only append the changes to the journal (removed chunks are saved empty)
+        else:
+            chunks = {}
+            for chunk_pos in self.dirty_chunks:
+                chunk = self.map_data.chunks.get(chunk_pos)
+                chunks[chunk_pos] = (chunk.data[SAVED_LAYERS] if chunk is not None
+                                     else numpy.zeros((len(SAVED_LAYERS),) + (self.map_data.chunk_size,) * 2,
+                                                      numpy.uint8))
+            objects = self.objects() if self.objects_dirty else None
+            generation = self.generation
+            self.writer.jobs.put(lambda: self._append(generation, chunks, objects))
+            self.journal_size += size
+
+        self.forget_changes()
+
+    def stop(self):
+        """Save the last changes and wait until they are written (once, later calls do nothing)"""
+        if not self.writer.is_alive():
+            return
+        atexit.unregister(self.stop)
+
+        scheduler.cancel(self.call)
+        self.save()
+        self.writer.stop()
+
+    def _mark_region(self, left, top, right, bottom):
+        """Mark the chunks of the edited region"""
+        size = self.map_data.chunk_size
+        for chunk_y in range(top // size, bottom // size + 1):
+            for chunk_x in range(left // size, right // size + 1):
+                self.dirty_chunks.add((chunk_x, chunk_y))
+
+    def _append(self, generation, chunks, objects):
+        """Append the records to the journal (writer thread)"""
+        os.makedirs(self.directory, exist_ok=True)
+        # Start the journal if it doesn't exist
+        if not os.path.exists(self.journal_path):
+            _create_journal(self.journal_path, self.map_data.chunk_size, generation)
+
+        with open(self.journal_path, "ab") as file:
+            for (chunk_x, chunk_y), data in chunks.items():
+                file.write(RECORD.pack(CHUNK_RECORD, chunk_x, chunk_y, data.nbytes))
+                file.write(data.tobytes())
+            if objects is not None:
+                data = numpy.array(objects, "<i4").reshape(-1, 3)
+                file.write(RECORD.pack(OBJECTS_RECORD, 0, 0, data.nbytes))
+                file.write(data.tobytes())
+            # Make sure the records are on the disk
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _write_snapshot(self, generation, chunks, objects):
+        """Save the whole map as a new snapshot, start an empty journal continuing it (writer thread)"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Save the snapshot (onto the disk, before the journal points to it), then replace the journal, so the old
+        # snapshot and journal stay usable until then
+        level = level_file.LevelData("map", self.map_data.chunk_size)
+        for chunk_pos, data in chunks.items():
+            _set_chunk(level, chunk_pos, data)
+        level.set_objects(objects)
+        level_file.save_level(_snapshot_path(self.directory, generation), level, durable=True)
+
+        _create_journal(self.journal_path, self.map_data.chunk_size, generation)
+
+        # Remove the older snapshots
+        for name in os.listdir(self.directory):
+            if name.startswith("snapshot_") and name != os.path.basename(_snapshot_path(self.directory, generation)):
+                os.remove(os.path.join(self.directory, name))
+
+
+def load_autosave(directory=settings.AUTOSAVE_PATH):
+    """Read the snapshot and replay the journal on top of it, None if nothing was autosaved"""
+    directory = os.path.join(settings.BASE_PATH, directory)
+    journal_path = os.path.join(directory, "journal")
+    if not os.path.exists(journal_path):
+        return None
+
+    with open(journal_path, "rb") as file:
+        data = file.read()
+    # Journal cut off in its header or not a journal at all
+    if len(data) < JOURNAL_HEADER.size:
+        return None
+    magic, chunk_size, generation = JOURNAL_HEADER.unpack_from(data, 0)
+    if magic != JOURNAL_MAGIC:
+        return None
+
+    # Start from the snapshot if there is one
+    snapshot_path = _snapshot_path(directory, generation)
+    level = (level_file.load_level(snapshot_path) if os.path.exists(snapshot_path)
+             else level_file.LevelData("map", chunk_size))
+
+    # Replay the records, a record cut off by a crash is skipped
+    offset = JOURNAL_HEADER.size
+    while offset + RECORD.size <= len(data):
+        kind, chunk_x, chunk_y, size = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + size > len(data):
+            break
+        value_type = numpy.dtype(numpy.uint8 if kind == CHUNK_RECORD else "<i4")
+        values = numpy.frombuffer(data, value_type, size // value_type.itemsize, offset)
+        offset += size
+
+        if kind == CHUNK_RECORD:
+            _set_chunk(level, (chunk_x, chunk_y), values.reshape(len(SAVED_LAYERS), chunk_size, chunk_size))
+        else:
+            level.set_objects(values.reshape(-1, 3))
+
+    return level
+
+
+def _set_chunk(level, chunk_pos, data):
+    """Set the level data's chunk from the saved tile store layers, empty layers are removed"""
+    terrain, water, coins, enemies, water_top = data
+    layers = {
+        "terrain": (terrain != 0) * numpy.uint16(level_file.TERRAIN_FLAG),
+        # Water with more water above is the bottom one
+        "water": numpy.where(water != 0, numpy.where(water_top != 0, level_file.WATER_TYPES["bottom"],
+                                                     level_file.WATER_TYPES["top"]), 0),
+        "coins": coins,
+        "enemies": enemies,
+    }
+    for name, values in layers.items():
+        if values.any():
+            level.layers[name][chunk_pos] = values.astype(level_file.LAYERS[name])
+        else:
+            level.layers[name].pop(chunk_pos, None)
+
+
+def _snapshot_path(directory, generation):
+    """Get path of the snapshot of the generation"""
+    return os.path.join(directory, f"snapshot_{generation}{settings.LEVEL_EXTENSION}")
+
+
+def _create_journal(path, chunk_size, generation):
+    """Create a journal with only its header, written aside first, so a crash never leaves a cut off header"""
+    temporary_path = path + ".new"
+    _write_journal_header(temporary_path, chunk_size, generation)
+    os.replace(temporary_path, path)
+
+
+def _write_journal_header(path, chunk_size, generation):
+    """Create a journal with only its header"""
+    with open(path, "wb") as file:
+        file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, chunk_size, generation))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _read_generation(path):
+    """Read the snapshot generation from the journal's header, None if there is no journal"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        header = file.read(JOURNAL_HEADER.size)
+    if len(header) < JOURNAL_HEADER.size or not header.startswith(JOURNAL_MAGIC):
+        return None
+    return JOURNAL_HEADER.unpack(header)[2]
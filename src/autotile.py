@@ -0,0 +1,55 @@
+import numpy
+
+from src.settings import settings
+
+
+# Neighbor names ordered by their bit in the mask
+NEIGHBOR_LETTERS = ''.join(settings.NEIGHBOR_CELLS)
+# Column and row offsets of the neighbors, in the same order
+NEIGHBOR_OFFSETS = list(settings.NEIGHBOR_CELLS.values())
+
+
+def terrain_to_mask(terrain):
+    """Convert terrain neighbors string into a bit mask"""
+    # Default terrain has no neighbors
+    if terrain == 'X':
+        return 0
+    # Set a bit for every neighbor letter
+    return sum(1 << NEIGHBOR_LETTERS.index(letter) for letter in terrain)
+
+
+def mask_to_terrain(mask):
+    """Convert the bit mask back into terrain neighbors string"""
+    # Take the letters of every set bit
+    terrain = ''.join(letter for bit, letter in enumerate(NEIGHBOR_LETTERS) if mask & (1 << bit))
+    # Empty neighbors are the default terrain
+    return terrain if terrain else 'X'
+
+
+# Terrain neighbors string of every possible mask
+TERRAIN_NAMES = [mask_to_terrain(mask) for mask in range(256)]
+
+
+class TerrainTable:
+    """Land tile of every neighbor mask, looked up instead of joining the neighbor names"""
+    def __init__(self, land_tiles):
+        """Precompute the table"""
+        # Names of the tiles, masks without their own graphic use the default one
+        self.names = [name if name in land_tiles else 'X' for name in TERRAIN_NAMES]
+        # Surfaces of the tiles
+        self.surfaces = [land_tiles[name] for name in self.names]
+
+
+def neighbor_masks(terrain):
+    """Calculate masks of the terrain neighbors, terrain has one cell of padding around the calculated area"""
+    # Size of the calculated area
+    rows = terrain.shape[0] - 2
+    columns = terrain.shape[1] - 2
+
+    # Add the bit of every neighbor direction at once
+    mask = numpy.zeros((rows, columns), numpy.uint8)
+    for bit, (offset_x, offset_y) in enumerate(NEIGHBOR_OFFSETS):
+        neighbors = terrain[1 + offset_y:1 + offset_y + rows, 1 + offset_x:1 + offset_x + columns]
+        mask |= (neighbors != 0).astype(numpy.uint8) << bit
+
+    return mask
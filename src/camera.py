@@ -1,3 +1,5 @@
+import math
+
 import pygame
 from pygame.math import Vector2 as vector
 
@@ -14,6 +16,25 @@ class CameraGroup(pygame.sprite.Group):
         self.surface = pygame.display.get_surface()
         # Offset of the camera
         self.offset = vector()
+        # Cloud field and particle system of the level
+        self.clouds = None
+        self.particles = None
+
+        # Horizon lines flag, without them only the sea is drawn
+        self.horizon_lines = True
+
+        # Depths of the drawn sprites (clouds are drawn by the cloud field)
+        self.depths = set(settings.LAYERS_DEPTH.values()) - {settings.LAYERS_DEPTH["clouds"]}
+        # Rectangle reused to place the sprites on the screen
+        self.screen_rect = pygame.Rect(0, 0, 0, 0)
+
+    def sort_sprites(self):
+        """Order the sprites by their depth, then by the grid layer they were built from (sprites without it, like the
+        fired pearls, go on top), keeping the order of the equal ones"""
+        ordered = sorted(self.spritedict.items(),
+                         key=lambda item: (item[0].pos_z, getattr(item[0], "draw_rank", math.inf)))
+        self.spritedict.clear()
+        self.spritedict.update(ordered)
 
     def custom_draw(self, player):
         """Draw everything based off the player's position"""
@@ -25,27 +46,29 @@ class CameraGroup(pygame.sprite.Group):
         self.draw_horizon()
 
         # Draw the clouds next
-        for sprite in self:
-            # Check if it's a cloud
-            if sprite.pos_z == settings.LAYERS_DEPTH["clouds"]:
-                # Calculate its offset and blit it
-                offset_rect = sprite.rect.copy()
-                offset_rect.center -= self.offset
-                self.surface.blit(sprite.image, offset_rect)
+        if self.clouds is not None:
+            self.clouds.draw(self.surface, self.offset)
+
+        # Offset in whole pixels
+        offset_x = int(self.offset.x)
+        offset_y = int(self.offset.y)
 
         # Go through each of sprite within this group
         for sprite in self:
-            # Go through each possible layer depth value, starting from the most background ones
-            for layer_depth in settings.LAYERS_DEPTH.values():
-                # If layer position is right, handle the sprite drawing
-                if sprite.pos_z == layer_depth and sprite.pos_z != settings.LAYERS_DEPTH["clouds"]:
-                    # Get this sprite rectangle
-                    rect = sprite.rect.copy()
-                    # Apply offset to it
-                    rect.center -= self.offset
-
-                    # Blit this sprite
-                    self.surface.blit(sprite.image, rect)
+            # If layer position is right, handle the sprite drawing
+            if sprite.pos_z in self.depths:
+                # Apply offset to this sprite rectangle
+                rect = sprite.rect
+                self.screen_rect.x = rect.x - offset_x
+                self.screen_rect.y = rect.y - offset_y
+
+                # Blit this sprite
+                self.surface.blit(sprite.image, self.screen_rect)
+
+                # Particles are in the main layer, drawn right after the player, so the foreground palms and the
+                # pearls cover them like they cover him
+                if sprite is player and self.particles is not None:
+                    self.particles.draw(self.surface, self.offset)
 
     def draw_horizon(self):
         """Draw the horizon"""
@@ -59,6 +82,10 @@ class CameraGroup(pygame.sprite.Group):
             # Draw the sea
             pygame.draw.rect(self.surface, settings.COLORS["SEA"], sea_rect)
 
+            # Skip the horizon lines if they are turned off
+            if not self.horizon_lines:
+                return
+
             # Calculate the horizon lines positions
             horizon_rect_1 = pygame.Rect(0, horizon_pos - 2, settings.WINDOW_WIDTH, 10)
             horizon_rect_2 = pygame.Rect(0, horizon_pos - 7, settings.WINDOW_WIDTH, 4)
@@ -0,0 +1,71 @@
+import numpy
+
+from src.settings import settings
+from src.utilities import utilities
+
+
+class CloudField:
+    """Clouds stored in arrays, moved, culled and drawn all at once"""
+    def __init__(self, surfaces, dead_zone):
+        """Initialize the cloud field"""
+        # Cloud surfaces, followed by the same ones scaled two times
+        self.surfaces = list(surfaces) + utilities.scaled_frames(surfaces)
+        # Size of every surface, to cull the clouds
+        self.widths = numpy.array([surface.get_width() for surface in self.surfaces])
+        self.heights = numpy.array([surface.get_height() for surface in self.surfaces])
+
+        # Clouds moving to the left of the dead zone get removed
+        self.dead_zone = dead_zone
+        # Maximum amount of clouds, None for no limit
+        self.limit = None
+
+        # Top left positions, speeds and surface indexes of the clouds
+        self.x = numpy.zeros(0)
+        self.y = numpy.zeros(0)
+        self.speed = numpy.zeros(0)
+        self.surface_ids = numpy.zeros(0, int)
+
+    def __len__(self):
+        """Get the amount of clouds"""
+        return len(self.x)
+
+    def random_surfaces(self, count, scale_chance):
+        """Choose random surfaces for the clouds, some of them scaled two times"""
+        amount = len(self.surfaces) // 2
+        return numpy.random.randint(0, amount, count) + amount * (numpy.random.random(count) < scale_chance)
+
+    def add(self, x, y, speed, surface_ids):
+        """Add clouds, every argument can be a number or an array of them, the ones above the limit are skipped"""
+        if self.limit is not None:
+            room = max(self.limit - len(self), 0)
+            x, y, speed, surface_ids = (numpy.atleast_1d(values)[:room] for values in (x, y, speed, surface_ids))
+        self.x = numpy.append(self.x, x)
+        self.y = numpy.append(self.y, y)
+        self.speed = numpy.append(self.speed, speed)
+        self.surface_ids = numpy.append(self.surface_ids, surface_ids)
+
+    def step(self, delta_time):
+        """Move every cloud to the left and remove the ones in the dead zone"""
+        self.x -= self.speed * delta_time
+
+        # Keep only the clouds outside of the dead zone
+        alive = self.x > self.dead_zone
+        if not alive.all():
+            self.x = self.x[alive]
+            self.y = self.y[alive]
+            self.speed = self.speed[alive]
+            self.surface_ids = self.surface_ids[alive]
+
+    def draw(self, surface, offset=(0, 0)):
+        """Draw the clouds on the screen, moved by the offset"""
+        # Get the clouds positions on the screen
+        screen_x = (self.x - offset[0]).astype(int)
+        screen_y = (self.y - offset[1]).astype(int)
+
+        # Take only the visible clouds
+        visible = ((screen_x < settings.WINDOW_WIDTH) & (screen_x + self.widths[self.surface_ids] > 0)
+                   & (screen_y < settings.WINDOW_HEIGHT) & (screen_y + self.heights[self.surface_ids] > 0))
+
+        # Blit them at once
+        surface.blits(zip([self.surfaces[surface_id] for surface_id in self.surface_ids[visible].tolist()],
+                          zip(screen_x[visible].tolist(), screen_y[visible].tolist())), False)
@@ -0,0 +1,320 @@
+import time
+from random import choice
+
+import numpy
+import pygame
+
+from src.settings import settings
+from src.utilities import utilities
+from src.sprites import AnimatedSprite, Coin, GenericSprite
+from src.enemies import Spikes, Tooth, set_patrols
+
+
+# Arrays of the components, by their name
+ARRAYS = {
+    # Flags of existing entities and of their components
+    "alive": bool, "has_velocity": bool, "has_animation": bool, "has_collider": bool, "has_patrol": bool,
+    # Position and the rectangle position rounded from it
+    "x": float, "y": float, "rect_x": int, "rect_y": int,
+    # Velocity
+    "vx": float, "vy": float,
+    # Animation state (index of the frames), its frame and the amount of frames
+    "state": int, "frame": float, "frame_count": int,
+    # Collider size and the damage it deals
+    "width": int, "height": int, "damage": int,
+    # Left and right edge of the patrolled floor
+    "patrol_left": int, "patrol_right": int,
+}
+
+
+class World:
+    """Entities stored as component arrays, updated by the systems in bulk"""
+    def __init__(self, capacity=1024):
+        """Initialize the world"""
+        # Amount of entity slots in the arrays, the used ones and the free ones among them
+        self.capacity = 0
+        self.count = 0
+        self.free = []
+
+        # Create the arrays
+        for name, kind in ARRAYS.items():
+            setattr(self, name, numpy.zeros(0, kind))
+        self._grow(capacity)
+
+    def __len__(self):
+        """Get the amount of entities"""
+        return self.count - len(self.free)
+
+    def create(self, x, y):
+        """Create an entity at the position, return its ID"""
+        # Reuse a free slot, or take a new one
+        if self.free:
+            entity = self.free.pop()
+        else:
+            if self.count == self.capacity:
+                self._grow(self.capacity * 2)
+            entity = self.count
+            self.count += 1
+
+        # Clear the slot and place the entity
+        for name in ARRAYS:
+            getattr(self, name)[entity] = 0
+        self.alive[entity] = True
+        self.x[entity] = self.rect_x[entity] = x
+        self.y[entity] = self.rect_y[entity] = y
+        return entity
+
+    def remove(self, entity):
+        """Remove the entity"""
+        self.alive[entity] = False
+        self.has_velocity[entity] = self.has_animation[entity] = False
+        self.has_collider[entity] = self.has_patrol[entity] = False
+        self.free.append(entity)
+
+    def set_velocity(self, entity, vx, vy):
+        """Give the entity a velocity"""
+        self.has_velocity[entity] = True
+        self.vx[entity] = vx
+        self.vy[entity] = vy
+
+    def set_animation(self, entity, frame_count, state=0):
+        """Give the entity an animation"""
+        self.has_animation[entity] = True
+        self.frame_count[entity] = frame_count
+        self.state[entity] = state
+
+    def set_collider(self, entity, width, height, damage=0):
+        """Give the entity a collider, dealing the damage if given"""
+        self.has_collider[entity] = True
+        self.width[entity] = width
+        self.height[entity] = height
+        self.damage[entity] = damage
+
+    def set_patrol(self, entity, left, right):
+        """Make the entity walk between the edges, turning around at them"""
+        self.has_patrol[entity] = True
+        self.patrol_left[entity] = left
+        self.patrol_right[entity] = right
+
+    def update(self, delta_time):
+        """Run every system"""
+        animation_system(self, delta_time)
+        patrol_system(self)
+        movement_system(self, delta_time)
+
+    def _grow(self, capacity):
+        """Make the arrays bigger"""
+        for name in ARRAYS:
+            array = getattr(self, name)
+            grown = numpy.zeros(capacity, array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+
+def animation_system(world, delta_time, active=None):
+    """Advance the animations, starting them again after the last frame, only the active ones if their flags are
+    given"""
+    count = world.count
+    animated = world.has_animation[:count] if active is None else world.has_animation[:count] & active
+    frame = world.frame[:count]
+
+    frame[animated] += settings.ANIMATION_SPEED * delta_time
+    frame[animated & (frame >= world.frame_count[:count])] = 0
+
+
+def patrol_system(world, active=None):
+    """Turn the patrolling entities around at the edges of their floor, only the active ones if their flags are given"""
+    count = world.count
+    patrolling = world.has_patrol[:count] if active is None else world.has_patrol[:count] & active
+    vx = world.vx[:count]
+    rect_x = world.rect_x[:count]
+
+    # Turn left at the right edge
+    turn = patrolling & (vx > 0) & (rect_x + world.width[:count] + 1 >= world.patrol_right[:count])
+    vx[turn] *= -1
+    # Turn right at the left edge
+    turn = patrolling & (vx < 0) & (rect_x - 1 < world.patrol_left[:count])
+    vx[turn] *= -1
+
+    # The animation state shows the direction, 0 is left and 1 is right
+    world.state[:count][patrolling] = vx[patrolling] > 0
+
+
+def movement_system(world, delta_time, active=None):
+    """Move the entities by their velocity, only the active ones if their flags are given"""
+    count = world.count
+    moving = world.has_velocity[:count] if active is None else world.has_velocity[:count] & active
+
+    world.x[:count][moving] += world.vx[:count][moving] * delta_time
+    world.y[:count][moving] += world.vy[:count][moving] * delta_time
+    # Round the position of the rectangles
+    world.rect_x[:count][moving] = numpy.round(world.x[:count][moving])
+    world.rect_y[:count][moving] = numpy.round(world.y[:count][moving])
+
+
+def collider_system(world, rect):
+    """Get flags of the entities which colliders overlap the rectangle"""
+    count = world.count
+    left = world.rect_x[:count]
+    top = world.rect_y[:count]
+    return (world.has_collider[:count] & (left < rect.right) & (left + world.width[:count] > rect.left)
+            & (top < rect.bottom) & (top + world.height[:count] > rect.top))
+
+
+class EntitySprite(pygame.sprite.Sprite):
+    """Sprite view of an entity, lets the sprite groups, camera and collisions use it"""
+    def __init__(self, world, entity, animations, group, pos_z=settings.LAYERS_DEPTH["main"], masks=False):
+        """Initialize the entity sprite"""
+        # World of the entity and its ID
+        self.world = world
+        self.entity = entity
+
+        # Frames of every animation state, with their masks if needed
+        self.animations = animations
+        self.masks = [utilities.frame_masks(frames) for frames in animations] if masks else None
+        # Depth position
+        self.pos_z = pos_z
+
+        # Rectangle, reused when the position is read
+        self._rect = animations[0][0].get_rect(topleft=(world.rect_x[entity], world.rect_y[entity]))
+
+        super().__init__(group)
+
+    @property
+    def image(self):
+        """Current frame of the entity, the first one once it's removed"""
+        if self.entity is None:
+            return self.animations[0][0]
+        return self.animations[self.world.state[self.entity]][int(self.world.frame[self.entity])]
+
+    @property
+    def mask(self):
+        """Mask of the current frame, the masks of every frame are created once if they weren't precomputed"""
+        if self.masks is None:
+            self.masks = [utilities.frame_masks(frames) for frames in self.animations]
+        if self.entity is None:
+            return self.masks[0][0]
+        return self.masks[self.world.state[self.entity]][int(self.world.frame[self.entity])]
+
+    @property
+    def rect(self):
+        """Rectangle at the entity's position, the last one once it's removed"""
+        if self.entity is not None:
+            self._rect.x = self.world.rect_x[self.entity]
+            self._rect.y = self.world.rect_y[self.entity]
+        return self._rect
+
+    @property
+    def patrol(self):
+        """Patrol bounds of the entity, None if it doesn't have them"""
+        if self.entity is None or not self.world.has_patrol[self.entity]:
+            return None
+        return self.world.patrol_left[self.entity], self.world.patrol_right[self.entity]
+
+    @patrol.setter
+    def patrol(self, patrol):
+        """Set the patrol bounds"""
+        self.world.set_patrol(self.entity, *patrol)
+
+    def update(self, delta_time):
+        """The systems update the entity"""
+        pass
+
+    def kill(self):
+        """Remove the sprite from the groups and the entity from the world"""
+        super().kill()
+        if self.entity is not None:
+            self.world.remove(self.entity)
+            self.entity = None
+
+
+class SpriteFactory:
+    """Creates the level's simple entities as sprites"""
+    def animated(self, pos, frames, group, pos_z=settings.LAYERS_DEPTH["main"]):
+        """Create an animated decoration"""
+        return AnimatedSprite(pos, frames, group, pos_z)
+
+    def coin(self, pos, frames, group, coin_type):
+        """Create a coin"""
+        return Coin(pos, frames, group, coin_type)
+
+    def spikes(self, pos, surface, group):
+        """Create the spikes"""
+        return Spikes(pos, surface, group)
+
+    def tooth(self, pos, assets, group):
+        """Create a tooth"""
+        return Tooth(pos, assets, group)
+
+
+class EntityFactory:
+    """Creates the level's simple entities in the world, with sprite views of them"""
+    def __init__(self, world):
+        """Initialize the factory"""
+        self.world = world
+
+    def animated(self, pos, frames, group, pos_z=settings.LAYERS_DEPTH["main"]):
+        """Create an animated decoration"""
+        entity = self.world.create(*pos)
+        self.world.set_animation(entity, len(frames))
+        return EntitySprite(self.world, entity, [frames], group, pos_z)
+
+    def coin(self, pos, frames, group, coin_type):
+        """Create a coin, centered at the position"""
+        rect = frames[0].get_rect(center=pos)
+        entity = self.world.create(*rect.topleft)
+        self.world.set_animation(entity, len(frames))
+        self.world.set_collider(entity, *rect.size)
+
+        sprite = EntitySprite(self.world, entity, [frames], group)
+        sprite.coin_type = coin_type
+        return sprite
+
+    def spikes(self, pos, surface, group):
+        """Create the spikes"""
+        entity = self.world.create(*pos)
+        self.world.set_collider(entity, *surface.get_size(), 1)
+        return EntitySprite(self.world, entity, [[surface]], group, masks=True)
+
+    def tooth(self, pos, assets, group):
+        """Create a tooth, walking in a random direction, placed on the ground"""
+        frames = [assets["run_left"], assets["run_right"]]
+        rect = frames[0][0].get_rect(topleft=pos)
+        rect.bottom = rect.top + settings.TILE_SIZE
+
+        entity = self.world.create(*rect.topleft)
+        self.world.set_velocity(entity, choice((1, -1)) * 120, 0)
+        self.world.set_animation(entity, len(frames[0]), int(self.world.vx[entity] > 0))
+        self.world.set_collider(entity, *rect.size, 1)
+        return EntitySprite(self.world, entity, frames, group, masks=True)
+
+
+def benchmark(count=10000, frames=100):
+    """Compare updating a level of teeth and coins made of sprites and of entities, return milliseconds per frame"""
+    # Frames of the entities
+    tooth_assets = {"run_left": [pygame.Surface((51, 46))] * 6, "run_right": [pygame.Surface((51, 46))] * 6}
+    coin_frames = [pygame.Surface((30, 30))] * 4
+    # Floor of the teeth
+    floor = pygame.sprite.Group(GenericSprite((x * settings.TILE_SIZE, settings.TILE_SIZE),
+                                              pygame.Surface((settings.TILE_SIZE, settings.TILE_SIZE)), [])
+                                for x in range(100))
+
+    results = {}
+    world = World()
+    for name, factory in (("sprites", SpriteFactory()), ("entities", EntityFactory(world))):
+        # Create the level, half of it teeth, half of it coins
+        group = pygame.sprite.Group()
+        teeth = [factory.tooth(((index * 7) % 6000, 0), tooth_assets, group) for index in range(count // 2)]
+        for index in range(count - count // 2):
+            factory.coin(((index * 13) % 6000, -100), coin_frames, group, "gold")
+        set_patrols(teeth, floor)
+
+        # Update it
+        start = time.perf_counter()
+        for frame in range(frames):
+            group.update(1 / 60)
+            world.update(1 / 60)
+        results[name] = (time.perf_counter() - start) / frames * 1000
+
+    return results
@@ -1,19 +1,28 @@
+import math
 import os.path
 import sys
-from random import choice, randint
+from random import randint
 
+import numpy
 import pygame
 from pygame.math import Vector2 as vector
-from pygame.mouse import get_pressed as mouse_pressed
-from pygame.mouse import get_pos as mouse_pos
 from pygame.image import load
 
 from src.settings import settings
 from src.menu import Menu
-from src.map_tile  import MapTile
+from src.input_state import InputState
+from src.tile_store import TileStore
+from src.autotile import TerrainTable
 from src.utilities import utilities
 from src.map_object import MapObject
-from src.timer import Timer
+from src.spatial_group import SpatialGroup
+from src.cloud_field import CloudField
+from src.timer import Timer, scheduler
+from src import level_file
+from src.autosave import Autosave
+from src.playlist import next_pack_path
+from src.quality import governor
+from src.profiling import profiler
 
 
 class Editor:
@@ -33,20 +42,26 @@ class Editor:
         # Its offset
         self.pan_offset = vector()
 
-        # Surface of support lines
-        self.support_surface = pygame.Surface((settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT))
+        # Surface of support lines, one tile bigger than the window to scroll it with the origin
+        self.support_surface = pygame.Surface((settings.WINDOW_WIDTH + settings.TILE_SIZE,
+                                               settings.WINDOW_HEIGHT + settings.TILE_SIZE))
         # Set its color key as green
         self.support_surface.set_colorkey("green")
         # Set alpha of everything visible to 40
         self.support_surface.set_alpha(40)
+        # Draw the lines once
+        self._render_lines()
 
         # Object select index
         self.select_index = 2
 
-        # Map data
-        self.map_data = {}
-        # Object of the map (objects are off-grid tiles)
-        self.map_objects = pygame.sprite.Group()
+        # Map data, tiles stored in chunks
+        self.map_data = TileStore()
+        # Pre-rendered static tiles of the map chunks, forgotten when their cells change
+        self.chunk_surfaces = {}
+        self.map_data.listeners.append(self._invalidate_region)
+        # Object of the map (objects are off-grid tiles), indexed by their world position
+        self.map_objects = SpatialGroup()
 
         # Foreground objects
         self.foreground = pygame.sprite.Group()
@@ -55,14 +70,28 @@ class Editor:
 
         # Land tile surfaces
         self.land_tiles = land_tiles
+        # Land tile of every terrain neighbors mask
+        self.terrain_table = TerrainTable(land_tiles)
         # Import other assets
         self._import_assets()
 
-        # Last clicked cell
+        # Input of the current frame
+        self.input = InputState()
+
+        # Last cell painted and erased, while the button is held
         self.last_cell = None
+        self.last_removed_cell = None
 
         # Dragging objects flag
         self.drag_active = False
+        # Objects that are dragged
+        self.dragged_objects = []
+
+        # Region editing mode (fill, erase or copy) and the cell where it started
+        self.region_mode = None
+        self.region_start = None
+        # Copied cells, ready to be pasted
+        self.stamp = None
 
         # Create the menu
         self.menu = Menu()
@@ -74,13 +103,15 @@ class Editor:
         self.sky_handle = MapObject((settings.WINDOW_WIDTH / 2, settings.WINDOW_HEIGHT / 2),
                                     [self.sky_handle_surface], 1, self.origin,
                                     [self.map_objects, self.background])
-        # Active clouds
-        self.clouds = []
-        # Import cloud surfaces
-        self.cloud_surfaces = utilities.import_folder("../graphics/clouds")
-        # Initialize the cloud timer, set it to spawn a cloud every 4 seconds
-        self.cloud_timer = pygame.USEREVENT + 1
-        pygame.time.set_timer(self.cloud_timer, 4000)
+        # Active clouds, removed once they go beyond the visible surface
+        self.clouds = CloudField(utilities.import_folder("../graphics/clouds"), -450)
+        # Active flag (the clouds spawn only while the editor runs), call spawning the clouds, time of the
+        # animations since they were last updated and the quality tier
+        self.active = True
+        self.cloud_call = None
+        self.animation_time = 0
+        self.quality = None
+        self._set_quality(governor.tier)
 
         # Spawn some clouds at the beginning
         self._start_clouds()
@@ -88,38 +119,74 @@ class Editor:
         # Object adding timer
         self.object_timer = Timer(400)
 
+        # Save the edits in the background, restore the last autosaved map
+        self.autosave = Autosave(self.map_data, self._object_rows)
+        level = self.autosave.recover()
+        if level:
+            self._load_level_data(level)
+            self.autosave.forget_changes()
+
     def run(self, delta_time):
         """Run the level editor"""
-        # Run the event loop
-        self._get_events()
+        # Follow changes of the quality tier
+        if self.quality is not governor.tier:
+            self._set_quality(governor.tier)
 
-        # Run the animations
-        self._update_animations(delta_time)
-        # Update the map objects
-        self.map_objects.update(delta_time)
+        # Run the event loop
+        with profiler.probe("events"):
+            self._get_events()
 
-        # Update the object timer
-        self.object_timer.update()
+        with profiler.probe("update"):
+            # Run the animations
+            self._update_animations(delta_time)
+            # Update the map objects
+            profiler.update_sprites(self.map_objects, delta_time, self.origin, self.input.mouse_pos)
 
         # Update the surface
         self._update_surface(delta_time)
 
+    def pause(self):
+        """Stop spawning the clouds while a level runs instead of the editor"""
+        self.active = False
+        scheduler.cancel(self.cloud_call)
+        self.cloud_call = None
+
+    def resume(self):
+        """Spawn the clouds again once the editor runs"""
+        self.active = True
+        self._set_quality(self.quality)
+
     # Input
     def _get_events(self):
         """Get the editor's input events"""
+        # Gather the frame's events and sample the mouse once
+        self.input.collect()
+
         # Go through each event that happened
-        for event in pygame.event.get():
+        for event in self.input.events:
             # If user wants to quit, close the game
             if event.type == pygame.QUIT:
-                # Uninitialize pygame modules
+                # Uninitialize pygame modules (the autosave writes its last changes on the exit)
                 pygame.quit()
                 # Quit
                 sys.exit()
 
+            # Toggle the frame profiler or export its trace
+            profiler.handle_event(event)
+
             # Save the map when user clicks return (enter)
             if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
                 self.switch(self._create_grid())
 
+            # Save or load the map file with CTRL + S or CTRL + L, add the map to the level pack with CTRL + E
+            if event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL:
+                if event.key == pygame.K_s:
+                    self.save(self._level_path())
+                elif event.key == pygame.K_l and os.path.exists(self._level_path()):
+                    self.load(self._level_path())
+                elif event.key == pygame.K_e:
+                    self.export(next_pack_path())
+
             # Check and handle panning inputs
             self._pan_input(event)
             # Check for select input
@@ -131,45 +198,43 @@ class Editor:
             # Handle object dragging
             self._drag_object(event)
 
-            # Handle clicks outside of menu
-            self._map_add()
-            self._map_remove()
+            # Handle editing of whole regions
+            self._region_input(event)
 
-            # Create the clouds
-            self._create_clouds(event)
+        # Handle the held buttons once per frame, not once per event
+        self._pan()
+        # Handle clicks outside of menu
+        self._map_add()
+        self._map_remove()
 
     def _pan_input(self, event):
         """Get panning input"""
         # If middle button is pressed, activate panning
-        if event.type == pygame.MOUSEBUTTONDOWN and mouse_pressed()[1]:
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 2:
             self.pan = True
             # Calculate the offset between mouse and the origin point
-            self.pan_offset = vector(mouse_pos()) - self.origin
-
-        # If middle button is released set panning to false
-        if not mouse_pressed()[1]:
-            self.pan = False
+            self.pan_offset = vector(self.input.mouse_pos) - self.origin
 
         # If event is mouse wheel scroll
         if event.type == pygame.MOUSEWHEEL:
             # If user is holding left control, move the Y-Axis of the map by scrolling
-            if pygame.key.get_pressed()[pygame.K_LCTRL]:
+            if self.input.mods & pygame.KMOD_LCTRL:
                 self.origin.y -= event.y * 50
             # Otherwise move the X-Axis of the map
             else:
                 # Scroll the map with it
                 self.origin.x -= event.y * 50
-            # Fix the objects position
-            for obj in self.map_objects:
-                obj.update_pos(self.origin)
 
-        # If user is panning, move the origin to the same direction but with offset
-        if self.pan:
-            self.origin = vector(mouse_pos()) - self.pan_offset
+    def _pan(self):
+        """Move the map while panning"""
+        # If middle button is released set panning to false
+        if not self.input.held(2):
+            self.pan = False
 
-            # Update the objects
-            for obj in self.map_objects.sprites():
-                obj.update_pos(self.origin)
+        # If user is panning, move the origin to the same direction but with offset (objects stay in the world,
+        # only the camera moves)
+        if self.pan:
+            self.origin = vector(self.input.mouse_pos) - self.pan_offset
 
     def _select(self, event):
         """Select the items"""
@@ -190,15 +255,15 @@ class Editor:
     def _menu_click(self, event):
         """Handle menu clicks"""
         # If the user clicked the moused and the cursor is on the menu, handle the click
-        if event.type == pygame.MOUSEBUTTONDOWN and self.menu.rect.collidepoint(mouse_pos()):
-            new_index = self.menu.handle_click(mouse_pos(), mouse_pressed())
+        if event.type == pygame.MOUSEBUTTONDOWN and self.menu.rect.collidepoint(self.input.mouse_pos):
+            new_index = self.menu.handle_click(self.input.mouse_pos, [self.input.held(button) for button in (1, 2, 3)])
             # Save the selection index
             self.select_index = new_index if new_index else self.select_index
 
     def _get_current_cell(self, obj = None):
         """Get the current cell"""
         # Get the distance between the mouse position and the map origin
-        distance_origin = (vector(mouse_pos())
+        distance_origin = (vector(self.input.mouse_pos)
                            - self.origin) if not obj else vector(obj.origin_distance) - self.origin
 
         # If horizontal distance is higher than 0, just get its tile column
@@ -227,35 +292,40 @@ class Editor:
         self._display_sky(delta_time)
 
         # Draw the map
-        self._draw_map()
+        with profiler.probe("map"):
+            self._draw_map()
 
         # Draw the tile lines
-        self._draw_lines()
+        with profiler.probe("lines"):
+            self._draw_lines()
 
         # If user want's to put something, draw a preview
         self._show_preview()
+        # Show the edited region
+        self._show_region()
 
         # Display the menu
-        self.menu.display(self.select_index)
+        with profiler.probe("menu"):
+            self.menu.display(self.select_index)
 
     def _display_sky(self, delta_time):
         """Draw the sky based off sky handle position"""
         # Draw the sky
         self.surface.fill(settings.COLORS["SKY"])
 
-        # Get center of the sky handle
-        pos_y = self.sky_handle.rect.centery
+        # Get center of the sky handle on the screen
+        pos_y = self.sky_handle.rect.centery + int(self.origin.y)
 
         # If horizon is visible on the screen, draw it
         if pos_y > 0:
-            # Horizon lines
-            horizon_rect_1 = pygame.Rect(0, pos_y - 2, settings.WINDOW_WIDTH, 10)
-            horizon_rect_2 = pygame.Rect(0, pos_y - 7, settings.WINDOW_WIDTH, 4)
-            horizon_rect_3 = pygame.Rect(0, pos_y - 10, settings.WINDOW_WIDTH, 2)
-            # Draw the horizon lines
-            pygame.draw.rect(self.surface, settings.COLORS["HORIZON_TOP"], horizon_rect_1)
-            pygame.draw.rect(self.surface, settings.COLORS["HORIZON_TOP"], horizon_rect_2)
-            pygame.draw.rect(self.surface, settings.COLORS["HORIZON_TOP"], horizon_rect_3)
+            # Draw the horizon lines, if the quality allows them
+            if self.quality["horizon"]:
+                horizon_rect_1 = pygame.Rect(0, pos_y - 2, settings.WINDOW_WIDTH, 10)
+                horizon_rect_2 = pygame.Rect(0, pos_y - 7, settings.WINDOW_WIDTH, 4)
+                horizon_rect_3 = pygame.Rect(0, pos_y - 10, settings.WINDOW_WIDTH, 2)
+                pygame.draw.rect(self.surface, settings.COLORS["HORIZON_TOP"], horizon_rect_1)
+                pygame.draw.rect(self.surface, settings.COLORS["HORIZON_TOP"], horizon_rect_2)
+                pygame.draw.rect(self.surface, settings.COLORS["HORIZON_TOP"], horizon_rect_3)
 
             # Draw the clouds, only if sky is visible
             self._display_clouds(delta_time, pos_y)
@@ -267,8 +337,9 @@ class Editor:
             # Draw it
             pygame.draw.rect(self.surface, settings.COLORS["SEA"], sea_rect)
             # Draw another horizon line for a nice look
-            pygame.draw.line(self.surface, settings.COLORS["HORIZON"],
-                             (0, pos_y), (settings.WINDOW_WIDTH, pos_y), 3)
+            if self.quality["horizon"]:
+                pygame.draw.line(self.surface, settings.COLORS["HORIZON"],
+                                 (0, pos_y), (settings.WINDOW_WIDTH, pos_y), 3)
 
         # Otherwise just fill the entire screen with sea color, the horizon isn't visible anyway
         if pos_y < 0:
@@ -276,129 +347,177 @@ class Editor:
 
     def _display_clouds(self, delta_time, pos_y):
         """Display the clouds"""
-        # Go through every active cloud
-        for cloud in self.clouds:
-            # Move it based off the speed
-            cloud["pos"][0] -= cloud["speed"] * delta_time
-
-            # Calculate its position, to make them move with horizon
-            cloud_x = cloud["pos"][0]
-            cloud_y = pos_y - cloud["pos"][1]
-
-            # Blit it
-            self.surface.blit(cloud["surface"], (cloud_x, cloud_y))
+        # Move every active cloud based off its speed
+        self.clouds.step(delta_time)
+        # Blit them, their heights are stored above the horizon to make them move with it
+        self.clouds.draw(self.surface, (0, -pos_y))
 
     def _draw_lines(self):
         """Draw the tile lines"""
-        # Calculate the amount of columns and rows
-        columns = settings.WINDOW_WIDTH // settings.TILE_SIZE
-        rows = settings.WINDOW_HEIGHT // settings.TILE_SIZE
+        # The lines repeat every tile, so only scroll them by the origin inside of one tile
+        self.surface.blit(self.support_surface, (self.origin.x % settings.TILE_SIZE - settings.TILE_SIZE,
+                                                 self.origin.y % settings.TILE_SIZE - settings.TILE_SIZE))
 
+    def _render_lines(self):
+        """Draw the tile lines onto the support surface"""
         # Make the surface green to help with transparency
         self.support_surface.fill("green")
-
-        # Offset to keep the lines in screen
-        origin_offset = vector(self.origin.x - int(self.origin.x / settings.TILE_SIZE) * settings.TILE_SIZE,
-                               self.origin.y - int(self.origin.y / settings.TILE_SIZE) * settings.TILE_SIZE)
+        width, height = self.support_surface.get_size()
 
         # Go through each column (added one because one column on the right doesn't get drawn)
-        for col in range(columns + 1):
-            # Calculate the vertical position by the tile size and offset them by column number from origin
-            pos_x = origin_offset.x + col * settings.TILE_SIZE
+        for col in range(width // settings.TILE_SIZE + 1):
+            # Calculate the vertical position by the tile size
+            pos_x = col * settings.TILE_SIZE
             # Draw the column line
-            pygame.draw.line(self.support_surface, settings.COLORS["LINE"],
-                             (pos_x, 0), (pos_x, settings.WINDOW_HEIGHT))
+            pygame.draw.line(self.support_surface, settings.COLORS["LINE"], (pos_x, 0), (pos_x, height))
         # Go through each row
-        for row in range(rows + 1):
+        for row in range(height // settings.TILE_SIZE + 1):
             # Calculate the horizontal position
-            pos_y = origin_offset.y + row * settings.TILE_SIZE
+            pos_y = row * settings.TILE_SIZE
             # Draw the row line
-            pygame.draw.line(self.support_surface, settings.COLORS["LINE"],
-                             (0, pos_y), (settings.WINDOW_WIDTH, pos_y))
-
-        # Blit the support lines onto the main surface
-        self.surface.blit(self.support_surface, (0, 0))
+            pygame.draw.line(self.support_surface, settings.COLORS["LINE"], (0, pos_y), (width, pos_y))
 
     def _draw_map(self):
-        """Draw the map"""
-        # Draw the background objects
-        self.background.draw(self.surface)
-
-        # Go through each tile placed
-        for cell_pos, tile in self.map_data.items():
-            # Get its position in pixels
-            pos = self.origin + vector(cell_pos) * settings.TILE_SIZE
+        """Draw the visible part of the map"""
+        # Get the camera offset and the visible cells once
+        offset_x, offset_y = self._camera_offset()
+        left, top, right, bottom = self._visible_cells()
+        # Get the objects on the screen
+        visible_objects = self._visible_objects()
 
-            # If tile has water
-            if tile.water:
-                if tile.water_on_top:
-                    self.surface.blit(self.water_bottom, pos)
-                else:
-                    # Get animation frames of the water (that has ID equal to 3)
-                    frames = self.animations[3]["frames"]
-                    # Grab the current frame as int
-                    frame = int(self.animations[3]["frame"])
-                    # Blit the frame
-                    self.surface.blit(frames[frame], pos)
-
-            # If it has terrain
-            if tile.terrain:
-                # Convert the terrain to a string
-                terrain_string = ''.join(tile.neighbor_terrain)
-                # Take the style based off the neighbors, if it doesn't exist just set it to 'X'
-                terrain_style = terrain_string if terrain_string in self.land_tiles else 'X'
-                self.surface.blit(self.land_tiles[terrain_style], pos)
-
-            # If it has a coin
-            if tile.coin:
-                # Take the frames of coin with certain ID
-                frames = self.animations[tile.coin]["frames"]
-                # Get the frame
-                frame = int(self.animations[tile.coin]["frame"])
-                # Center the coin in the tile
-                rect = frames[frame].get_rect(center=(pos[0] + settings.TILE_SIZE // 2,
-                                                      pos[1] + settings.TILE_SIZE // 2))
-                # Blit it
-                self.surface.blit(frames[frame], rect)
-
-            # Otherwise if it has an enemy
-            if tile.enemy:
-                # Take the enemy's frames
-                frames = self.animations[tile.enemy]["frames"]
-                # Get current frame
-                frame = int(self.animations[tile.enemy]["frame"])
-                # Place it on the middle bottom of a tile
-                rect = frames[frame].get_rect(midbottom=(pos[0] + settings.TILE_SIZE // 2,
-                                                         pos[1] + settings.TILE_SIZE))
-                # Blit the enemy
-                self.surface.blit(frames[frame], rect)
+        # Draw the background objects
+        self._draw_objects(self.background, visible_objects)
+
+        # Read the animated layers of the visible cells
+        width = right - left + 1
+        height = bottom - top + 1
+        water = self.map_data.read("water", left, top, width, height)
+        water_top = self.map_data.read("water_top", left, top, width, height)
+        coins = self.map_data.read("coin", left, top, width, height)
+        enemies = self.map_data.read("enemy", left, top, width, height)
+
+        # Get animation frames of the water (that has ID equal to 3) and grab the current frame
+        water_frame = self.animations[3]["frames"][int(self.animations[3]["frame"])]
+        # Draw the animated water, the one without water above it
+        rows, columns = numpy.nonzero(water & (water_top == 0))
+        self.surface.blits([(water_frame, (offset_x + (left + column) * settings.TILE_SIZE,
+                                           offset_y + (top + row) * settings.TILE_SIZE))
+                            for row, column in zip(rows.tolist(), columns.tolist())], False)
+
+        # Draw the static tiles, pre-rendered in chunks
+        size = settings.RENDER_CHUNK_SIZE
+        chunk_pixels = size * settings.TILE_SIZE
+        for chunk_y in range(top // size, bottom // size + 1):
+            for chunk_x in range(left // size, right // size + 1):
+                surface = self._chunk_surface((chunk_x, chunk_y))
+                if surface is not None:
+                    self.surface.blit(surface, (offset_x + chunk_x * chunk_pixels, offset_y + chunk_y * chunk_pixels))
+
+        # Draw the coins
+        for row, column in zip(*numpy.nonzero(coins)):
+            tile_id = int(coins[row, column])
+            # Take the current frame of coin with its ID
+            frame = self.animations[tile_id]["frames"][int(self.animations[tile_id]["frame"])]
+            # Center the coin in the tile
+            rect = frame.get_rect(center=(offset_x + (left + column) * settings.TILE_SIZE + settings.TILE_SIZE // 2,
+                                          offset_y + (top + row) * settings.TILE_SIZE + settings.TILE_SIZE // 2))
+            self.surface.blit(frame, rect)
+
+        # Draw the enemies
+        for row, column in zip(*numpy.nonzero(enemies)):
+            tile_id = int(enemies[row, column])
+            # Take the enemy's current frame
+            frame = self.animations[tile_id]["frames"][int(self.animations[tile_id]["frame"])]
+            # Place it on the middle bottom of a tile
+            rect = frame.get_rect(midbottom=(offset_x + (left + column) * settings.TILE_SIZE + settings.TILE_SIZE // 2,
+                                             offset_y + (top + row + 1) * settings.TILE_SIZE))
+            self.surface.blit(frame, rect)
 
         # Draw the foreground objects
-        self.foreground.draw(self.surface)
+        self._draw_objects(self.foreground, visible_objects)
+
+        # Forget the chunks out of the screen if too many got cached
+        if len(self.chunk_surfaces) > settings.RENDER_CACHE_LIMIT:
+            self.chunk_surfaces = {chunk_pos: surface for chunk_pos, surface in self.chunk_surfaces.items()
+                                   if left // size <= chunk_pos[0] <= right // size
+                                   and top // size <= chunk_pos[1] <= bottom // size}
+
+    def _chunk_surface(self, chunk_pos):
+        """Get the pre-rendered surface of the chunk, render it if it isn't cached"""
+        if chunk_pos not in self.chunk_surfaces:
+            self.chunk_surfaces[chunk_pos] = self._render_chunk(chunk_pos)
+        return self.chunk_surfaces[chunk_pos]
+
+    def _render_chunk(self, chunk_pos):
+        """Render the static tiles (terrain and bottom water) of the chunk, None if it has none"""
+        size = settings.RENDER_CHUNK_SIZE
+        left, top = chunk_pos[0] * size, chunk_pos[1] * size
+
+        # Read the static layers
+        terrain = self.map_data.read("terrain", left, top, size, size)
+        masks = self.map_data.read("mask", left, top, size, size)
+        # Water with water above it doesn't animate
+        water_bottom = self.map_data.read("water", left, top, size, size) & self.map_data.read(
+            "water_top", left, top, size, size)
+        if not terrain.any() and not water_bottom.any():
+            return None
+
+        surface = pygame.Surface((size * settings.TILE_SIZE, size * settings.TILE_SIZE), pygame.SRCALPHA)
+        # Draw the water under the terrain
+        rows, columns = numpy.nonzero(water_bottom)
+        surface.blits([(self.water_bottom, (column * settings.TILE_SIZE, row * settings.TILE_SIZE))
+                       for row, column in zip(rows.tolist(), columns.tolist())], False)
+        # Draw the terrain, take the tile based off the neighbors mask
+        rows, columns = numpy.nonzero(terrain)
+        surface.blits([(self.terrain_table.surfaces[masks[row, column]],
+                        (column * settings.TILE_SIZE, row * settings.TILE_SIZE))
+                       for row, column in zip(rows.tolist(), columns.tolist())], False)
+        return surface
+
+    def _invalidate_region(self, left, top, right, bottom):
+        """Forget the pre-rendered chunks of the changed cells"""
+        size = settings.RENDER_CHUNK_SIZE
+        for chunk_y in range(top // size, bottom // size + 1):
+            for chunk_x in range(left // size, right // size + 1):
+                self.chunk_surfaces.pop((chunk_x, chunk_y), None)
+
+    def _visible_objects(self):
+        """Get the objects on the screen, in order of adding them"""
+        # Query the objects in the visible part of the world
+        objects = self.map_objects.query_rect(pygame.Rect(-self.origin, (settings.WINDOW_WIDTH,
+                                                                         settings.WINDOW_HEIGHT)))
+        # Dragged objects aren't at their indexed position
+        return objects + [obj for obj in self.dragged_objects if obj not in objects]
+
+    def _draw_objects(self, group, objects):
+        """Draw the visible objects of the group, moved from the world onto the screen"""
+        offset = self._camera_offset()
+        self.surface.blits([(obj.image, obj.rect.move(offset)) for obj in objects if obj in group], False)
+
+    def _camera_offset(self):
+        """Get the offset between the world and the screen"""
+        return int(self.origin.x), int(self.origin.y)
 
     def _map_add(self):
         """Add the item to the map"""
         # If user pressed the left mouse button but didn't click on the menu and isn't dragging any object
-        if (mouse_pressed()[0]) and (not self.menu.rect.collidepoint(mouse_pos())) and (not self.drag_active):
-            # Get the current clicked cell
-            current_cell = self._get_current_cell()
-
+        # (or editing a region)
+        if (self.input.held(1) and (not self.menu.rect.collidepoint(self.input.mouse_pos))
+                and (not self.drag_active) and not self._region_editing()):
             # Check if user is placing a tile
             if settings.EDITOR_INFO[self.select_index]["type"] == "tile":
+                # Get the cells that the mouse went through since the last frame, skip the one painted already
+                cells = [cell for cell in self._stroke_cells(self.last_cell) if cell != self.last_cell]
                 # If user didn't click on the same cell twice
-                if current_cell != self.last_cell:
-                    # If there is something already, change the cell to the current ID
-                    if current_cell in self.map_data:
-                        self.map_data[current_cell].add_id(self.select_index)
+                if cells:
+                    # Add the current ID into every cell
+                    for cell in cells:
+                        self.map_data.add(cell, self.select_index)
 
-                    # Otherwise add new cell to the map data
-                    else:
-                        self.map_data[current_cell] = MapTile(self.select_index)
-
-                    self._check_neighbor_cells(current_cell)
+                    self._check_neighbor_cells(cells)
 
                     # Save the current cell, as the last one
-                    self.last_cell = current_cell
+                    self.last_cell = cells[-1]
 
             # Otherwise he's placing an object
             else:
@@ -413,15 +532,21 @@ class Editor:
                     else:
                         group.append(self.foreground)
 
-                    MapObject(mouse_pos(), self.animations[self.select_index]["frames"], self.select_index,
-                              self.origin, group)
+                    MapObject(self.input.mouse_pos, self.animations[self.select_index]["frames"],
+                              self.select_index, self.origin, group)
+                    self.autosave.mark_objects()
                     # Activate the cooldown
                     self.object_timer.start()
 
+        # Start a new stroke after the button is released
+        if not self.input.held(1):
+            self.last_cell = None
+
     def _map_remove(self):
         """Remove tile or an object from the map"""
-        # Check if user right-clicked on a tile and not on the menu
-        if mouse_pressed()[2] and not self.menu.rect.collidepoint(mouse_pos()):
+        # Check if user right-clicked on a tile and not on the menu (and isn't editing a region)
+        if (self.input.held(3) and not self.menu.rect.collidepoint(self.input.mouse_pos)
+                and not self._region_editing()):
             # Save the object that user points to
             selected_object = self._object_pointed()
             # Check if there was any
@@ -429,56 +554,105 @@ class Editor:
                 # If the object wasn't the player or sky handler, delete it
                 if settings.EDITOR_INFO[selected_object.tile_id]["style"] not in ("sky", "player"):
                     selected_object.kill()
+                    self.autosave.mark_objects()
 
             # If there is any data in map, prepare to delete the object
             if self.map_data:
-                # Get the current cell and check if it exists in map data
-                current_cell = self._get_current_cell()
-                if current_cell in self.map_data:
-                    # Remove it
-                    self.map_data[current_cell].remove_id(self.select_index)
-
-                    # If the current cell is empty now, remove it from the map
-                    if self.map_data[current_cell].empty:
-                        del self.map_data[current_cell]
+                # Get the cells that the mouse went through and exist in map data
+                cells = [cell for cell in self._stroke_cells(self.last_removed_cell)
+                         if cell != self.last_removed_cell and cell in self.map_data]
+                if cells:
+                    # Remove them (the cell gets removed from the map if it's empty now)
+                    for cell in cells:
+                        self.map_data.remove(cell, self.select_index)
                     # Fix the tiling
-                    self._check_neighbor_cells(current_cell)
+                    self._check_neighbor_cells(cells)
+                # Save the current cell, as the last one
+                self.last_removed_cell = self._get_current_cell()
+
+        # Start a new stroke after the button is released
+        if not self.input.held(3):
+            self.last_removed_cell = None
+
+    def _stroke_cells(self, last_cell):
+        """Get the cells between the last cell of the stroke and the current one"""
+        current_cell = self._get_current_cell()
+        # If the stroke has just started, there is only the current cell
+        if last_cell is None:
+            return [current_cell]
+        # Otherwise fill the gaps, when the mouse moved more than one cell in a frame
+        return utilities.line_cells(last_cell, current_cell)
+
+    def _region_input(self, event):
+        """Handle region editing: rectangle fill, erase, copy, flood fill and paste"""
+        # Get the pressed modifier keys
+        mods = self.input.mods
+
+        # Start the region on a click outside of menu
+        if event.type == pygame.MOUSEBUTTONDOWN and not self.menu.rect.collidepoint(self.input.mouse_pos):
+            # SHIFT + left click fills the rectangle, SHIFT + right click erases it
+            if mods & pygame.KMOD_SHIFT and event.button in (1, 3):
+                self.region_mode = "fill" if event.button == 1 else "erase"
+            # ALT + left click copies the rectangle
+            elif mods & pygame.KMOD_ALT and event.button == 1:
+                self.region_mode = "copy"
+            # CTRL + left click flood fills the visible area
+            elif mods & pygame.KMOD_CTRL and event.button == 1:
+                self.map_data.flood_fill(self._get_current_cell(), self.select_index, *self._visible_cells())
+
+            # Save the start of the region
+            if self.region_mode:
+                self.region_start = self._get_current_cell()
+
+        # Apply the region when the mouse is released
+        if event.type == pygame.MOUSEBUTTONUP and self.region_mode:
+            left, top, right, bottom = self._region_rect()
+            if self.region_mode == "fill":
+                self.map_data.fill_rect(left, top, right, bottom, self.select_index)
+            elif self.region_mode == "erase":
+                self.map_data.erase_rect(left, top, right, bottom, self.select_index)
+            else:
+                self.stamp = self.map_data.copy_rect(left, top, right, bottom)
+            self.region_mode = None
+
+        # CTRL + V pastes the copied cells at the mouse
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_v and mods & pygame.KMOD_CTRL and self.stamp:
+            self.map_data.paste(self.stamp, *self._get_current_cell())
+
+    def _region_editing(self):
+        """Check if user is editing a region instead of single cells"""
+        return bool(self.region_mode
+                    or self.input.mods & (pygame.KMOD_SHIFT | pygame.KMOD_ALT | pygame.KMOD_CTRL))
+
+    def _region_rect(self):
+        """Get the edited region's left, top, right and bottom cells"""
+        current_cell = self._get_current_cell()
+        return (min(self.region_start[0], current_cell[0]), min(self.region_start[1], current_cell[1]),
+                max(self.region_start[0], current_cell[0]), max(self.region_start[1], current_cell[1]))
+
+    def _visible_cells(self):
+        """Get the left, top, right and bottom cells visible on the screen"""
+        return (math.floor(-self.origin.x / settings.TILE_SIZE),
+                math.floor(-self.origin.y / settings.TILE_SIZE),
+                math.floor((settings.WINDOW_WIDTH - self.origin.x) / settings.TILE_SIZE),
+                math.floor((settings.WINDOW_HEIGHT - self.origin.y) / settings.TILE_SIZE))
 
     def _create_grid(self):
         """Create the map grid"""
-        # Clear the tile objects
-        for tile in self.map_data.values():
-            tile.objects = []
-
-        # Go through each of the objects that exist on the map
-        for obj in self.map_objects:
-            # Get the current cell
-            current_cell = self._get_current_cell()
-            # Get object's offset in comparison to the cell
-            offset = vector(obj.origin_distance) - (vector(current_cell) * settings.TILE_SIZE)
-
-            # If the cell has a tile
-            if current_cell in self.map_data:
-                self.map_data[current_cell].add_id(obj.tile_id, offset)
-            # Otherwise create one
-            else:
-                self.map_data[current_cell] = MapTile(obj.tile_id, offset)
+        # Get the cells of the objects, based off their distance to the origin
+        object_cells = [(int(obj.origin_distance.x // settings.TILE_SIZE),
+                         int(obj.origin_distance.y // settings.TILE_SIZE)) for obj in self.map_objects]
+        # All the used cells
+        cells = self.map_data.cells() + object_cells
 
         # Calculate the grid offset
-        # Get the first tile, which is the left one, get the X-Axis value from it (tiles sorted by X value)
-        left = sorted(self.map_data.keys(), key=lambda tile: tile[0])[0][0]
-        # Get the first top tile Y-Axis position, sorted by Y value
-        top = sorted(self.map_data.keys(), key=lambda tile: tile[1])[0][1]
+        # Get the left-most tile, take its X-Axis value
+        left = min(cell[0] for cell in cells)
+        # Get the top tile Y-Axis position
+        top = min(cell[1] for cell in cells)
 
         # Grid layers (ordered by the Z-value, ascending)
-        layers = {
-            "water": {},
-            "bg palms": {},
-            "terrain": {},
-            "enemies": {},
-            "coins": {},
-            "fg objects": {}
-        }
+        layers = level_file.empty_grid()
 
         # Go through every map item
         for pos, tile in self.map_data.items():
@@ -494,14 +668,9 @@ class Editor:
             if tile.water:
                 layers["water"][(pos_x, pos_y)] = tile.get_water_type()
 
-            # If tile has terrain
+            # If tile has terrain, get it with its neighbors
             if tile.terrain:
-                # If is in the land tiles, get it with its neighbors
-                if tile.get_terrain() in self.land_tiles:
-                    layers["terrain"][(pos_x, pos_y)] = tile.get_terrain()
-                # Otherwise just set it to default type
-                else:
-                    layers["terrain"][(pos_x, pos_y)] = 'X'
+                layers["terrain"][(pos_x, pos_y)] = self.terrain_table.names[tile.mask]
 
             # If tile is a coin just set the tile as a coin (center its position)
             if tile.coin:
@@ -511,123 +680,167 @@ class Editor:
             if tile.enemy:
                 layers["enemies"][(pos_x, pos_y)] = tile.enemy
 
-            # If tile has objects
-            if tile.objects:
-                # Go through each of the object, while taking its offset
-                for obj, offset in tile.objects:
-                    # If object is a palm background, save it as it
-                    if obj in [item_id for item_id, item in settings.EDITOR_INFO.items()
-                               if item["style"] == "palm_bg"]:
-                        layers["bg palms"][(int(pos_x + offset.x), int(pos_y + offset.y))] = obj
-                    # Otherwise save it as palm foreground
-                    else:
-                        layers["fg objects"][(int(pos_x + offset.x), int(pos_y + offset.y))] = obj
+        # Go through each of the objects, place them relative to the grid offset
+        for obj in self.map_objects:
+            pos = (int(obj.origin_distance.x - left * settings.TILE_SIZE),
+                   int(obj.origin_distance.y - top * settings.TILE_SIZE))
+            # If object is a palm background, save it as it
+            if settings.EDITOR_INFO[obj.tile_id]["style"] == "palm_bg":
+                layers["bg palms"][pos] = obj.tile_id
+            # Otherwise save it as palm foreground
+            else:
+                layers["fg objects"][pos] = obj.tile_id
 
         return layers
 
-    def _create_clouds(self, event):
-        """Create the clouds"""
-        # If cloud cooldown passed
-        if event.type == self.cloud_timer:
-            # Choose a random cloud
-            cloud_surface = choice(self.cloud_surfaces)
-            # Make some of the clouds two times bigger
-            if randint(0, 4) < 2:
-                cloud_surface = pygame.transform.scale2x(cloud_surface)
+    def save(self, path):
+        """Save the map into a level file"""
+        level_file.save_level(path, self._create_level_data())
 
-            # Choose a random speed
-            speed = randint(20, 40)
-            # Choose a random position of the cloud, make them appear from the right side of the screen
-            pos = [randint(50, 100) + settings.WINDOW_WIDTH, randint(0, settings.WINDOW_HEIGHT)]
+    def load(self, path):
+        """Load the map from a level file"""
+        self._load_level_data(level_file.load_level(path))
 
-            # Add it to the active clouds
-            self.clouds.append({"surface": cloud_surface, "pos": pos, "speed": speed})
+    def export(self, path):
+        """Save the level grid of the map into a level file, which can be played without the editor"""
+        level_file.save_grid(path, self._create_grid())
 
-            # Remove the old clouds, that went beyond the visible surface
-            self.clouds = [cloud for cloud in self.clouds if cloud["pos"][0] > -450]
+    def _level_path(self):
+        """Get path of the editor's level file"""
+        return os.path.join(settings.BASE_PATH, settings.LEVELS_PATH,
+                            settings.LEVEL_FILE + settings.LEVEL_EXTENSION)
 
-    def _start_clouds(self):
-        """Make the clouds appear at the start"""
-        # Create 15 clouds at the start
-        for cloud_num in range(15):
-            # Create a cloud with random image, size
-            cloud = (pygame.transform.scale2x(choice(self.cloud_surfaces))
-                     if randint(0, 4) < 2
-                     else choice(self.cloud_surfaces))
-            # Choose a random position in the visible part of screen
-            cloud_pos = [randint(0, settings.WINDOW_WIDTH), randint(0, settings.WINDOW_HEIGHT)]
-            # Generate a random speed
-            speed = randint(20, 40)
+    def _create_level_data(self):
+        """Create the level data of the map"""
+        level = level_file.LevelData("map")
 
-            # Create the cloud, add it to the current ones
-            self.clouds.append({"surface": cloud, "pos": cloud_pos, "speed": speed})
+        # Save every layer of the tiles
+        for cell, tile in self.map_data.items():
+            if tile.terrain:
+                level.set("terrain", cell, level_file.TERRAIN_FLAG)
+            if tile.water:
+                level.set("water", cell, level_file.WATER_TYPES[tile.get_water_type()])
+            if tile.coin:
+                level.set("coins", cell, tile.coin)
+            if tile.enemy:
+                level.set("enemies", cell, tile.enemy)
+
+        # Save the objects with their distance to the origin
+        level.set_objects(self._object_rows())
+        return level
+
+    def _object_rows(self):
+        """Get X and Y distance to the origin and the tile ID of every object"""
+        return [(int(obj.origin_distance.x), int(obj.origin_distance.y), obj.tile_id) for obj in self.map_objects]
+
+    def _load_level_data(self, level):
+        """Replace the map with the one from level data"""
+        # Clear the current map
+        self.map_data.clear()
+        # Create the tiles from every layer
+        for name in ("terrain", "water", "coins", "enemies"):
+            for cell, value in level.cells(name):
+                # Terrain and water are saved as flags, use their IDs instead
+                self.map_data.add(cell, {"terrain": 2, "water": 3}.get(name, value))
+        # Fix the tiling of every cell at once
+        self.map_data.update_all()
+
+        # Remove every object, except the player and the sky handle
+        for obj in self.map_objects:
+            if settings.EDITOR_INFO[obj.tile_id]["style"] not in ("sky", "player"):
+                obj.kill()
+
+        # Create the saved objects
+        for pos_x, pos_y, tile_id in level.objects.tolist():
+            # Move the player and the sky handle, they always exist
+            existing = [obj for obj in self.map_objects if obj.tile_id == tile_id
+                        and settings.EDITOR_INFO[tile_id]["style"] in ("sky", "player")]
+            if existing:
+                obj = existing[0]
+            # Create a new object in its group
+            else:
+                group = [self.map_objects,
+                         self.background if settings.EDITOR_INFO[tile_id]["style"] == "palm_bg"
+                         else self.foreground]
+                obj = MapObject((0, 0), self.animations[tile_id]["frames"], tile_id, self.origin, group)
+
+            # Place it at the saved distance from origin
+            obj.place((pos_x, pos_y))
+            self.map_objects.reindex(obj)
+
+        # Autosave the new objects
+        self.autosave.mark_objects()
+
+    def _set_quality(self, tier):
+        """Apply the quality tier"""
+        self.quality = tier
+        # Limit the clouds, the ones above the limit fly away on their own
+        self.clouds.limit = tier["clouds"]
+
+        # Spawn the clouds as often as the tier allows, if the editor runs
+        scheduler.cancel(self.cloud_call)
+        self.cloud_call = None
+        if self.active:
+            self.cloud_call = scheduler.schedule(tier["cloud_interval"], self._create_cloud, repeat=True)
+
+    def _create_cloud(self):
+        """Create a cloud"""
+        # Choose a random position of the cloud, make them appear from the right side of the screen, choose a
+        # random speed and a random cloud (make some of them two times bigger)
+        self.clouds.add(randint(50, 100) + settings.WINDOW_WIDTH, -randint(0, settings.WINDOW_HEIGHT),
+                        randint(20, 40), self.clouds.random_surfaces(1, 0.4))
 
+    def _start_clouds(self):
+        """Make the clouds appear at the start"""
+        # Create 15 clouds at the start, in random positions in the visible part of screen
+        count = 15
+        self.clouds.add(numpy.random.randint(0, settings.WINDOW_WIDTH + 1, count),
+                        -numpy.random.randint(0, settings.WINDOW_HEIGHT + 1, count),
+                        numpy.random.randint(20, 41, count), self.clouds.random_surfaces(count, 0.4))
 
     def _drag_object(self, event):
         """Handle object dragging"""
         # If user is clicking the left mouse button
-        if event.type == pygame.MOUSEBUTTONDOWN and mouse_pressed()[0]:
-            # Go through each object
-            for obj in self.map_objects:
-                # If it collides with the place, where the user clicked, prepare the dragging action
-                if obj.rect.collidepoint(event.pos):
-                    obj.prepare_drag()
-                    # Set the dragging active flag to True
-                    self.drag_active = True
+        if event.type == pygame.MOUSEBUTTONDOWN and self.input.held(1):
+            # Go through each object near the click
+            for obj in self._objects_at(event.pos):
+                # Prepare the dragging action
+                obj.prepare_drag(self.origin, self.input.mouse_pos)
+                self.dragged_objects.append(obj)
+                # Set the dragging active flag to True
+                self.drag_active = True
 
         # If user is done dragging
         if event.type == pygame.MOUSEBUTTONUP and self.drag_active:
-            # Go through every object
-            for obj in self.map_objects:
-                # Stop dragging it and reset the flag
-                obj.end_drag(self.origin)
-                self.drag_active = False
-
-    def _check_neighbor_cells(self, pos):
-        """Check the neighbor cells of the given cell position"""
-        # Amount of the neighbor cells
-        local_size = 3
-        # Local tiles positions in map cell coordinates
-        local_tiles = [(pos[0] + column - int(local_size / 2), pos[1] + row - int(local_size / 2))
-                       for column in range(local_size)
-                       for row in range(local_size)]
-
-        # Go through each cell in the local area of the given cell positions
-        for cell in local_tiles:
-            # If cell exists
-            if cell in self.map_data:
-                # Prepare the neighbor list
-                self.map_data[cell].neighbor_terrain = []
-                self.map_data[cell].water_on_top = False
-
-                # Go through each neighbor tile possible
-                for name, side in settings.NEIGHBOR_CELLS.items():
-                    # Take the neighbor cell position
-                    neighbor_cell = (cell[0] + side[0], cell[1] + side[1])
-
-                    # If neighbor cell exists
-                    if neighbor_cell in self.map_data:
-                        # If the neighbor exists, and it's water on top of the current cell
-                        if self.map_data[cell].water and self.map_data[neighbor_cell].water and name == 'A':
-                            # Set the water on top flag to True
-                            self.map_data[cell].water_on_top = True
-
-                    # If the neighbor exists and it's a terrain
-                    if neighbor_cell in self.map_data:
-                        # Add its name to the current cell neighbors
-                        self.map_data[cell].neighbor_terrain.append(name)
+            # Go through every dragged object
+            for obj in self.dragged_objects:
+                # Stop dragging it, update its place in the index
+                obj.end_drag()
+                self.map_objects.reindex(obj)
+            # Reset the flag
+            self.dragged_objects = []
+            self.drag_active = False
+            self.autosave.mark_objects()
+
+    def _check_neighbor_cells(self, cells):
+        """Check the neighbor cells of the given cell positions"""
+        # Get the area of the cells
+        columns = [cell[0] for cell in cells]
+        rows = [cell[1] for cell in cells]
+        # Recalculate the auto-tiling masks and the water of the cells and their neighbors at once
+        self.map_data.update_region(min(columns) - 1, min(rows) - 1, max(columns) + 1, max(rows) + 1)
 
     def _show_preview(self):
         """Show preview of the placement of a tile and show which objects are draggable"""
         # Check if user isn't in the menu
-        if not self.menu.rect.collidepoint(mouse_pos()):
+        if not self.menu.rect.collidepoint(self.input.mouse_pos):
             # Get the object that user points to
             selected_object = self._object_pointed()
 
             # If the object exists
             if selected_object:
-                # Get the object's rectangle inflated by 10 pixels
-                rect = selected_object.rect.inflate(10, 10)
+                # Get the object's rectangle on the screen inflated by 10 pixels
+                rect = selected_object.rect.move(self._camera_offset()).inflate(10, 10)
 
                 # Width of lines
                 width = 3
@@ -656,15 +869,11 @@ class Editor:
 
             # Otherwise display the preview of the tile
             else:
-                # Get the ID's of tiles and objects and their type
-                type_dict = {item_id: item["type"] for item_id, item in settings.EDITOR_INFO.items()}
-
-                # Preview surface with lowered alpha value
-                surface = self.previews[self.select_index].copy()
-                surface.set_alpha(200)
+                # Preview surface (with lowered alpha value)
+                surface = self.previews[self.select_index]
 
                 # Check if this is a tile
-                if type_dict[self.select_index] == "tile":
+                if settings.EDITOR_INFO[self.select_index]["type"] == "tile":
                     # Get this cell
                     current_cell = self._get_current_cell()
                     # Get its rect in the world, in tile position
@@ -672,11 +881,22 @@ class Editor:
 
                 # Else get rect of the object in pixels
                 else:
-                    rect = surface.get_rect(center=mouse_pos())
+                    rect = surface.get_rect(center=self.input.mouse_pos)
 
                 # Blit the preview
                 self.surface.blit(surface, rect)
 
+    def _show_region(self):
+        """Show the region that is being edited"""
+        if self.region_mode:
+            left, top, right, bottom = self._region_rect()
+            # Get the region's rectangle on the screen
+            rect = pygame.Rect(self.origin + vector(left, top) * settings.TILE_SIZE,
+                               ((right - left + 1) * settings.TILE_SIZE,
+                                (bottom - top + 1) * settings.TILE_SIZE))
+            # Draw its frame
+            pygame.draw.rect(self.surface, "black", rect, 3)
+
     def _import_assets(self):
         """Import assets not loaded in the main file"""
         # Load the bottom part of water
@@ -705,21 +925,37 @@ class Editor:
         self.previews = {item_id: load(os.path.join(settings.BASE_PATH, item["preview"]))
                          for item_id, item in settings.EDITOR_INFO.items()
                          if item["preview"]}
+        # Lower their alpha value once
+        for surface in self.previews.values():
+            surface.set_alpha(200)
 
     def _update_animations(self, delta_time):
-        """Update the animations"""
+        """Update the animations, as often as the quality allows"""
+        self.animation_time += delta_time
+        if self.animation_time < self.quality["animation_step"]:
+            return
+
         # Go through each animation that is loaded
         for item in self.animations.values():
             # Increase the frame of it
-            item["frame"] += settings.ANIMATION_SPEED * delta_time
+            item["frame"] += settings.ANIMATION_SPEED * self.animation_time
             # If the frame is too high, return it to the first one
             if item["frame"] >= item["length"]:
                 item["frame"] = 0
+        self.animation_time = 0
 
     def _object_pointed(self):
         """Check which object does the mouse points on"""
-        # Go through every object on the map
-        for obj in self.map_objects:
-            # Check for mouse collision with it, if there is one, remove it
-            if obj.rect.collidepoint(mouse_pos()):
-                return obj
+        # Get the first object under the mouse
+        objects = self._objects_at(self.input.mouse_pos)
+        return objects[0] if objects else None
+
+    def _objects_at(self, pos):
+        """Get the objects at the position on the screen"""
+        # Get the position in the world
+        world_pos = vector(pos) - self.origin
+        # Query only the objects near the position, then check their exact rectangles
+        objects = self.map_objects.query_point(world_pos)
+        # Dragged objects aren't at their indexed position, so check them too
+        objects += [obj for obj in self.dragged_objects if obj not in objects]
+        return [obj for obj in objects if obj.rect.collidepoint(world_pos)]
@@ -1,9 +1,10 @@
+from bisect import bisect_left, bisect_right
 from random import choice
 
-import pygame.transform
 from pygame.math import Vector2 as vector
 
 from src.sprites import GenericSprite
+from src.utilities import utilities
 from src.settings import settings
 from src.timer import Timer
 
@@ -14,15 +15,16 @@ class Spikes(GenericSprite):
         """Initialize the spikes"""
         super().__init__(pos, assets, group)
         # Set the mask for precise collisions
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = utilities.surface_mask(self.image)
 
 
 class Tooth(GenericSprite):
     """Tooth enemy, that can walk"""
-    def __init__(self, pos, assets, group, collision_sprites):
-        """Initialize the tooth enemy"""
-        # Get the frames, set the current frame
-        self.frames = assets
+    def __init__(self, pos, assets, group):
+        """Initialize the tooth enemy, it walks once its patrol bounds are set"""
+        # Get the run frames by the orientation and their masks, set the current frame
+        self.frames = {"left": assets["run_left"], "right": assets["run_right"]}
+        self.masks = {orientation: utilities.frame_masks(frames) for orientation, frames in self.frames.items()}
         self.frame = 0
 
         # Set tooth's direction to a random one
@@ -31,17 +33,14 @@ class Tooth(GenericSprite):
         # Create the orientation based off the direction
         self.orientation = "left" if self.direction.x < 0 else "right"
 
-        # Sprites that he can collide with
-        self.collision_sprites = collision_sprites
-
         # Get the first frame of running
-        surface = self.frames[f"run_{self.orientation}"][self.frame]
+        surface = self.frames[self.orientation][self.frame]
 
         # Initialize generic sprite with first frame of run animation
         super().__init__(pos, surface, group)
 
         # Assign a mask
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = self.masks[self.orientation][self.frame]
 
         # Place the enemy on the ground
         self.rect.bottom = self.rect.top + settings.TILE_SIZE
@@ -50,10 +49,8 @@ class Tooth(GenericSprite):
         self.pos = vector(self.rect.topleft)
         self.speed = 120
 
-        # If tooth isn't on the ground at the start, destroy him
-        if not[sprite for sprite in collision_sprites
-               if sprite.rect.collidepoint(self.rect.midbottom + vector(0, 10))]:
-            self.kill()
+        # Left and right edge of the floor he walks on (walls included), computed once
+        self.patrol = None
 
     def update(self, delta_time):
         """Update the tooth enemy"""
@@ -66,7 +63,7 @@ class Tooth(GenericSprite):
     def _animate(self, delta_time):
         """Animate the tooth enemy"""
         # Get the run animation frames
-        frames = self.frames[f"run_{self.orientation}"]
+        frames = self.frames[self.orientation]
 
         # Increase the current frame
         self.frame += settings.ANIMATION_SPEED * delta_time
@@ -75,52 +72,111 @@ class Tooth(GenericSprite):
         if self.frame >= len(frames):
             self.frame = 0
 
-        # Set the image to the current frame one
+        # Set the image to the current frame one, with its mask
         self.image = frames[int(self.frame)]
-
-        # Update the mask
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = self.masks[self.orientation][int(self.frame)]
 
     def _move(self, delta_time):
         """Move the tooth enemy"""
-        # Get the near gap locations of the enemy
-        left_gap = self.rect.bottomleft + vector(-1, 0)
-        right_gap = self.rect.bottomright + vector(1, 0)
-        # Get the location of blocks near the enemy
-        left_block = self.rect.midleft + vector(-1, 0)
-        right_block = self.rect.midright + vector(1, 0)
-
-        # If the enemy is moving right
-        if self.direction.x > 0:
-            # Check for collisions between the floor and right side of the enemy
-            floors = [sprite for sprite in self.collision_sprites if sprite.rect.collidepoint(right_gap)]
-            # Check for collisions with the right wall
-            walls = [sprite for sprite in self.collision_sprites if sprite.rect.collidepoint(right_block)]
-            print(floors, walls)
-            # If enemy touches the wall, or there isn't any floor on the right side of him
-            if (not floors) or walls:
-                # Change the enemy's direction and orientation
-                self.direction.x *= -1
-                self.orientation = "left"
-
-        # If the enemy is moving left
-        if self.direction.x < 0:
-            # Check the left wall and floor collisions
-            floors = [sprite for sprite in self.collision_sprites if sprite.rect.collidepoint(left_gap)]
-            walls = [sprite for sprite in self.collision_sprites if sprite.rect.collidepoint(left_block)]
-
-            # If enemy touches a left wall or there is a gap, change direction and orientation
-            if (not floors) or walls:
-                self.direction.x *= -1
-                self.orientation = "right"
+        # Stand still until the patrol bounds are known
+        if not self.patrol:
+            return
+
+        # If the enemy is moving right and touches the wall, or there isn't any floor on the right side of him
+        if self.direction.x > 0 and self.rect.right + 1 >= self.patrol[1]:
+            # Change the enemy's direction and orientation
+            self.direction.x = -1
+            self.orientation = "left"
+
+        # If enemy is moving left and touches a left wall or there is a gap, change direction and orientation
+        if self.direction.x < 0 and self.rect.left - 1 < self.patrol[0]:
+            self.direction.x = 1
+            self.orientation = "right"
 
         self.pos.x += self.direction.x * self.speed * delta_time
         self.rect.x = round(self.pos.x)
 
 
+def set_patrols(teeth, collision_sprites):
+    """Compute patrol bounds of the teeth, the new teeth without ground under them are destroyed"""
+    # Index the collision rectangles by the rows of tiles they cover
+    rows = {}
+    for sprite in collision_sprites:
+        for row in range(sprite.rect.top // settings.TILE_SIZE, (sprite.rect.bottom - 1) // settings.TILE_SIZE + 1):
+            rows.setdefault(row, []).append(sprite.rect)
+
+    # Floors and walls at every checked height, shared by the teeth at the same height
+    floors = {}
+    walls = {}
+
+    # Go through every tooth
+    for tooth in teeth:
+        patrol = _patrol_bounds(tooth.rect, rows, floors, walls)
+        # Keep the old bounds if the ground is gone (it's in a chunk that isn't loaded)
+        if patrol:
+            tooth.patrol = patrol
+        # If tooth isn't on the ground at the start, destroy him
+        elif not tooth.patrol:
+            tooth.kill()
+
+
+def _patrol_bounds(rect, rows, floors, walls):
+    """Get the left and right edge of the floor under the rectangle, limited by the walls next to it"""
+    # Floor is checked at the bottom of the rectangle and walls in its middle
+    floor_y = rect.bottom
+    wall_y = rect.centery
+
+    # Take the floor under the middle of the rectangle
+    if floor_y not in floors:
+        floors[floor_y] = _floors_at(floor_y, rows)
+    starts, ends = floors[floor_y]
+    index = bisect_right(starts, rect.centerx) - 1
+    if index < 0 or rect.centerx >= ends[index]:
+        return None
+    left, right = starts[index], ends[index]
+
+    # Stop at the closest walls on both sides (walls overlapping the rectangle block it on the side they start at)
+    if wall_y not in walls:
+        walls[wall_y] = _walls_at(wall_y, rows)
+    lefts, right_edges = walls[wall_y]
+    index = bisect_left(lefts, rect.left)
+    # Closest wall starting on the right
+    if index < len(lefts):
+        right = min(right, lefts[index])
+    # Right-most edge of the walls starting on the left
+    if index > 0:
+        left = max(left, right_edges[index - 1])
+    return left, right
+
+
+def _floors_at(floor_y, rows):
+    """Get the starts and ends of the floors at the height, the touching ones joined"""
+    starts = []
+    ends = []
+    for left, right in sorted((floor.left, floor.right) for floor in rows.get(floor_y // settings.TILE_SIZE, ())
+                              if floor.top <= floor_y < floor.bottom):
+        if ends and left <= ends[-1]:
+            ends[-1] = max(ends[-1], right)
+        else:
+            starts.append(left)
+            ends.append(right)
+    return starts, ends
+
+
+def _walls_at(wall_y, rows):
+    """Get the left sides of the walls at the height, sorted, with the right-most right side up to every wall"""
+    lefts = []
+    right_edges = []
+    for left, right in sorted((wall.left, wall.right) for wall in rows.get(wall_y // settings.TILE_SIZE, ())
+                              if wall.top <= wall_y < wall.bottom):
+        lefts.append(left)
+        right_edges.append(max(right_edges[-1], right) if right_edges else right)
+    return lefts, right_edges
+
+
 class Shell(GenericSprite):
     """The shell enemy, that player can jump on"""
-    def __init__(self, pos, assets, group, orientation, pearl_surface, damage_group):
+    def __init__(self, pos, assets, group, orientation, pearls):
         """Initialize the shell"""
         # Animation frames (copy because it might need a flip, without a copy it would flip all the shells)
         self.frames = assets.copy()
@@ -134,29 +190,31 @@ class Shell(GenericSprite):
             # Go through each of the animation type, get its image
             for animation_type, images in self.frames.items():
                 # Check and flip all the images in this animation type
-                self.frames[animation_type] = [pygame.transform.flip(image, True, False)
-                                               for image in images]
+                self.frames[animation_type] = utilities.flip_frames(images)
         # Current state of the shell
         self.state = "idle"
 
-        # Pearl bullet surface
-        self.pearl_surface = pearl_surface
+        # Pool of the pearl bullets
+        self.pearls = pearls
         # Shoot flag
         self.shoot = False
         # Its cooldown
         self.shoot_cooldown = Timer(4000)
 
-        # Damage sprite for making the pearl attack the player
-        self.damage_sprites = damage_group
-        # Sprites
-        self.sprites = group[0]
-
         # Initialize the generic sprite with first frame of idle animation
         super().__init__(pos, self.frames[self.state][self.frame], group)
 
         # Place it on the ground
         self.rect.bottom = self.rect.top + settings.TILE_SIZE
 
+        # Direction of the pearls and their offset from the center of the shell
+        if orientation == "left":
+            self.pearl_direction = vector(-1, 0)
+            self.pearl_offset = (self.pearl_direction * 50) + vector(0, -10)
+        else:
+            self.pearl_direction = vector(1, 0)
+            self.pearl_offset = (self.pearl_direction * 20) + vector(0, -10)
+
     def update(self, delta_time):
         """Update the shell"""
         # Animate the shell
@@ -164,9 +222,6 @@ class Shell(GenericSprite):
         # Update it's state
         self._update_state()
 
-        # Update the cooldown
-        self.shoot_cooldown.update()
-
     def _animate(self, delta_time):
         """Animate the shell"""
         # Get the animation frames based off the shell state
@@ -189,26 +244,17 @@ class Shell(GenericSprite):
 
         # If the shell is on the shooting frame (second one), it is attacking, and it didn't shoot yet
         if int(self.frame) >= 2 and self.state == "attack" and not self.shoot:
-            # If shell's direction is left, make the pearl direction left to
-            if self.orientation == "left":
-                pearl_direction = vector(-1, 0)
-                # Get the pearl offset
-                pearl_offset = (pearl_direction * 50) + vector(0, -10)
-            # Otherwise make it right and take its offset
-            else:
-                pearl_direction = vector(1, 0)
-                pearl_offset = (pearl_direction * 20) + vector(0, -10)
-
             # Turn on the shoot flag
             self.shoot = True
-            # Create the pearl with specified direction, starting at the center of the shell
-            Pearl(self.rect.center + pearl_offset, self.pearl_surface,
-                  [self.sprites, self.damage_sprites], pearl_direction)
+            # Fire the pearl in shell's direction, starting at the center of the shell
+            self.pearls.fire(self.rect.center + self.pearl_offset, self.pearl_direction)
 
     def _update_state(self):
         """Update the shell's state"""
-        # If player is close enough to the shell
-        if vector(self.player.rect.center).distance_to(vector(self.rect.center)) < 550:
+        # If player is close enough to the shell (compare the squared distance, without creating vectors)
+        distance_x = self.player.rect.centerx - self.rect.centerx
+        distance_y = self.player.rect.centery - self.rect.centery
+        if distance_x * distance_x + distance_y * distance_y < 550 * 550:
             # If the shell can shoot, do set it's state to attack
             if not self.shoot_cooldown.active:
                 self.state = "attack"
@@ -219,23 +265,37 @@ class Shell(GenericSprite):
 
 
 class Pearl(GenericSprite):
-    """Pearl projectile"""
-    def __init__(self, pos, surface, group, direction):
+    """Pearl projectile, reused by the pearl pool"""
+    def __init__(self, surface, mask, pool):
         """Initialize the pearl"""
-        super().__init__(pos, surface, group)
+        super().__init__((0, 0), surface, [])
 
-        # Add a mask
-        self.mask = pygame.mask.from_surface(self.image)
+        # Mask, shared by all the pearls
+        self.mask = mask
+        # Pool that the pearl returns to
+        self.pool = pool
 
         # Pearl position
-        self.pos = vector(self.rect.topleft)
+        self.pos = vector()
         # Its direction and speed
-        self.direction = direction
+        self.direction = vector()
         self.speed = 150
 
-        # Pearl duration time
-        self.timer = Timer(6000)
-        self.timer.start()
+        # Time until the pearl disappears
+        self.time_left = 0
+
+    def launch(self, pos, direction, groups):
+        """Launch the pearl from the position"""
+        # Place it and set its direction
+        self.rect.topleft = pos
+        self.pos.update(self.rect.topleft)
+        self.direction.update(direction)
+
+        # Reset the pearl duration time
+        self.time_left = settings.PEARL_DURATION
+
+        # Add it to the groups
+        self.add(groups)
 
     def update(self, delta_time):
         """Update the pearl"""
@@ -243,8 +303,56 @@ class Pearl(GenericSprite):
         self.pos.x += self.direction.x * self.speed * delta_time
         self.rect.x = round(self.pos.x)
 
-        # Update the timer
-        self.timer.update()
-        # If the timer passed, kill the pearl
-        if not self.timer.active:
-            self.kill()
+        # Count down the time, if it passed, return the pearl to the pool
+        self.time_left -= delta_time
+        if self.time_left <= 0:
+            self.pool.release(self)
+
+
+class PearlPool:
+    """Pearls reused between the shots, instead of creating new ones"""
+    def __init__(self, surface, groups, limit=settings.PEARL_LIMIT):
+        """Initialize the pool"""
+        # Surface of the pearls and its mask, created once
+        self.surface = surface
+        self.mask = utilities.surface_mask(surface)
+        # Groups of the flying pearls
+        self.groups = groups
+
+        # Maximum amount of flying pearls
+        self.limit = limit
+        # Pearls ready to be fired
+        self.free = []
+
+        # Amount of flying pearls, the highest amount of them and the amount of created ones
+        self.live = 0
+        self.peak = 0
+        self.created = 0
+
+    def fire(self, pos, direction):
+        """Fire a pearl, nothing is fired if too many of them fly already"""
+        if self.live >= self.limit:
+            return None
+
+        # Reuse a free pearl, create a new one only if there is none
+        if self.free:
+            pearl = self.free.pop()
+        else:
+            pearl = Pearl(self.surface, self.mask, self)
+            self.created += 1
+        pearl.launch(pos, direction, self.groups)
+
+        # Count it
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        return pearl
+
+    def release(self, pearl):
+        """Take the pearl out of the level and keep it for the next shot"""
+        pearl.kill()
+        self.free.append(pearl)
+        self.live -= 1
+
+    def stats(self):
+        """Get the pool counters"""
+        return {"live": self.live, "peak": self.peak, "created": self.created, "limit": self.limit}
@@ -0,0 +1,34 @@
+import pygame
+
+
+class InputState:
+    """Input of one frame, gathered from the event queue at once"""
+    def __init__(self):
+        """Initialize the input state"""
+        # Events that happened during the frame
+        self.events = []
+
+        # Mouse position
+        self.mouse_pos = (0, 0)
+        # Pressed mouse buttons
+        self.mouse_buttons = (False, False, False)
+        # Buttons clicked during the frame (a quick click could be released before the buttons are sampled)
+        self.clicked = set()
+        # Pressed modifier keys
+        self.mods = 0
+
+    def collect(self):
+        """Empty the event queue and sample the mouse and keyboard once"""
+        self.events = pygame.event.get()
+
+        # Sample the mouse
+        self.mouse_pos = pygame.mouse.get_pos()
+        self.mouse_buttons = pygame.mouse.get_pressed()
+        self.clicked = {event.button for event in self.events if event.type == pygame.MOUSEBUTTONDOWN}
+
+        # Sample the modifiers, the editor checks them instead of the live keyboard
+        self.mods = pygame.key.get_mods()
+
+    def held(self, button):
+        """Check if the mouse button (1 - left, 2 - middle, 3 - right) was held during the frame"""
+        return self.mouse_buttons[button - 1] or button in self.clicked
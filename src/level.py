@@ -1,28 +1,41 @@
 import os.path
 import sys
-from random import choice, randint
+from functools import partial
+from random import randint
 
+import numpy
 import pygame
 from pygame.math import Vector2 as vector
 
 from src.settings import settings
 from src.utilities import utilities
-from src.sprites import GenericSprite, Player, AnimatedSprite, Coin, Block, Cloud
-from src.particle import Particle
-from src.enemies import Spikes, Tooth, Shell
+from src.sprites import GenericSprite, Player, Block
+from src.particle import ParticleSystem
+from src.enemies import Shell, PearlPool, set_patrols
 from src.camera import CameraGroup
+from src.cloud_field import CloudField
 from src.ui import UI
+from src.streaming import LevelStreamer, GridChunks
+from src.timer import scheduler
+from src.ecs import (World, SpriteFactory, EntityFactory, animation_system, patrol_system, movement_system,
+                     collider_system)
+from src.quality import governor
+from src.profiling import profiler
 
 
 class Level:
     """The game's level class"""
-    def __init__(self, grid, switch, assets):
-        """Initialize the game's level"""
+    def __init__(self, grid, switch, assets, streaming=None, ecs=settings.ECS, finish=None):
+        """Initialize the game's level, big levels are streamed in chunks unless streaming flag is given, the simple
+        entities of levels that aren't streamed are stored in component arrays if ecs flag is set, finish function is
+        called once player walks past the right end of the level"""
         # Get the main surface
         self.surface = pygame.display.get_surface()
 
         # Switch between the editor and level
         self.switch = switch
+        # Function going to the next level, if there is one
+        self.finish = finish
 
         # Group with all the sprites
         self.sprites = CameraGroup()
@@ -34,18 +47,33 @@ class Level:
         self.collision_sprites = pygame.sprite.Group()
         # Shell sprites
         self.shell_sprites = pygame.sprite.Group()
+        # Sprites updated every frame (the player and pearls), enemies updated near the player and the animated
+        # decorations (coins, water and palms)
+        self.active_sprites = pygame.sprite.Group()
+        self.enemy_sprites = pygame.sprite.Group()
+        self.animated_sprites = pygame.sprite.Group()
 
         # Game's user's interface
         self.ui = UI()
 
-        # Particle surface assets
-        self.particle_assets = assets["particle"]
-
-        # Cloud surfaces
-        self.cloud_surfaces = assets["clouds"]
-        # Cloud appear timer
-        self.cloud_timer = pygame.USEREVENT + 2
-        pygame.time.set_timer(self.cloud_timer, 4000)
+        # Particles, drawn by the camera group
+        self.particles = ParticleSystem(assets["particle"])
+        self.sprites.particles = self.particles
+        # Pearls shot by the shells, they attack the player
+        self.pearls = PearlPool(assets["pearl"], [self.sprites, self.attack_sprites, self.active_sprites])
+
+        # Clouds, drawn by the camera group (the dead zone is set after the level limits)
+        self.clouds = CloudField(assets["clouds"], 0)
+        self.sprites.clouds = self.clouds
+        # Call spawning the clouds, scheduled once the level starts
+        self.cloud_call = None
+
+        # Quality tier of the level, area around the player where the enemies are updated and the time of the
+        # decoration animations since they were last updated
+        self.quality = None
+        self.activity_rect = pygame.Rect(0, 0, 0, 0)
+        self.animation_time = 0
+        self._set_quality(governor.tier)
 
         # Load the sounds
         self.sounds = {
@@ -57,29 +85,92 @@ class Level:
         for sound in self.sounds.values():
             sound.set_volume(0.2)
 
-        # Build the level based off the grid
-        self._build_level(grid, assets)
-
-        # Level position limits
-        self.level_limits = {
-            "left": -settings.WINDOW_WIDTH,
-            # Get the right-most stile
-            "right": sorted(list(grid["terrain"].keys()), key=lambda pos: pos[0])[-1][0]
+        # Check if the level is big enough to be streamed
+        if streaming is None:
+            streaming = sum(len(layer) for layer in grid.values()) > settings.STREAM_THRESHOLD
+
+        # Store the coins, spikes, teeth and animated decorations in the entity world (streaming evicts the sprites
+        # by their classes, so streamed levels always use them)
+        self.world = World() if ecs and not streaming else None
+        self.factory = EntityFactory(self.world) if self.world is not None else SpriteFactory()
+
+        # Level position limits, the right one is the right-most terrain tile, found while building the terrain
+        self.level_limits = {"left": -settings.WINDOW_WIDTH, "right": 0}
+
+        # Spawners of the objects by their ID, each one creates a whole batch of positions
+        self.spawners = {
+            # Player and the horizon
+            0: self._spawn_player,
+            1: self._spawn_horizon,
+            # Coins
+            4: partial(self._spawn_coins, "gold"),
+            5: partial(self._spawn_coins, "silver"),
+            6: partial(self._spawn_coins, "diamond"),
+            # Enemies
+            7: self._spawn_spikes,
+            8: self._spawn_teeth,
+            9: partial(self._spawn_shells, "left"),
+            10: partial(self._spawn_shells, "right"),
+            # Foreground palms, with the blocks (and their offset) that player can stand on
+            11: partial(self._spawn_palms, "small_fg", (0, 0)),
+            12: partial(self._spawn_palms, "large_fg", (0, 0)),
+            13: partial(self._spawn_palms, "left_fg", (0, 0)),
+            14: partial(self._spawn_palms, "right_fg", (50, 0)),
+            # Background palms
+            15: partial(self._spawn_palms, "small_bg", None),
+            16: partial(self._spawn_palms, "large_bg", None),
+            17: partial(self._spawn_palms, "left_bg", None),
+            18: partial(self._spawn_palms, "right_bg", None),
         }
 
-        # Create some start clouds
+        # Stream the chunks of the level around the player
+        if streaming:
+            source = GridChunks(grid)
+            self.level_limits["right"] = source.right
+            self.streamer = LevelStreamer(self, source, assets)
+            # Build the player and the horizon, then the chunks around the player
+            self._build_level(source.global_grid, assets)
+            self.streamer.update(self.player.rect.center, wait=True)
+        # Otherwise build the entire level based off the grid
+        else:
+            self.streamer = None
+            self._build_level(grid, assets)
+
+        # Create some start clouds, remove them beyond the left limit
+        self.clouds.dead_zone = self.level_limits["left"]
         self._start_clouds()
 
-    def run(self, delta_time):
-        """Run the game level"""
+    def start(self):
+        """Start the level's timers, the level can be built ahead of time until then"""
+        # Spawn new clouds as often as the quality allows
+        self.cloud_call = scheduler.schedule(self.quality["cloud_interval"], self._create_clouds, repeat=True)
+
+    def stop(self):
+        """Stop the level's timers and streaming"""
+        # Stop spawning the clouds
+        scheduler.cancel(self.cloud_call)
+
+        # Stop streaming the chunks
+        if self.streamer:
+            self.streamer.stop()
+            self.streamer = None
+
+    def run(self, delta_time, draw=True):
+        """Run the game level, without drawing it if the draw flag is off"""
+        # Follow changes of the quality tier
+        if self.quality is not governor.tier:
+            self._set_quality(governor.tier)
+
         # Handle events
-        self._get_events()
+        with profiler.probe("events"):
+            self._get_events()
 
         # Update positions
         self._update_pos(delta_time)
 
         # Update the surface
-        self._update_surface()
+        if draw:
+            self._update_surface()
 
     def _get_events(self):
         """Get and handle the events"""
@@ -90,164 +181,242 @@ class Level:
                 pygame.quit()
                 sys.exit()
 
+            # Toggle the frame profiler or export its trace
+            profiler.handle_event(event)
+
             # If user clicks escape, switch to the editor
             if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                self.switch()
-
-            # If cloud appear cooldown has ended, spawn a new cloud
-            if event.type == self.cloud_timer:
-                self._create_clouds()
+                self._exit()
 
     def _update_pos(self, delta_time):
         """Update positions of elements"""
-        # Update the player's position
-        self.sprites.update(delta_time)
+        # Stream the chunks around the player
+        if self.streamer:
+            self.streamer.update(self.player.rect.center)
+
+        with profiler.probe("update"):
+            # Update the enemies near the player (everywhere if the quality allows it)
+            active = self.active_sprites.sprites()
+            radius = self.quality["activity_radius"]
+            if radius is None:
+                profiler.update_sprites(self.enemy_sprites, delta_time)
+            else:
+                self.activity_rect.size = (2 * radius, 2 * radius)
+                self.activity_rect.center = self.player.rect.center
+                profiler.update_sprites((sprite for sprite in self.enemy_sprites.sprites()
+                                         if self.activity_rect.colliderect(sprite.rect)), delta_time)
+
+            # Animate the decorations as often as the quality allows
+            self.animation_time += delta_time
+            animate = self.animation_time >= self.quality["animation_step"]
+            if animate:
+                profiler.update_sprites(self.animated_sprites, self.animation_time)
+
+            # Run the systems of the entity world where the enemy sprites are updated, before the player, so both
+            # ways of storing the entities simulate the same
+            if self.world is not None:
+                # Walking entities (the teeth) animate and walk every frame near the player, like the enemy sprites
+                walking = self.world.has_velocity[:self.world.count]
+                nearby = walking if radius is None else walking & collider_system(self.world, self.activity_rect)
+                animation_system(self.world, delta_time, nearby)
+                if animate:
+                    animation_system(self.world, self.animation_time, ~walking)
+                patrol_system(self.world, nearby)
+                movement_system(self.world, delta_time, nearby)
+            if animate:
+                self.animation_time = 0
+
+            # Update the player's position and the pearls (the ones fired this frame start moving in the next one)
+            profiler.update_sprites(active, delta_time)
+            # Move the clouds
+            self.clouds.step(delta_time)
+            # Animate the particles
+            self.particles.update(delta_time)
 
         # Check and handle player's damage
-        self._damage()
+        with profiler.probe("damage"):
+            self._damage()
 
         # Make the player collect coins
-        self._collect_coins()
+        with profiler.probe("coins"):
+            self._collect_coins()
+
+        # Go to the next level once player walks past the right-most tile
+        if (self.finish is not None and self.player.health > 0
+                and self.player.rect.left > self.level_limits["right"] + settings.TILE_SIZE):
+            self._exit(self.finish)
 
     def _update_surface(self):
         """Update the surface"""
-        # Draw the sky
-        self.surface.fill(settings.COLORS["SKY"])
+        with profiler.probe("draw"):
+            # Draw the sky
+            self.surface.fill(settings.COLORS["SKY"])
 
-        # Draw all the sprites
-        self.sprites.custom_draw(self.player)
+            # Draw all the sprites
+            self.sprites.custom_draw(self.player)
 
         # Display user's interface
-        self.ui.display(self.player)
-
-    def _build_level(self, grid, assets):
-        """Build the level based off the grid using the given assets"""
-        # Go through every single one of grid layers
-        for layer_name, layer in grid.items():
-            # Check all the layer placements
-            for pos, data in layer.items():
-                # If this layer is terrain, create a sprite with land at saved position
-                if layer_name == "terrain":
-                    GenericSprite(pos, assets["land"][data], [self.sprites, self.collision_sprites])
-
-                # Check if layer is water one
-                if layer_name == "water":
-                    # If the tile is top one, create the water top tile with animation
-                    if data == "top":
-                        AnimatedSprite(pos, assets["water_top"], self.sprites, settings.LAYERS_DEPTH["water"])
-                    # Otherwise create the bottom, plain one
-                    else:
-                        GenericSprite(pos, assets["water_bottom"], self.sprites, settings.LAYERS_DEPTH["water"])
-
-                # If layer's ID was 0, place the player
-                if data == 0:
-                    self.player = Player(pos, assets["player"], self.sprites, self.collision_sprites,
-                                         self.sounds["jump"])
-                # Set the horizon
-                elif data == 1:
-                    self.horizon_y = pos[1]
-                    self.sprites.horizon_y = pos[1]
-
-                # Generate the specific coins
-                # Gold
-                elif data == 4:
-                    Coin(pos, assets["gold_coin"], [self.sprites, self.coin_sprites], "gold")
-                # Silver
-                elif data == 5:
-                    Coin(pos, assets["silver_coin"], [self.sprites, self.coin_sprites], "silver")
-                # Diamond
-                elif data == 6:
-                    Coin(pos, assets["diamond_coin"], [self.sprites, self.coin_sprites], "diamond")
-
-                # Enemies
-                # Spikes
-                elif data == 7:
-                    Spikes(pos, assets["spikes"], [self.sprites, self.attack_sprites])
-                # Tooth enemy
-                elif data == 8:
-                    Tooth(pos, assets["tooth"], [self.sprites, self.attack_sprites], self.collision_sprites)
-                # Shell in the left direction (it isn't in attack sprites, because player can jump on it)
-                elif data == 9:
-                    print(pos)
-                    Shell(pos, assets["shell"], [self.sprites, self.collision_sprites, self.shell_sprites],
-                          "left", assets["pearl"], self.attack_sprites)
-                # Shell in the right direction
-                elif data == 10:
-                    print(pos)
-                    Shell(pos, assets["shell"], [self.sprites, self.collision_sprites, self.shell_sprites],
-                          "right", assets["pearl"], self.attack_sprites)
-
-                # Palms
-                # Small palm foreground
-                elif data == 11:
-                    AnimatedSprite(pos, assets["palms"]["small_fg"], self.sprites)
-                    # Create a block that player can stand on (player should be able to stand on leafs)
-                    Block(pos, (77, 50), self.collision_sprites)
-                # Large palm foreground
-                elif data == 12:
-                    AnimatedSprite(pos, assets["palms"]["large_fg"], self.sprites)
-                    Block(pos, (77, 50), self.collision_sprites)
-                # Left foreground
-                elif data == 13:
-                    AnimatedSprite(pos, assets["palms"]["left_fg"], self.sprites)
-                    Block(pos, (77, 50), self.collision_sprites)
-                # Right foreground
-                elif data == 14:
-                    AnimatedSprite(pos, assets["palms"]["right_fg"], self.sprites)
-                    Block(pos + vector(50, 0), (77, 50), self.collision_sprites)
-
-                # Small palm background
-                elif data == 15:
-                    AnimatedSprite(pos, assets["palms"]["small_bg"], self.sprites, settings.LAYERS_DEPTH["bg"])
-                # Large background
-                elif data == 16:
-                    AnimatedSprite(pos, assets["palms"]["large_bg"], self.sprites, settings.LAYERS_DEPTH["bg"])
-                # Left background
-                elif data == 17:
-                    AnimatedSprite(pos, assets["palms"]["left_bg"], self.sprites, settings.LAYERS_DEPTH["bg"])
-                # Right background
-                elif data == 18:
-                    AnimatedSprite(pos, assets["palms"]["right_bg"], self.sprites, settings.LAYERS_DEPTH["bg"])
+        with profiler.probe("ui"):
+            self.ui.display(self.player)
+
+    def _set_quality(self, tier):
+        """Apply the quality tier"""
+        self.quality = tier
+        # Limit the clouds, the ones above the limit fly away on their own
+        self.clouds.limit = tier["clouds"]
+        # Limit the particles
+        self.particles.limit = min(tier["particles"], len(self.particles.x))
+        # Turn the horizon lines on or off
+        self.sprites.horizon_lines = tier["horizon"]
+
+        # Spawn the clouds as often as the tier allows, if the level started already
+        if self.cloud_call is not None:
+            scheduler.cancel(self.cloud_call)
+            self.cloud_call = scheduler.schedule(tier["cloud_interval"], self._create_clouds, repeat=True)
+
+    def _build_level(self, grid, assets, chunk=None):
+        """Build the level based off the grid using the given assets, add sprites to the chunk group if given"""
+        # Additional groups of every sprite
+        extra = [chunk] if chunk is not None else []
+        # Created teeth, they get their patrol bounds once everything is built
+        teeth = []
+
+        # Go through every single one of grid layers, in their depth order
+        for rank, (layer_name, layer) in enumerate(grid.items()):
+            # Sprites of streamed chunks are added after the ones already there, they get the rank of their layer, so
+            # the camera group can put them back into the depth order
+            drawn = len(self.sprites)
+
+            # Terrain and water are built in one pass over the layer
+            if layer_name == "terrain":
+                self._spawn_terrain(layer, assets, extra)
+            elif layer_name == "water":
+                self._spawn_water(layer, assets, extra)
+
+            # Other layers hold objects, gather their positions by the ID, then spawn every batch at once
+            else:
+                batches = {}
+                for pos, data in layer.items():
+                    batches.setdefault(data, []).append(pos)
+
+                for data, positions in batches.items():
+                    spawner = self.spawners.get(data)
+                    if spawner:
+                        sprites = spawner(positions, assets, extra)
+                        # Save the teeth
+                        if data == 8:
+                            teeth.extend(sprites)
+
+            if self.streamer is not None:
+                for sprite in self.sprites.sprites()[drawn:]:
+                    sprite.draw_rank = rank
+
+        # Compute where the teeth can walk, now that all the collision sprites exist
+        set_patrols(teeth, self.collision_sprites)
 
         # Go through each of the shell sprites
         for shell in self.shell_sprites:
             # Save the player in it
             shell.player = self.player
 
+    def _spawn_terrain(self, layer, assets, extra):
+        """Create the land tiles, save the right-most one as the level limit"""
+        groups = [self.sprites, self.collision_sprites] + extra
+        right = self.level_limits["right"]
+        for pos, data in layer.items():
+            GenericSprite(pos, assets["land"][data], groups)
+            if pos[0] > right:
+                right = pos[0]
+        self.level_limits["right"] = right
+
+    def _spawn_water(self, layer, assets, extra):
+        """Create the water in chunks, each one is a sprite animated with frames composed of its tiles once"""
+        groups = [self.sprites, self.animated_sprites] + extra
+        # Top tiles are animated, the bottom ones are plain
+        tile_frames = {"top": assets["water_top"], "bottom": [assets["water_bottom"]]}
+
+        # Gather the tiles of every chunk
+        chunk_pixels = settings.WATER_CHUNK_SIZE * settings.TILE_SIZE
+        chunks = {}
+        for pos, data in layer.items():
+            chunk_pos = (int(pos[0]) // chunk_pixels, int(pos[1]) // chunk_pixels)
+            chunks.setdefault(chunk_pos, {})[pos] = tile_frames[data]
+
+        for tiles in chunks.values():
+            pos, frames = utilities.compose_tiles(tiles)
+            self.factory.animated(pos, frames, groups, settings.LAYERS_DEPTH["water"])
+
+    def _spawn_player(self, positions, assets, extra):
+        """Place the player"""
+        for pos in positions:
+            self.player = Player(pos, assets["player"], [self.sprites, self.active_sprites], self.collision_sprites,
+                                 self.sounds["jump"])
+        return [self.player]
+
+    def _spawn_horizon(self, positions, assets, extra):
+        """Set the horizon"""
+        for pos in positions:
+            self.horizon_y = pos[1]
+            self.sprites.horizon_y = pos[1]
+        return []
+
+    def _spawn_coins(self, coin_type, positions, assets, extra):
+        """Create the coins of the type"""
+        groups = [self.sprites, self.coin_sprites, self.animated_sprites] + extra
+        return [self.factory.coin(pos, assets[f"{coin_type}_coin"], groups, coin_type) for pos in positions]
+
+    def _spawn_spikes(self, positions, assets, extra):
+        """Create the spikes"""
+        groups = [self.sprites, self.attack_sprites] + extra
+        return [self.factory.spikes(pos, assets["spikes"], groups) for pos in positions]
+
+    def _spawn_teeth(self, positions, assets, extra):
+        """Create the tooth enemies"""
+        groups = [self.sprites, self.attack_sprites, self.enemy_sprites] + extra
+        return [self.factory.tooth(pos, assets["tooth"], groups) for pos in positions]
+
+    def _spawn_shells(self, orientation, positions, assets, extra):
+        """Create the shells facing the orientation (they aren't in attack sprites, because player can jump on them)"""
+        groups = [self.sprites, self.collision_sprites, self.shell_sprites, self.enemy_sprites] + extra
+        return [Shell(pos, assets["shell"], groups, orientation, self.pearls) for pos in positions]
+
+    def _spawn_palms(self, palm_type, block_offset, positions, assets, extra):
+        """Create the palms, foreground ones get a block that player can stand on (at the offset from the palm)"""
+        groups = [self.sprites, self.animated_sprites] + extra
+        # Background palms are drawn behind the others
+        if block_offset is None:
+            return [self.factory.animated(pos, assets["palms"][palm_type], groups, settings.LAYERS_DEPTH["bg"])
+                    for pos in positions]
+
+        # Player should be able to stand on the leafs
+        block_groups = [self.collision_sprites] + extra
+        palms = []
+        for pos in positions:
+            palms.append(self.factory.animated(pos, assets["palms"][palm_type], groups))
+            Block(vector(pos) + block_offset, (77, 50), block_groups)
+        return palms
+
     def _create_clouds(self):
         """Create the clouds"""
-        # Choose a random cloud surface
-        surface = choice(self.cloud_surfaces)
-        # Scale it times two randomly
-        if randint(0,5) > 3:
-            surface = pygame.transform.scale2x(surface)
-
         # Cloud random starting position (check if user placed any tile, if not set starting X position to 500)
         pos_x = self.level_limits["right"] + randint(100, 300) if self.level_limits["right"] else 500
         pos_y = self.horizon_y - randint(-20, 600)
 
-        # Create the cloud
-        Cloud((pos_x, pos_y), surface, self.sprites, self.level_limits["left"])
+        # Create the cloud with a random surface, sometimes scaled up, and a random speed
+        self.clouds.add(pos_x, pos_y, randint(20, 30), self.clouds.random_surfaces(1, 1 / 3))
 
     def _start_clouds(self):
         """Create some clouds at start of the level"""
         # Create 30 clouds
-        for cloud_num in range(30):
-            # Randomly choose a cloud surface
-            surface = choice(self.cloud_surfaces)
-            # Sometimes scale it up
-            if randint(0, 5) > 3:
-                surface = pygame.transform.scale2x(surface)
-
-            # Get the random positions at the screen, depending on, if there was any tile placed
-            if self.level_limits["right"]:
-                pos_x = randint(self.level_limits["left"], self.level_limits["right"])
-            else:
-                pos_x = randint(self.level_limits["left"], 500)
-            pos_y = self.horizon_y - randint(-20, 600)
+        count = 30
 
-            # Create the cloud
-            Cloud((pos_x, pos_y), surface, self.sprites, self.level_limits["left"])
+        # Get the random positions at the screen, depending on, if there was any tile placed
+        right = self.level_limits["right"] if self.level_limits["right"] else 500
+        pos_x = numpy.random.randint(self.level_limits["left"], right + 1, count)
+        pos_y = self.horizon_y - numpy.random.randint(-20, 601, count)
+
+        # Create the clouds with random surfaces (some scaled up) and random speeds
+        self.clouds.add(pos_x, pos_y, numpy.random.randint(20, 31, count), self.clouds.random_surfaces(count, 1 / 3))
 
     def _collect_coins(self):
         """Collect the coins by the player"""
@@ -270,7 +439,7 @@ class Level:
                 self.player.coins += 5
 
             # Make some particles
-            Particle(coin.rect.center, self.particle_assets, self.sprites)
+            self.particles.emit(coin.rect.center)
 
     def _damage(self):
         """Damage the player if needed"""
@@ -286,4 +455,9 @@ class Level:
             self.sounds["hit"].play()
 
         if self.player.health <= 0:
-            self.switch()
+            self._exit()
+
+    def _exit(self, leave=None):
+        """Exit the level back to the editor, or with the leave function if given"""
+        self.stop()
+        (leave or self.switch)()
@@ -0,0 +1,395 @@
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy
+
+from src.settings import settings
+from src.autotile import terrain_to_mask, TERRAIN_NAMES
+
+
+# File signature and the current version of the format
+MAGIC = b"PYML"
+VERSION = 1
+
+# Kinds of the stored level, editor's map or a grid exported for the level
+KINDS = ("map", "grid")
+
+# Header: magic, version, kind, chunk size, layer count, chunk count, object count
+HEADER = struct.Struct("<4sHHHHII")
+# Layer table entry: name and the struct type code of its values
+LAYER_ENTRY = struct.Struct("<15sc")
+# Chunk index entry: chunk column, chunk row, layer index, padding and offset of the data
+CHUNK_ENTRY = struct.Struct("<iiHHQ")
+
+# Tile layers, their value types (in the order they are saved)
+LAYERS = {
+    "terrain": 'H',
+    "water": 'B',
+    "coins": 'B',
+    "enemies": 'B',
+}
+
+# Terrain is stored with this flag set, the lower byte holds the neighbor mask
+TERRAIN_FLAG = 0x100
+# Water types and their stored values
+WATER_TYPES = {"top": 1, "bottom": 2}
+
+
+class LevelData:
+    """Level stored as chunked tile layers and a list of off-grid objects"""
+    def __init__(self, kind, chunk_size=settings.LEVEL_CHUNK_SIZE):
+        """Initialize the level data"""
+        # Level kind, either editor map or exported grid
+        self.kind = kind
+        # Size of a chunk in cells
+        self.chunk_size = chunk_size
+
+        # Layer chunks, every layer has a dictionary of chunk position and its array
+        self.layers = {name: {} for name in LAYERS}
+        # Objects as rows of X, Y and tile ID
+        self.objects = numpy.zeros((0, 3), numpy.int32)
+
+    def set(self, layer, cell, value):
+        """Set value of the cell in given layer"""
+        # Get the chunk position and position of the cell inside of it
+        chunk_pos = (cell[0] // self.chunk_size, cell[1] // self.chunk_size)
+        local_x = cell[0] - chunk_pos[0] * self.chunk_size
+        local_y = cell[1] - chunk_pos[1] * self.chunk_size
+
+        # Create the chunk if it doesn't exist yet
+        chunks = self.layers[layer]
+        if chunk_pos not in chunks:
+            chunks[chunk_pos] = numpy.zeros((self.chunk_size, self.chunk_size), LAYERS[layer])
+
+        # Save the value (arrays are indexed by row first)
+        chunks[chunk_pos][local_y, local_x] = value
+
+    def set_objects(self, objects):
+        """Set the objects from rows of X, Y and tile ID"""
+        self.objects = numpy.array(objects, numpy.int32).reshape(-1, 3)
+
+    def cells(self, layer):
+        """Yield every non-empty cell of the layer with its value"""
+        # Go through each of the chunks
+        for (chunk_x, chunk_y), chunk in self.layers[layer].items():
+            # Get positions of the non-empty cells and their values
+            rows, columns = numpy.nonzero(chunk)
+            values = chunk[rows, columns].tolist()
+            # Move them into world cell coordinates
+            columns = (columns + chunk_x * self.chunk_size).tolist()
+            rows = (rows + chunk_y * self.chunk_size).tolist()
+
+            yield from zip(zip(columns, rows), values)
+
+
+def empty_grid():
+    """Create an empty level grid"""
+    # Grid layers (ordered by the Z-value, ascending)
+    return {
+        "water": {},
+        "bg palms": {},
+        "terrain": {},
+        "enemies": {},
+        "coins": {},
+        "fg objects": {}
+    }
+
+
+def grid_to_level(grid):
+    """Convert the level grid created by the editor into level data"""
+    level = LevelData("grid")
+
+    # Go through each of the tile layers
+    for pos, terrain in grid["terrain"].items():
+        level.set("terrain", _pos_to_cell(pos), TERRAIN_FLAG | terrain_to_mask(terrain))
+    for pos, water_type in grid["water"].items():
+        level.set("water", _pos_to_cell(pos), WATER_TYPES[water_type])
+    for pos, coin in grid["coins"].items():
+        # Coins are centered inside their tile
+        level.set("coins", _pos_to_cell(pos), coin)
+    for pos, enemy in grid["enemies"].items():
+        level.set("enemies", _pos_to_cell(pos), enemy)
+
+    # Save the objects with their exact positions
+    level.set_objects([(pos[0], pos[1], obj) for layer in ("bg palms", "fg objects")
+                       for pos, obj in grid[layer].items()])
+
+    return level
+
+
+def level_to_grid(level):
+    """Convert the level data back into the level grid"""
+    # Half of the tile, for centering the coins
+    half_tile = settings.TILE_SIZE // 2
+    # Water types by the stored value
+    water_types = {value: name for name, value in WATER_TYPES.items()}
+    # Background palm IDs
+    bg_palms = {item_id for item_id, item in settings.EDITOR_INFO.items() if item["style"] == "palm_bg"}
+
+    grid = empty_grid()
+
+    # Fill the tile layers
+    size = settings.TILE_SIZE
+    for (column, row), value in level.cells("water"):
+        grid["water"][(column * size, row * size)] = water_types[value]
+    for (column, row), value in level.cells("terrain"):
+        grid["terrain"][(column * size, row * size)] = TERRAIN_NAMES[value & 0xFF]
+    for (column, row), value in level.cells("enemies"):
+        grid["enemies"][(column * size, row * size)] = value
+    for (column, row), value in level.cells("coins"):
+        grid["coins"][(column * size + half_tile, row * size + half_tile)] = value
+
+    # Place the objects into their layers
+    for pos_x, pos_y, obj in level.objects.tolist():
+        grid["bg palms" if obj in bg_palms else "fg objects"][(pos_x, pos_y)] = obj
+
+    return grid
+
+
+def save_level(path, level, durable=False):
+    """Save the level data into a binary level file, make sure it's on the disk before returning if durable"""
+    # Create the directory if needed
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # Layer names in the saved order
+    layer_names = list(LAYERS)
+    # Every saved chunk, as layer index, chunk position and its array
+    chunks = [(layer_index, chunk_pos, chunk)
+              for layer_index, name in enumerate(layer_names)
+              for chunk_pos, chunk in sorted(level.layers[name].items())
+              if chunk.any()]
+    objects = numpy.ascontiguousarray(level.objects, "<i4")
+
+    # Calculate where the data starts (after the header, tables and objects), align it
+    data_offset = (HEADER.size + LAYER_ENTRY.size * len(layer_names) + CHUNK_ENTRY.size * len(chunks)
+                   + objects.nbytes)
+    data_offset = _align(data_offset)
+
+    with open(path, "wb") as file:
+        # Write the header
+        file.write(HEADER.pack(MAGIC, VERSION, KINDS.index(level.kind), level.chunk_size,
+                               len(layer_names), len(chunks), len(objects)))
+        # Write the layer table
+        for name in layer_names:
+            file.write(LAYER_ENTRY.pack(name.encode(), LAYERS[name].encode()))
+
+        # Write the chunk index, every chunk has its data offset
+        offset = data_offset
+        for layer_index, (chunk_x, chunk_y), chunk in chunks:
+            file.write(CHUNK_ENTRY.pack(chunk_x, chunk_y, layer_index, 0, offset))
+            offset = _align(offset + chunk.nbytes)
+
+        # Write the objects
+        file.write(objects.tobytes())
+
+        # Write the chunk data
+        for layer_index, chunk_pos, chunk in chunks:
+            # Pad the file up to the aligned chunk position
+            file.write(b"\0" * (_align(file.tell()) - file.tell()))
+            file.write(numpy.ascontiguousarray(chunk, '<' + chunk.dtype.char).tobytes())
+
+        if durable:
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class LevelFile:
+    """Binary level file opened through memory mapping, chunks are decoded only when needed"""
+    def __init__(self, path):
+        """Open the level file, raise ValueError if it's damaged or not a level file"""
+        # Open the file, it's closed again if it can't be read
+        self.file = open(path, "rb")
+        self.mmap = None
+        try:
+            self._read_tables()
+        except (ValueError, TypeError, IndexError, struct.error, UnicodeDecodeError) as error:
+            self.close()
+            raise ValueError(f"{path} can't be read as a level file: {error}") from error
+
+    def _read_tables(self):
+        """Map the file into the memory, read and check its header, layer table, chunk index and objects"""
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self.mmap)
+
+        # Read the header, check if the file is a level file in a known version
+        magic, version, kind, self.chunk_size, layer_count, chunk_count, object_count = (
+            HEADER.unpack_from(self.mmap, 0))
+        if magic != MAGIC:
+            raise ValueError("wrong signature")
+        if version > VERSION:
+            raise ValueError(f"unsupported version {version}")
+        if kind >= len(KINDS):
+            raise ValueError(f"unknown level kind {kind}")
+        self.kind = KINDS[kind]
+        offset = HEADER.size
+
+        # Read the layer table, only the known layers with valid value types
+        self.layer_types = {}
+        layer_names = []
+        for layer_index in range(layer_count):
+            name, type_code = LAYER_ENTRY.unpack_from(self.mmap, offset)
+            name = name.rstrip(b"\0").decode()
+            if name not in LAYERS:
+                raise ValueError(f"unknown layer {name!r}")
+            self.layer_types[name] = type_code.decode()
+            numpy.dtype(self.layer_types[name])
+            layer_names.append(name)
+            offset += LAYER_ENTRY.size
+
+        # Read the chunk index, it maps layer name and chunk position to the data offset, data has to be in the file
+        self.index = {}
+        for chunk_index in range(chunk_count):
+            chunk_x, chunk_y, layer_index, _, data_offset = CHUNK_ENTRY.unpack_from(self.mmap, offset)
+            name = layer_names[layer_index]
+            if data_offset + self.chunk_size ** 2 * numpy.dtype(self.layer_types[name]).itemsize > size:
+                raise ValueError(f"chunk {(chunk_x, chunk_y)} of layer {name!r} ends past the end of the file")
+            self.index[(name, (chunk_x, chunk_y))] = data_offset
+            offset += CHUNK_ENTRY.size
+
+        # Objects are small, so read them directly
+        if offset + object_count * 3 * 4 > size:
+            raise ValueError("objects end past the end of the file")
+        self.objects = numpy.frombuffer(self.mmap, "<i4", object_count * 3, offset).reshape(-1, 3).copy()
+
+    def chunk_positions(self, layer=None):
+        """Get positions of the chunks saved in the file, optionally only from one layer"""
+        return {chunk_pos for name, chunk_pos in self.index if layer is None or name == layer}
+
+    def chunk(self, layer, chunk_pos):
+        """Get the chunk of a layer without copying it, None if the chunk is empty"""
+        # Check if chunk was saved
+        offset = self.index.get((layer, chunk_pos))
+        if offset is None:
+            return None
+
+        # Create the array straight on top of the mapped file
+        return numpy.frombuffer(self.mmap, '<' + self.layer_types[layer], self.chunk_size ** 2,
+                                offset).reshape(self.chunk_size, self.chunk_size)
+
+    def read_chunks(self, chunk_positions):
+        """Read only the given chunks into the level data"""
+        level = LevelData(self.kind, self.chunk_size)
+        level.objects = self.objects.copy()
+
+        # Copy every needed chunk out of the file
+        for (layer, chunk_pos) in self.index:
+            if chunk_pos in chunk_positions:
+                level.layers[layer][chunk_pos] = self.chunk(layer, chunk_pos).astype(LAYERS[layer])
+        return level
+
+    def read(self):
+        """Read the whole level data"""
+        return self.read_chunks(self.chunk_positions())
+
+    def close(self):
+        """Close the file"""
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        """Use the level file as a context manager"""
+        return self
+
+    def __exit__(self, *args):
+        """Close the file when leaving the context"""
+        self.close()
+
+
+def load_level(path):
+    """Load the whole level data from the level file"""
+    with LevelFile(path) as level_file:
+        return level_file.read()
+
+
+def save_grid(path, grid):
+    """Save the level grid into a level file"""
+    save_level(path, grid_to_level(grid))
+
+
+def load_grid(path):
+    """Load the level grid from a level file"""
+    return level_to_grid(load_level(path))
+
+
+def load_playable_grid(path):
+    """Load the level grid of an exported level, raise ValueError if it can't be played"""
+    with LevelFile(path) as file:
+        # Only exported grids can be played, editor's maps don't know their terrain shapes
+        if file.kind != "grid":
+            raise ValueError(f"{path} is an editor map, not an exported level grid")
+        grid = level_to_grid(file.read())
+
+    # Levels are built around the player and the horizon
+    objects = set(grid["fg objects"].values())
+    if 0 not in objects or 1 not in objects:
+        raise ValueError(f"{path} has no player or no horizon")
+    return grid
+
+
+def level_pack(paths):
+    """Get the level files of the pack from the given files and directories (their files in name order)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith(settings.LEVEL_EXTENSION)))
+        else:
+            files.append(path)
+    return files
+
+
+def compare_with_json(grid, directory, repeats=10):
+    """Compare the file size and load time of the level file with a JSON file of the same grid"""
+    # Paths of both files
+    level_path = os.path.join(directory, "compare" + settings.LEVEL_EXTENSION)
+    json_path = os.path.join(directory, "compare.json")
+
+    # Save the grid in both formats, JSON can't have tuple keys, so change them into strings
+    save_grid(level_path, grid)
+    with open(json_path, "w") as file:
+        json.dump({name: {f"{pos[0]},{pos[1]}": value for pos, value in layer.items()}
+                   for name, layer in grid.items()}, file)
+
+    # Measure the loading of both
+    level_time = _measure(lambda: load_grid(level_path), repeats)
+    json_time = _measure(lambda: _load_json_grid(json_path), repeats)
+
+    return {
+        "level_size": os.path.getsize(level_path),
+        "json_size": os.path.getsize(json_path),
+        "level_load_time": level_time,
+        "json_load_time": json_time
+    }
+
+
+def _load_json_grid(path):
+    """Load the grid saved as JSON"""
+    with open(path) as file:
+        layers = json.load(file)
+    # Change the string keys back into tuples
+    return {name: {tuple(int(value) for value in pos.split(',')): value for pos, value in layer.items()}
+            for name, layer in layers.items()}
+
+
+def _measure(function, repeats):
+    """Get the best time of the function out of given repeats"""
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _pos_to_cell(pos):
+    """Convert position in pixels into the cell"""
+    return int(pos[0]) // settings.TILE_SIZE, int(pos[1]) // settings.TILE_SIZE
+
+
+def _align(offset, alignment=16):
+    """Align the offset up to the given alignment"""
+    return (offset + alignment - 1) // alignment * alignment
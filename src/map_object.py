@@ -1,6 +1,5 @@
 import pygame
 from pygame.math import Vector2 as vector
-from pygame.mouse import get_pos as mouse_pos
 
 from src.settings import settings
 
@@ -9,8 +8,6 @@ class MapObject(pygame.sprite.Sprite):
     """Object that can be moved freely on the map"""
     def __init__(self, pos, frames, tile_id, origin, group):
         """Initialize the map object"""
-        super().__init__(group)
-
         # Tile id
         self.tile_id = tile_id
 
@@ -18,27 +15,39 @@ class MapObject(pygame.sprite.Sprite):
         self.frames = frames
         self.frame = 0
 
-        # Image of the object and its rectangle, center it around given position
+        # Image of the object and its rectangle in the world, center it around given position on the screen
         self.image = self.frames[self.frame]
-        self.rect = self.image.get_rect(center=pos)
+        self.rect = self.image.get_rect(center=vector(pos) - origin)
 
-        # Distance to the map's origin
-        self.origin_distance = vector(self.rect.topleft) - origin
+        # Distance to the map's origin (the saved position, it doesn't change with animation frames)
+        self.origin_distance = vector(self.rect.topleft)
         # Mouse offset from the top left part of this object
         self.mouse_offset = vector()
 
         # Select flag
         self.selected = False
 
-    def update_pos(self, origin):
-        """Update position after panning"""
-        # Update the top left position of the item
-        self.rect.topleft = origin + self.origin_distance
+        # Size that fits every animation frame
+        self.max_size = (max(frame.get_width() for frame in frames),
+                         max(frame.get_height() for frame in frames))
+
+        # Add it to the groups once it has a position
+        super().__init__(group)
+
+    def place(self, pos):
+        """Place the object's top left at the position in the world"""
+        self.origin_distance = vector(pos)
+        self.rect.topleft = pos
+
+    def world_bounds(self):
+        """Get the rectangle in the world that the object covers with any of its frames"""
+        # Frames are anchored at their bottom middle, so leave space for all of them around the top left
+        return pygame.Rect(self.origin_distance, self.max_size).inflate(self.max_size)
 
-    def update(self, delta_time):
-        """Update the map object"""
+    def update(self, delta_time, origin, mouse_pos):
+        """Update the map object, following the mouse position while dragged"""
         self._animate(delta_time)
-        self.drag()
+        self.drag(origin, mouse_pos)
 
     def _animate(self, delta_time):
         """Animate the object"""
@@ -54,21 +63,22 @@ class MapObject(pygame.sprite.Sprite):
         # Update the object's rectangle, to stay always in the same position
         self.rect = self.image.get_rect(midbottom = self.rect.midbottom)
 
-    def drag(self):
+    def drag(self, origin, mouse_pos):
         """Drag the object"""
         if self.selected:
-            self.rect.topleft = mouse_pos() - self.mouse_offset
+            # Move it to the mouse position in the world
+            self.rect.topleft = vector(mouse_pos) - origin - self.mouse_offset
 
-    def prepare_drag(self):
+    def prepare_drag(self, origin, mouse_pos):
         """Prepare the object before dragging it"""
         # Make it selected
         self.selected = True
-        # Get the mouse offset from top left part of the object
-        self.mouse_offset = vector(mouse_pos()) - vector(self.rect.topleft)
+        # Get the mouse offset (in the world) from top left part of the object
+        self.mouse_offset = vector(mouse_pos) - origin - vector(self.rect.topleft)
 
-    def end_drag(self, origin):
+    def end_drag(self):
         """End the drag"""
         # Unselect the object
         self.selected = False
-        # Recalculate the distance to the map's origin
-        self.origin_distance = vector(self.rect.topleft) - origin
+        # Save the new distance to the map's origin
+        self.origin_distance = vector(self.rect.topleft)
@@ -1,24 +1,68 @@
-from src.sprites import AnimatedSprite
+import numpy
+
 from src.settings import settings
 
 
-class Particle(AnimatedSprite):
-    """Simple singular particle"""
-    def __init__(self, pos, assets, group):
-        """Initialize the particle"""
-        super().__init__(pos, assets, group)
+class ParticleSystem:
+    """Particles stored in arrays, animated and drawn all at once"""
+    def __init__(self, frames, limit=settings.PARTICLE_LIMIT):
+        """Initialize the particle system"""
+        # Animation frames of the particles
+        self.frames = frames
+
+        # Maximum amount of particles
+        self.limit = limit
+        # Top left positions and animation frames of the particles, only the first ones (amount of live ones) are used
+        self.x = numpy.zeros(limit)
+        self.y = numpy.zeros(limit)
+        self.frame = numpy.zeros(limit)
+
+        # Amount of live particles and the highest amount of them
+        self.live = 0
+        self.peak = 0
+
+    def emit(self, pos):
+        """Create a particle centered at the position, nothing is created if there are too many of them"""
+        if self.live >= self.limit:
+            return False
+
+        # Center the particle by its first frame
+        rect = self.frames[0].get_rect(center=pos)
+        self.x[self.live] = rect.x
+        self.y[self.live] = rect.y
+        self.frame[self.live] = 0
+
+        # Count it
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        return True
+
+    def update(self, delta_time):
+        """Animate the particles and remove the ones which animation ended"""
+        live = self.live
+        # Increase the frames
+        self.frame[:live] += settings.ANIMATION_SPEED * delta_time
+
+        # Move the particles that still play to the front
+        playing = self.frame[:live] < len(self.frames)
+        if not playing.all():
+            self.live = int(numpy.count_nonzero(playing))
+            self.x[:self.live] = self.x[:live][playing]
+            self.y[:self.live] = self.y[:live][playing]
+            self.frame[:self.live] = self.frame[:live][playing]
 
-        # Center the particle
-        self.rect = self.image.get_rect(center=pos)
+    def draw(self, surface, offset):
+        """Draw the particles, moved by the camera offset"""
+        live = self.live
+        if live:
+            # Get the positions on the screen and the current frames
+            screen_x = (self.x[:live] - offset[0]).astype(int).tolist()
+            screen_y = (self.y[:live] - offset[1]).astype(int).tolist()
+            frames = [self.frames[frame] for frame in self.frame[:live].astype(int).tolist()]
 
-    def animate(self, delta_time):
-        """Animate the particle and destroy the particle"""
-        # Increase the frame
-        self.frame += settings.ANIMATION_SPEED * delta_time
-        # Play the animation if it hasn't ended
-        if self.frame < len(self.frames):
-            self.image = self.frames[int(self.frame)]
+            # Blit them at once
+            surface.blits(zip(frames, zip(screen_x, screen_y)), False)
 
-        # Kill the particles when animation ends
-        else:
-            self.kill()
+    def stats(self):
+        """Get the particle counters"""
+        return {"live": self.live, "peak": self.peak, "limit": self.limit}
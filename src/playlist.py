@@ -0,0 +1,110 @@
+import os
+import queue
+import logging
+import threading
+import time
+
+from src.settings import settings
+from src import level_file
+from src.level import Level
+
+
+# Levels that couldn't be built are logged
+logger = logging.getLogger(__name__)
+
+
+def next_pack_path():
+    """Get path of a new level file placed at the end of the editor's level pack"""
+    directory = os.path.join(settings.BASE_PATH, settings.LEVEL_PACK_PATH)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{len(level_file.level_pack([directory])):03}{settings.LEVEL_EXTENSION}")
+
+
+class LevelLoader(threading.Thread):
+    """Background thread that decodes the requested level files into grids (the levels are built on the main thread,
+    their surfaces and sounds can't be made in another one)"""
+    def __init__(self):
+        """Initialize the loader"""
+        super().__init__(daemon=True)
+        # Requested paths and the decoded grids (or the errors raised while decoding them)
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+
+    def run(self):
+        """Decode the level files until stopped"""
+        while True:
+            # Wait for the request, None stops the loader
+            path = self.requests.get()
+            if path is None:
+                break
+
+            try:
+                self.results.put((path, level_file.load_playable_grid(path)))
+            except Exception as error:
+                self.results.put((path, error))
+
+    def stop(self):
+        """Stop the loader"""
+        self.requests.put(None)
+
+
+class Playlist:
+    """Levels of a pack played in order, the next file is decoded in the background while the current level runs"""
+    def __init__(self, paths, switch, finish, assets):
+        """Initialize the playlist and start building its first level"""
+        # Level files in the playing order and index of the current one
+        self.paths = list(paths)
+        self.index = -1
+
+        # Functions switching to the editor and going to the next level, given to the built levels
+        self.switch = switch
+        self.finish = finish
+        # Assets of the levels
+        self.assets = assets
+
+        # Milliseconds that the last move to the next level took (waiting for its file and building it included)
+        self.switch_time = 0
+
+        # Start decoding the first level file
+        self.loader = LevelLoader()
+        self.loader.start()
+        self._prefetch(0)
+
+    def advance(self):
+        """Build the next level and start it, waiting for its file if it isn't decoded yet, levels that can't be read
+        or built are skipped, None after the last level"""
+        start = time.perf_counter()
+
+        while True:
+            # Move to the next level, the pack is over after the last one
+            self.index += 1
+            if self.index >= len(self.paths):
+                self.stop()
+                return None
+
+            # Take the decoded grid and decode the file after it while this level runs
+            path, grid = self.loader.results.get()
+            self._prefetch(self.index + 1)
+
+            # Build the level, skip it if its file couldn't be read or built
+            try:
+                if isinstance(grid, Exception):
+                    raise grid
+                level = Level(grid, self.switch, self.assets, finish=self.finish)
+            except Exception as error:
+                logger.warning("Skipping %s, it can't be played (%s: %s)", path, type(error).__name__, error)
+                continue
+            level.start()
+            break
+
+        self.switch_time = (time.perf_counter() - start) * 1000
+        return level
+
+    def stop(self):
+        """Stop decoding the level files"""
+        self.loader.stop()
+
+    def _prefetch(self, index):
+        """Request decoding of the level file with the index, if there is one"""
+        if index < len(self.paths):
+            self.loader.requests.put(self.paths[index])
@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import logging
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from random import Random
+
+import numpy
+import pygame
+
+from src.settings import settings
+from src import level_file
+
+
+def reference_grid(width=200, rows=1, seed=0):
+    """Create a grid of a level with rows of ground, walls, coins, enemies and palms, the same one for the same seed"""
+    random = Random(seed)
+    tile = settings.TILE_SIZE
+    grid = level_file.empty_grid()
+
+    # Player and the horizon
+    grid["fg objects"][(3 * tile, 5 * tile)] = 0
+    grid["fg objects"][(0, 3 * tile)] = 1
+
+    # Every row is 10 tiles below the previous one
+    for x, y in ((x, row * 10) for row in range(rows) for x in range(width)):
+        # Ground, with some walls on it and shallow water pools in it
+        ground = (x * tile, (y + 7) * tile)
+        above = (x * tile, (y + 6) * tile)
+        if x < 5 or random.random() < 0.9:
+            grid["terrain"][ground] = "X"
+            if x > 5 and random.random() < 0.1:
+                grid["terrain"][above] = "X"
+        else:
+            grid["water"][ground] = "top"
+            grid["terrain"][(x * tile, (y + 8) * tile)] = "X"
+
+        # Coins in the air
+        if random.random() < 0.3:
+            grid["coins"][(x * tile + tile // 2, (y + 4) * tile + tile // 2)] = random.choice((4, 5, 6))
+
+        # Enemies and palms on the ground
+        if ground in grid["terrain"] and above not in grid["terrain"] and x > 5:
+            if random.random() < 0.2:
+                grid["enemies"][above] = random.choice((7, 8, 8, 9, 10))
+            elif random.random() < 0.1:
+                grid["fg objects"][(x * tile, (y + 5) * tile)] = random.choice((11, 12))
+            elif random.random() < 0.1:
+                grid["bg palms"][(x * tile, (y + 5) * tile)] = random.choice((15, 16))
+
+    return grid
+
+
+def measure_allocations(level, frames=120, delta_time=1 / 60):
+    """Simulate and draw the level, return the memory blocks kept and the bytes allocated at once per frame"""
+    # Let the level settle first, so caches and pools already exist
+    for frame in range(frames // 4):
+        level.run(delta_time)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = tracemalloc.get_traced_memory()[0]
+    peak = 0
+
+    for frame in range(frames):
+        # Memory allocated above the start of the frame, at its highest point
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        level.run(delta_time)
+        peak += tracemalloc.get_traced_memory()[1] - current
+
+    # Blocks still allocated after the frames, with the lines that allocated them
+    after = tracemalloc.take_snapshot()
+    growth = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    lines = [statistic for statistic in after.compare_to(before, "lineno") if statistic.count_diff > 0]
+
+    return {
+        "blocks": sum(statistic.count_diff for statistic in lines) / frames,
+        "bytes": growth / frames,
+        "peak": peak / frames,
+        "lines": [(str(statistic.traceback), statistic.count_diff) for statistic in lines[:10]],
+    }
+
+
+def benchmark_build(level_class, assets, cells=100000, seed=0):
+    """Build a level of about the amount of cells without streaming, return the amount of cells and the seconds"""
+    # Stack enough rows of the reference grid
+    width = 500
+    row_cells = sum(len(layer) for layer in reference_grid(width, 1, seed).values())
+    grid = reference_grid(width, -(-cells // row_cells), seed)
+
+    start = time.perf_counter()
+    level_class(grid, lambda *args: None, assets, streaming=False)
+    seconds = time.perf_counter() - start
+
+    return {"cells": sum(len(layer) for layer in grid.values()), "seconds": seconds}
+
+
+# Exports of the frame traces are logged
+logger = logging.getLogger(__name__)
+
+# Probe given out while the profiler is disabled, it does nothing
+NULL_PROBE = nullcontext()
+
+
+class Probe:
+    """Times one phase of the frame, adding it to the profiler"""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        """Initialize the probe"""
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        """Start timing the phase"""
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception):
+        """Stop timing the phase, add its time"""
+        self.profiler.add(self.name, self.start, time.perf_counter())
+
+
+class FrameProfiler:
+    """Times the phases of every frame and the sprite updates by their class, keeps the recent frames in ring buffers,
+    shows them as an overlay graph and exports them as a Chrome trace (chrome://tracing, Perfetto)"""
+    def __init__(self, frames=settings.PROFILER_FRAMES, trace_events=settings.PROFILER_TRACE_EVENTS):
+        """Initialize the profiler, disabled"""
+        # Enabled flag, disabled profiler gives out the probe that does nothing and shows nothing
+        self.enabled = False
+        # Probes of the phases by their name
+        self.probes = {}
+
+        # Milliseconds of the phases and of the sprite classes in the recent frames, the ring buffers are indexed by
+        # the frame's number modulo their size
+        self.frames = frames
+        self.phase_history = {}
+        self.class_history = {}
+        self.frame_history = numpy.zeros(frames)
+        # Amount of recorded frames
+        self.count = 0
+        # Milliseconds of the current frame
+        self.phase_times = {}
+        self.class_times = {}
+        # Start of the current frame, None until the first frame after enabling
+        self.frame_start = None
+
+        # Recent trace events as name, category, start and end (or counter values) and the start of the trace
+        self.events = deque(maxlen=trace_events)
+        self.origin = time.perf_counter()
+
+        # Graph and the legend surfaces, created once they are shown, and the amount of frames drawn into the graph
+        self.graph = None
+        self.drawn = 0
+        self.legend = None
+        self.font = None
+
+    def probe(self, name):
+        """Get the probe of the phase, to time it with the with statement"""
+        if not self.enabled:
+            return NULL_PROBE
+        probe = self.probes.get(name)
+        if probe is None:
+            probe = self.probes[name] = Probe(self, name)
+        return probe
+
+    def add(self, name, start, end):
+        """Add time of the phase (perf counter seconds) to the current frame"""
+        self.phase_times[name] = self.phase_times.get(name, 0) + (end - start) * 1000
+        self.events.append((name, "phase", start, end))
+
+    def update_sprites(self, sprites, *args):
+        """Update the sprites, timing the update of every one of them by its class while enabled"""
+        if not self.enabled:
+            for sprite in sprites:
+                sprite.update(*args)
+            return
+
+        class_times = self.class_times
+        for sprite in sprites:
+            start = time.perf_counter()
+            sprite.update(*args)
+            name = type(sprite).__name__
+            class_times[name] = class_times.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    def frame(self):
+        """End the current frame, move its times into the ring buffers"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        # First frame after enabling only starts the timing
+        if self.frame_start is None:
+            self.frame_start = now
+            self.phase_times.clear()
+            self.class_times.clear()
+            return
+
+        # Time of the frame that no probe covered
+        total = (now - self.frame_start) * 1000
+        self.phase_times["other"] = max(total - sum(self.phase_times.values()), 0)
+
+        # Save the times into the slot of the frame, phases and classes missing in this frame took nothing
+        slot = self.count % self.frames
+        self.frame_history[slot] = total
+        for history, times in ((self.phase_history, self.phase_times), (self.class_history, self.class_times)):
+            for name in times:
+                if name not in history:
+                    history[name] = numpy.zeros(self.frames)
+            for name, buffer in history.items():
+                buffer[slot] = times.get(name, 0)
+
+        # Trace the frame and the sprite classes as counters
+        self.events.append(("frame", "frame", self.frame_start, now))
+        if self.class_times:
+            self.events.append(("sprite updates", "counter", now, dict(self.class_times)))
+
+        self.count += 1
+        self.frame_start = now
+        self.phase_times.clear()
+        self.class_times.clear()
+
+    def toggle(self):
+        """Enable or disable the profiler and its overlay"""
+        self.enabled = not self.enabled
+        self.frame_start = None
+        self.phase_times.clear()
+        self.class_times.clear()
+
+    def handle_event(self, event):
+        """Toggle the profiler with F3, export its trace with F4"""
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_F3:
+                self.toggle()
+            elif event.key == pygame.K_F4:
+                self.export_trace()
+
+    def averages(self, history=None):
+        """Get the average milliseconds of the phases (or the history's entries) over the recorded frames"""
+        history = self.phase_history if history is None else history
+        frames = min(self.count, self.frames)
+        if not frames:
+            return {}
+        return {name: float(buffer.sum() / frames) for name, buffer in history.items()}
+
+    def export_trace(self, path=None):
+        """Save the recent trace events as Chrome trace event JSON, return path of the file"""
+        path = os.path.join(settings.BASE_PATH, path or settings.PROFILER_TRACE_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pid = os.getpid()
+
+        # Phases and frames are complete events, the sprite classes are counters (times in microseconds)
+        trace = []
+        for name, category, start, end in self.events:
+            if category == "counter":
+                trace.append({"name": name, "cat": category, "ph": "C", "ts": (start - self.origin) * 1e6,
+                              "pid": pid, "args": end})
+            else:
+                trace.append({"name": name, "cat": category, "ph": "X", "ts": (start - self.origin) * 1e6,
+                              "dur": (end - start) * 1e6, "pid": pid, "tid": 1 if category == "frame" else 0})
+
+        with open(path, "w") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+        logger.info("Frame trace of %d events saved into %s", len(trace), path)
+        return path
+
+    def display(self, surface=None):
+        """Draw the graph of the recent frames with the legend of the phases in the top-right corner"""
+        if not self.enabled:
+            return
+        with self.probe("overlay"):
+            surface = surface or pygame.display.get_surface()
+            if self.graph is None:
+                self.graph = pygame.Surface((self.frames, settings.PROFILER_GRAPH_HEIGHT))
+                self.graph.fill(settings.BG_COLOR)
+                self.font = pygame.font.Font(os.path.join(settings.BASE_PATH, settings.FONT), 10)
+
+            # Add the new frames to the graph and refresh the legend once in a while, so its text is readable
+            self._draw_graph()
+            if self.legend is None or self.count % settings.PROFILER_LEGEND_INTERVAL == 0:
+                self._render_legend()
+
+            # Both aligned to the right edge of the window
+            right = settings.WINDOW_WIDTH - 10
+            surface.blit(self.graph, (right - self.frames, 10))
+            surface.blit(self.legend, (right - self.legend.get_width(), 10 + settings.PROFILER_GRAPH_HEIGHT))
+
+    def _phase_order(self):
+        """Get the recorded phases in the drawing order"""
+        colors = settings.PROFILER_COLORS
+        known = [name for name in colors if name in self.phase_history]
+        return known + sorted(name for name in self.phase_history if name not in colors)
+
+    def _draw_graph(self):
+        """Scroll the graph left by the frames recorded since the last drawing, draw their columns on the right, with
+        the phases stacked on each other and the frame budget line"""
+        height = settings.PROFILER_GRAPH_HEIGHT
+        colors = settings.PROFILER_COLORS
+        order = self._phase_order()
+        # Pixels of one millisecond, the graph is two frame budgets high
+        scale = height / (2 * settings.FRAME_BUDGET)
+
+        # Only the last ring buffer's worth of the new frames is still there
+        new = min(self.count - self.drawn, self.frames)
+        self.graph.scroll(-new, 0)
+        for frame in range(self.count - new, self.count):
+            slot = frame % self.frames
+            x = self.frames - (self.count - frame)
+            pygame.draw.line(self.graph, settings.BG_COLOR, (x, 0), (x, height))
+
+            # Stack the phases from the bottom
+            bottom = height
+            for name in order:
+                top = bottom - self.phase_history[name][slot] * scale
+                if int(top) < int(bottom):
+                    pygame.draw.line(self.graph, colors.get(name, colors["other"]), (x, max(top, 0)), (x, bottom - 1))
+                bottom = top
+            self.graph.set_at((x, height // 2), settings.TEXT_COLOR)
+        self.drawn = self.count
+
+    def _render_legend(self):
+        """Render the average milliseconds of the phases and of the slowest sprite classes"""
+        colors = settings.PROFILER_COLORS
+        phases = self.averages()
+        classes = sorted(self.averages(self.class_history).items(), key=lambda item: item[1], reverse=True)[:5]
+        frame = float(self.frame_history.sum() / min(self.count, self.frames)) if self.count else 0
+
+        lines = [(f"frame {frame:.2f} ms", settings.TEXT_COLOR)]
+        lines += [(f"{name} {phases[name]:.2f}", colors.get(name, colors["other"])) for name in self._phase_order()]
+        lines += [(f"{name} {time:.2f}", settings.TEXT_COLOR) for name, time in classes]
+
+        # Two columns of the lines, wide enough for the longest one
+        texts = [self.font.render(text, False, color) for text, color in lines]
+        column = max(text.get_width() for text in texts) + 8
+        line_height = self.font.get_linesize()
+        rows = -(-len(texts) // 2)
+        self.legend = pygame.Surface((max(2 * column, self.frames), rows * line_height + 4))
+        self.legend.fill(settings.BG_COLOR)
+        for index, text in enumerate(texts):
+            self.legend.blit(text, (4 + index // rows * column, 2 + index % rows * line_height))
+
+
+profiler = FrameProfiler()
@@ -0,0 +1,66 @@
+import logging
+from collections import deque
+from itertools import islice
+
+from src.settings import settings
+
+
+# Tier changes are logged
+logger = logging.getLogger(__name__)
+
+
+class QualityGovernor:
+    """Steps the quality tier down when the frames take longer than the budget, and up when they fit well into it"""
+    def __init__(self, tiers=settings.QUALITY_TIERS, budget=settings.FRAME_BUDGET):
+        """Initialize the governor, starting at the highest tier"""
+        # Tiers from the lowest one, the current one and its index
+        self.tiers = tiers
+        self.index = len(tiers) - 1
+        self.tier = tiers[self.index]
+
+        # Frame time budget in milliseconds
+        self.budget = budget
+        # Recent frame times, enough of them to step the tier up
+        self.frame_times = deque(maxlen=settings.QUALITY_UP_FRAMES)
+
+        # Enabled flag, disabled governor keeps the current tier
+        self.enabled = True
+        # Tier changes, as the name of the old and new tier with the average frame time that caused it
+        self.changes = []
+
+    def record(self, frame_time):
+        """Save time of the frame (in milliseconds), step the tier if the recent frames need it"""
+        if not self.enabled:
+            return
+        self.frame_times.append(frame_time)
+
+        # Step down once the latest frames are over the budget
+        if self.index > 0 and len(self.frame_times) >= settings.QUALITY_DOWN_FRAMES:
+            average = (sum(islice(reversed(self.frame_times), settings.QUALITY_DOWN_FRAMES))
+                       / settings.QUALITY_DOWN_FRAMES)
+            if average > self.budget * settings.QUALITY_DOWN_THRESHOLD:
+                self.set_tier(self.index - 1, average)
+                return
+
+        # Step up once a longer run of frames was well within the budget
+        if self.index < len(self.tiers) - 1 and len(self.frame_times) == self.frame_times.maxlen:
+            average = sum(self.frame_times) / len(self.frame_times)
+            if average < self.budget * settings.QUALITY_UP_THRESHOLD:
+                self.set_tier(self.index + 1, average)
+
+    def set_tier(self, index, average=None):
+        """Change the tier, log it with the average frame time that caused it"""
+        if index == self.index:
+            return
+        old = self.tier
+        self.index = index
+        self.tier = self.tiers[index]
+        self.changes.append((old["name"], self.tier["name"], average))
+        logger.info("Quality %s -> %s (average frame %s ms, budget %.1f ms)", old["name"], self.tier["name"],
+                    "-" if average is None else f"{average:.1f}", self.budget)
+
+        # Frames of the old tier don't tell anything about the new one
+        self.frame_times.clear()
+
+
+governor = QualityGovernor()
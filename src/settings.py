@@ -18,6 +18,33 @@ class Settings:
         # File base absolute path
         self.BASE_PATH = os.path.abspath(os.path.dirname(__file__))
 
+        # Saved levels
+        self.LEVELS_PATH = "../levels"
+        self.LEVEL_FILE = "level"
+        self.LEVEL_EXTENSION = ".pml"
+        # Levels exported from the editor, played in order in the level pack mode
+        self.LEVEL_PACK_PATH = "../levels/pack"
+        # Size of one level file chunk in cells
+        self.LEVEL_CHUNK_SIZE = 32
+
+        # Editor's autosave directory, interval of the saves (in milliseconds) and the journal size that gets
+        # compacted into a snapshot (in bytes)
+        self.AUTOSAVE_PATH = "../levels/autosave"
+        self.AUTOSAVE_INTERVAL = 5000
+        self.AUTOSAVE_COMPACT_SIZE = 1024 * 1024
+
+        # Size of the water chunks in tiles, every chunk is drawn as one surface
+        self.WATER_CHUNK_SIZE = 8
+
+        # Store the coins, spikes, teeth and animated decorations of the levels in component arrays (entity world)
+        # instead of sprites, the streamed levels always use the sprites
+        self.ECS = False
+
+        # Levels with more placements than this are streamed in chunks around the player
+        self.STREAM_THRESHOLD = 20000
+        # Radius of the streamed chunks around the player
+        self.STREAM_RADIUS = 1
+
         # COLORS
         self.COLORS = {
             "SKY": "#DDC6A1",
@@ -94,6 +121,53 @@ class Settings:
                  "preview": "../graphics/preview/right_bg.png"},
         }
 
+        # Size of the buckets indexing the editor's objects
+        self.SPATIAL_CELL_SIZE = 256
+        # Size of the editor's pre-rendered map chunks in cells, and how many of them are cached
+        self.RENDER_CHUNK_SIZE = 8
+        self.RENDER_CACHE_LIMIT = 64
+
+        # Maximum amount of flying pearls and the time they fly (in seconds)
+        self.PEARL_LIMIT = 64
+        self.PEARL_DURATION = 6
+        # Maximum amount of particles
+        self.PARTICLE_LIMIT = 256
+
+        # Frame time budget of the quality governor (in milliseconds), the amount of frames it averages before
+        # stepping the quality down or up (up waits longer and needs a bigger margin, so tiers don't flip back and
+        # forth) and the parts of the budget that the averages have to cross
+        self.FRAME_BUDGET = 1000 / 60
+        self.QUALITY_DOWN_FRAMES = 60
+        self.QUALITY_UP_FRAMES = 240
+        self.QUALITY_DOWN_THRESHOLD = 1.15
+        self.QUALITY_UP_THRESHOLD = 0.7
+        # Quality tiers from the lowest one: maximum amount of clouds (None for no limit), milliseconds between the
+        # cloud spawns, seconds between the decoration animation updates (0 for every frame), maximum amount of
+        # particles, radius around the player in which enemies are updated (None for everywhere) and the horizon
+        # lines flag
+        self.QUALITY_TIERS = [
+            {"name": "low", "clouds": 8, "cloud_interval": 12000, "animation_step": 1 / 10, "particles": 16,
+             "activity_radius": self.WINDOW_WIDTH, "horizon": False},
+            {"name": "medium", "clouds": 20, "cloud_interval": 8000, "animation_step": 1 / 20, "particles": 64,
+             "activity_radius": 2 * self.WINDOW_WIDTH, "horizon": True},
+            {"name": "high", "clouds": None, "cloud_interval": 4000, "animation_step": 0,
+             "particles": self.PARTICLE_LIMIT, "activity_radius": None, "horizon": True},
+        ]
+
+        # Frame profiler: amount of frames kept for its graph, amount of trace events kept for the export, height of
+        # the graph in pixels (at two frame budgets), frames between the legend refreshes and the trace file
+        self.PROFILER_FRAMES = 240
+        self.PROFILER_TRACE_EVENTS = 200000
+        self.PROFILER_GRAPH_HEIGHT = 120
+        self.PROFILER_LEGEND_INTERVAL = 30
+        self.PROFILER_TRACE_PATH = "../levels/frame_trace.json"
+        # Colors of the profiled phases in the graph, in the drawing order (unlisted phases get the last one)
+        self.PROFILER_COLORS = {
+            "events": "#4E79A7", "update": "#F28E2B", "damage": "#E15759", "coins": "#EDC948", "draw": "#59A14F",
+            "ui": "#76B7B2", "transition": "#B07AA1", "map": "#9C755F", "lines": "#FF9DA7", "menu": "#BAB0AC",
+            "overlay": "#555555", "display": "#D37295", "other": "#888888",
+        }
+
         # Directions of the neighbor cells and their names
         self.NEIGHBOR_CELLS = {
             'A': (0, -1),
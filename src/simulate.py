@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pygame
+
+from src.settings import settings
+from src.utilities import utilities
+from src.level import Level
+from src.timer import scheduler
+from src import level_file
+
+
+# Level assets of this process, imported once the headless display exists
+assets = None
+
+
+def init_headless():
+    """Open a hidden window with the dummy video driver and the dummy (silent) audio driver, import the assets"""
+    global assets
+    if assets is not None:
+        return
+
+    # Drivers have to be chosen before pygame starts
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.init()
+    pygame.display.set_mode((settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT))
+
+    assets = utilities.import_level_assets()
+
+
+class ScriptedKeys:
+    """Pressed keys of the scripted input, read like the ones from the keyboard"""
+    def __init__(self, pressed):
+        """Initialize the keys"""
+        self.pressed = pressed
+
+    def __getitem__(self, key):
+        """Check if the key is pressed"""
+        return key in self.pressed
+
+
+def idle_script(rng):
+    """Input that never presses anything"""
+    keys = ScriptedKeys(set())
+    return lambda seconds: keys
+
+
+def run_right_script(rng):
+    """Input that runs right, jumping for 0.3 seconds every 1.3 seconds"""
+    run = ScriptedKeys({pygame.K_RIGHT})
+    jump = ScriptedKeys({pygame.K_RIGHT, pygame.K_UP})
+    return lambda seconds: jump if seconds % 1.3 < 0.3 else run
+
+
+def wander_script(rng):
+    """Input that changes the direction at random times, mostly going right, and jumps at random"""
+    state = {"until": 0, "keys": None}
+
+    def controls(seconds):
+        # Choose the next move once the current one is over
+        if seconds >= state["until"]:
+            direction = rng.choice((pygame.K_RIGHT, pygame.K_RIGHT, pygame.K_LEFT, None))
+            jump = rng.random() < 0.5
+            state["keys"] = ScriptedKeys({key for key in (direction, pygame.K_UP if jump else None) if key})
+            state["until"] = seconds + rng.uniform(0.2, 1.5)
+        return state["keys"]
+    return controls
+
+
+# Input scripts by their name, each one creates the controls from a random generator
+SCRIPTS = {"idle": idle_script, "run_right": run_right_script, "wander": wander_script}
+
+
+def simulate(path, script="run_right", steps=3600, delta_time=1 / 60, seed=0, draw=False, ecs=settings.ECS):
+    """Run the level file without a window, faster than real time, with the scripted input, until the player dies,
+    falls out of the level, finishes it or the steps run out, get the outcome (an error if it can't be played), the
+    ecs flag stores the simple entities in the entity world"""
+    init_headless()
+
+    # Save the outcome when the level ends
+    result = {"path": path, "script": script, "seed": seed, "outcome": "timeout"}
+
+    def end(outcome):
+        result["outcome"] = outcome
+
+    # Editor's maps and levels without the player can't be played
+    try:
+        grid = level_file.load_playable_grid(path)
+    except (OSError, ValueError) as error:
+        return {**result, "outcome": "error", "error": f"{type(error).__name__}: {error}"}
+
+    # Same seed gives the same run, even after other runs in the same process (the timers follow the scheduler,
+    # which could be left moved, paused, slowed down or with pending calls)
+    random.seed(seed)
+    numpy.random.seed(seed)
+    scheduler.reset()
+
+    level = Level(grid, lambda *args: end("death"), assets, ecs=ecs, finish=lambda: end("finish"))
+    level.start()
+    # Player falling a screen below the lowest placement never comes back
+    bottom = max(pos[1] for layer in grid.values() for pos in layer) + settings.WINDOW_HEIGHT
+
+    # Replace the keyboard with the script, which follows the simulated time
+    controls = SCRIPTS[script](random.Random(seed))
+    step = 0
+    level.player.controls = lambda: controls(step * delta_time)
+
+    # Step the level with the fixed time, without showing anything
+    start = time.perf_counter()
+    while step < steps and result["outcome"] == "timeout":
+        scheduler.tick(delta_time * 1000)
+        level.run(delta_time, draw)
+        step += 1
+        if result["outcome"] == "timeout" and level.player.rect.top > bottom:
+            end("fall")
+    seconds = time.perf_counter() - start
+
+    # Stop the level if it's still running
+    if result["outcome"] in ("timeout", "fall"):
+        level.stop()
+
+    result.update({
+        "steps": step,
+        "time": step * delta_time,
+        "coins": level.player.coins,
+        "health": level.player.health,
+        "position": list(level.player.rect.center),
+        "steps_per_second": step / seconds if seconds else 0,
+    })
+    return result
+
+
+def _simulate_job(job):
+    """Run one simulation (worker process), errors are reported instead of raised"""
+    try:
+        return simulate(**job)
+    except Exception as error:
+        return {**job, "outcome": "error", "error": f"{type(error).__name__}: {error}"}
+
+
+def simulate_many(jobs, workers=None):
+    """Run the simulations (keyword arguments of simulate) in a pool of processes, get their results in order"""
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as executor:
+        return list(executor.map(_simulate_job, jobs))
+
+
+def summarize(results):
+    """Count the outcomes and get the average speed of the simulations"""
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    finished = [result for result in results if "steps_per_second" in result]
+
+    return {
+        "runs": len(results),
+        "outcomes": outcomes,
+        "steps": sum(result["steps"] for result in finished),
+        "steps_per_second": (sum(result["steps_per_second"] for result in finished) / len(finished)
+                             if finished else 0),
+    }
+
+
+def main(arguments=None):
+    """Simulate the level files given on the command line, return the exit code"""
+    parser = argparse.ArgumentParser(prog="python -m src.simulate",
+                                     description="Run levels headless and faster than real time")
+    parser.add_argument("paths", nargs="+", help="level files and directories of them")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="run_right", help="scripted input")
+    parser.add_argument("--runs", type=int, default=1, help="runs of every level, each with its own seed")
+    parser.add_argument("--steps", type=int, default=3600, help="maximum amount of steps of a run")
+    parser.add_argument("--delta-time", type=float, default=1 / 60, help="seconds of one step")
+    parser.add_argument("--draw", action="store_true", help="draw every step too (into the hidden window)")
+    parser.add_argument("--ecs", action="store_true", default=settings.ECS,
+                        help="store the simple entities in component arrays instead of sprites")
+    parser.add_argument("--workers", type=int, default=None, help="amount of worker processes")
+    parser.add_argument("--json", help="also save the results and the summary into this JSON file")
+    options = parser.parse_args(arguments)
+
+    jobs = [{"path": path, "script": options.script, "steps": options.steps, "delta_time": options.delta_time,
+             "seed": seed, "draw": options.draw, "ecs": options.ecs}
+            for path in level_file.level_pack(options.paths) for seed in range(options.runs)]
+    results = simulate_many(jobs, options.workers)
+    summary = summarize(results)
+
+    for result in results:
+        if result["outcome"] == "error":
+            print(f"{result['path']} (seed {result['seed']}): ERROR {result['error']}")
+        else:
+            print(f"{result['path']} (seed {result['seed']}): {result['outcome']} after {result['time']:.1f} s, "
+                  f"{result['coins']} coins, {result['health']} health, {result['steps_per_second']:.0f} steps/s")
+    outcomes = ", ".join(f"{outcome} {count}" for outcome, count in summary["outcomes"].items())
+    print(f"{summary['runs']} runs, {outcomes}, {summary['steps_per_second']:.0f} steps/s on average")
+
+    if options.json:
+        with open(options.json, "w") as file:
+            json.dump({"summary": summary, "runs": results}, file, indent=2)
+
+    # Fail if any run couldn't finish
+    return 1 if "error" in summary["outcomes"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import pygame
+
+from src.settings import settings
+
+
+class SpatialGroup(pygame.sprite.Group):
+    """Group of map objects, indexed in a grid of buckets by their position in the world"""
+    def __init__(self, cell_size=settings.SPATIAL_CELL_SIZE):
+        """Initialize the group"""
+        super().__init__()
+        # Size of one bucket in pixels
+        self.cell_size = cell_size
+
+        # Sprites in every bucket
+        self.buckets = {}
+        # Buckets of every sprite
+        self.sprite_buckets = {}
+        # Order of adding, so queries return sprites in the same order as iterating the group
+        self.order = {}
+        self.counter = 0
+
+    def add_internal(self, sprite, layer=None):
+        """Add the sprite and index it"""
+        super().add_internal(sprite, layer)
+        # Save when it was added
+        self.counter += 1
+        self.order[sprite] = self.counter
+        self._index(sprite)
+
+    def remove_internal(self, sprite):
+        """Remove the sprite from the group and the index"""
+        super().remove_internal(sprite)
+        self._unindex(sprite)
+        del self.order[sprite]
+
+    def reindex(self, sprite):
+        """Update the index after the sprite moved"""
+        self._unindex(sprite)
+        self._index(sprite)
+
+    def query_point(self, point):
+        """Get sprites which world bounds contain the point"""
+        bucket = self.buckets.get((int(point[0]) // self.cell_size, int(point[1]) // self.cell_size), ())
+        return sorted((sprite for sprite in bucket if sprite.world_bounds().collidepoint(point)),
+                      key=self.order.get)
+
+    def query_rect(self, rect):
+        """Get sprites which world bounds overlap the rectangle"""
+        found = set()
+        for bucket_pos in self._bucket_positions(rect):
+            found.update(sprite for sprite in self.buckets.get(bucket_pos, ())
+                         if sprite.world_bounds().colliderect(rect))
+        return sorted(found, key=self.order.get)
+
+    def _index(self, sprite):
+        """Put the sprite into the buckets that its bounds overlap"""
+        bucket_positions = self._bucket_positions(sprite.world_bounds())
+        self.sprite_buckets[sprite] = bucket_positions
+        for bucket_pos in bucket_positions:
+            self.buckets.setdefault(bucket_pos, set()).add(sprite)
+
+    def _unindex(self, sprite):
+        """Take the sprite out of its buckets"""
+        for bucket_pos in self.sprite_buckets.pop(sprite, ()):
+            bucket = self.buckets[bucket_pos]
+            bucket.discard(sprite)
+            # Forget the empty buckets
+            if not bucket:
+                del self.buckets[bucket_pos]
+
+    def _bucket_positions(self, rect):
+        """Get positions of the buckets that the rectangle overlaps"""
+        return [(column, row)
+                for column in range(rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1)
+                for row in range(rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1)]
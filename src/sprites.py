@@ -1,10 +1,9 @@
-from random import randint
-
 import pygame
 from pygame.math import Vector2 as vector
 
 from src.settings import settings
 from src.timer import Timer
+from src.utilities import utilities
 
 
 class GenericSprite(pygame.sprite.Sprite):
@@ -25,8 +24,16 @@ class Player(GenericSprite):
     """Game's player"""
     def __init__(self, pos, assets, group, collision_sprites, jump_sound):
         """Initialize the player"""
-        # Animation variables
-        self.frames = assets
+        # Animation frames by the state and orientation, with their masks and invincibility images, made once
+        self.frames = {}
+        self.masks = {}
+        self.dodge_frames = {}
+        for name, frames in assets.items():
+            state, orientation = name.rsplit("_", 1)
+            masks = utilities.frame_masks(frames)
+            self.frames.setdefault(state, {})[orientation] = frames
+            self.masks.setdefault(state, {})[orientation] = masks
+            self.dodge_frames.setdefault(state, {})[orientation] = [self._dodge_frame(mask) for mask in masks]
         self.frame = 0
         # Player's current state
         self.state = "idle"
@@ -34,12 +41,12 @@ class Player(GenericSprite):
         self.orientation = "right"
 
         # Get the player's current animation image based off the state and orientation
-        surface = self.frames[f"{self.state}_{self.orientation}"][self.frame]
+        surface = self.frames[self.state][self.orientation][self.frame]
         # Initialize the parent class with it
         super().__init__(pos, surface, group)
 
-        # Create mask
-        self.mask = pygame.mask.from_surface(self.image)
+        # Get the mask
+        self.mask = self.masks[self.state][self.orientation][self.frame]
 
         # Player's health
         self.health = 6
@@ -48,6 +55,8 @@ class Player(GenericSprite):
 
         # Player's jump sound
         self.jump_sound = jump_sound
+        # Function getting the pressed keys instead of the keyboard, for the scripted input
+        self.controls = None
 
         # Player's direction
         self.direction = vector()
@@ -65,6 +74,10 @@ class Player(GenericSprite):
         self.collision_sprites = collision_sprites
         # Player's hitboxes
         self.hitbox = self.rect.inflate(-50, 0)
+        # Area that the hitbox passes through in one move
+        self.sweep = self.hitbox.copy()
+        # Area under the hitbox, checked for the floor
+        self.floor_rect = pygame.Rect(0, 0, self.hitbox.width, 2)
 
         # Player's invincibility time
         self.dodge_time = Timer(500)
@@ -76,9 +89,6 @@ class Player(GenericSprite):
         # Apply gravity to the player
         self._apply_gravity(delta_time)
 
-        # Update the invincibility timer
-        self.dodge_time.update()
-
         # Let the player move
         self._move(delta_time)
         # Save the floor if player is standing on one
@@ -92,7 +102,7 @@ class Player(GenericSprite):
     def _input(self):
         """Check and handle the input"""
         # Get the pressed keys
-        keys = pygame.key.get_pressed()
+        keys = self.controls() if self.controls else pygame.key.get_pressed()
 
         # If player pressed right or D, set his direction to right
         if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
@@ -116,7 +126,9 @@ class Player(GenericSprite):
             self.jump_sound.play()
 
     def _move(self, delta_time):
-        """Move the player"""
+        """Move the player, sweeping his hitbox along the way, so long frames don't let him pass through colliders"""
+        # Save where the hitbox starts horizontally
+        start = self.hitbox.left
         # Update player's horizontal position
         self.pos.x += self.direction.x * self.speed * delta_time
         # Move the hitboxes, round for float precision
@@ -125,52 +137,81 @@ class Player(GenericSprite):
         self.rect.centerx = self.hitbox.centerx
 
         # Check for horizontal collisions
-        self._collision("horizontal")
+        self._collision("horizontal", start)
 
         # Handle player's vertical movement
+        start = self.hitbox.top
         self.pos.y += self.direction.y * self.speed * delta_time
         self.hitbox.centery = round(self.pos.y)
         self.rect.centery = self.hitbox.centery
 
         # Check for vertical collisions
-        self._collision("vertical")
+        self._collision("vertical", start)
+
+    def _collision(self, direction, start):
+        """Check for collisions along the hitbox's path from the start position and stop at the first one"""
+        # Cover the entire path of the hitbox in the moved direction
+        self.sweep.update(self.hitbox)
+        if direction == "horizontal":
+            self.sweep.width += abs(self.hitbox.left - start)
+            self.sweep.left = min(self.hitbox.left, start)
+        else:
+            self.sweep.height += abs(self.hitbox.top - start)
+            self.sweep.top = min(self.hitbox.top, start)
 
-    def _collision(self, direction):
-        """Check for collisions and handle them"""
-        # Check all the collisions sprites
+        # Find the first collider on the path, in the moved direction
+        edge = None
         for sprite in self.collision_sprites:
-            # Find out if player collides with this sprite
-            if sprite.rect.colliderect(self.hitbox):
-                # If he collides in horizontal direction, handle it
+            if sprite.rect.colliderect(self.sweep):
                 if direction == "horizontal":
-                    # If player was moving right, hug him to the left part of collider
+                    # Left side of the first collider on the right, or right side of the first one on the left
                     if self.direction.x > 0:
-                        self.hitbox.right = sprite.rect.left
-                    # If player was moving left, hug him to the right side
+                        edge = sprite.rect.left if edge is None else min(edge, sprite.rect.left)
                     elif self.direction.x < 0:
-                        self.hitbox.left = sprite.rect.right
-
-                    # Update player's rectangle based off hitboxes
-                    self.rect.centerx = self.hitbox.centerx
-                    # Update player's position
-                    self.pos.x = self.hitbox.centerx
-
-                # Handle vertical collisions
+                        edge = sprite.rect.right if edge is None else max(edge, sprite.rect.right)
+                    else:
+                        edge = self.hitbox.left
                 else:
-                    # If player moved up, don't allow him to pass through the top block
+                    # Bottom side of the first collider above, or top side of the first one below
                     if self.direction.y < 0:
-                        self.hitbox.top = sprite.rect.bottom
-                    # If player was falling, place him on the ground
-                    if self.direction.y > 0:
-                        self.hitbox.bottom = sprite.rect.top
+                        edge = sprite.rect.bottom if edge is None else max(edge, sprite.rect.bottom)
+                    elif self.direction.y > 0:
+                        edge = sprite.rect.top if edge is None else min(edge, sprite.rect.top)
+                    else:
+                        edge = self.hitbox.top
+        if edge is None:
+            return
+
+        # If he collides in horizontal direction, handle it
+        if direction == "horizontal":
+            # If player was moving right, hug him to the left part of the collider
+            if self.direction.x > 0:
+                self.hitbox.right = edge
+            # If player was moving left, hug him to the right side of it
+            elif self.direction.x < 0:
+                self.hitbox.left = edge
+
+            # Update player's rectangle based off hitboxes
+            self.rect.centerx = self.hitbox.centerx
+            # Update player's position
+            self.pos.x = self.hitbox.centerx
+
+        # Handle vertical collisions
+        else:
+            # If player moved up, don't allow him to pass through the block above
+            if self.direction.y < 0:
+                self.hitbox.top = edge
+            # If player was falling, place him on the ground below
+            if self.direction.y > 0:
+                self.hitbox.bottom = edge
 
-                    # Update rectangle based off hitboxes
-                    self.rect.centery = self.hitbox.centery
-                    # Update the position
-                    self.pos.y = self.hitbox.centery
+            # Update rectangle based off hitboxes
+            self.rect.centery = self.hitbox.centery
+            # Update the position
+            self.pos.y = self.hitbox.centery
 
-                    # Reset the gravity force applied to the player
-                    self.direction.y = 0
+            # Reset the gravity force applied to the player
+            self.direction.y = 0
 
     def _apply_gravity(self, delta_time):
         """Apply gravity to the player"""
@@ -181,18 +222,21 @@ class Player(GenericSprite):
 
     def _check_floor(self):
         """Check if player is on the floor"""
-        # Get the floor rect of player (bottom part of him)
-        floor_rect = pygame.Rect(self.hitbox.bottomleft, (self.hitbox.width, 2))
+        # Move the floor rect under the player (bottom part of him)
+        self.floor_rect.left = self.hitbox.left
+        self.floor_rect.top = self.hitbox.bottom
 
-        # Get all the collision sprites, that he is on
-        floor_sprites = [sprite for sprite in self.collision_sprites if sprite.rect.colliderect(floor_rect)]
-        # Set the floor flag if there was any floor collision
-        self.floor = True if floor_sprites else False
+        # Set the floor flag if he is on any of the collision sprites
+        self.floor = False
+        for sprite in self.collision_sprites:
+            if sprite.rect.colliderect(self.floor_rect):
+                self.floor = True
+                break
 
     def _animate(self, delta_time):
         """Animate the player"""
         # Get the current state animation frames
-        frames = self.frames[f"{self.state}_{self.orientation}"]
+        frames = self.frames[self.state][self.orientation]
 
         # Increase the current frame
         self.frame += settings.ANIMATION_SPEED * delta_time
@@ -201,17 +245,19 @@ class Player(GenericSprite):
         if self.frame >= len(frames):
             self.frame = 0
 
-        # Update the current image
+        # Update the current image and its mask
         self.image = frames[int(self.frame)]
+        self.mask = self.masks[self.state][self.orientation][int(self.frame)]
 
-        # Update the mask
-        self.mask = pygame.mask.from_surface(self.image)
-
-        # If player is invincible
+        # If player is invincible, show his silhouette
         if self.dodge_time.active:
-            surface = self.mask.to_surface()
-            surface.set_colorkey("black")
-            self.image = surface
+            self.image = self.dodge_frames[self.state][self.orientation][int(self.frame)]
+
+    def _dodge_frame(self, mask):
+        """Create the invincibility image of the frame from its mask"""
+        surface = mask.to_surface()
+        surface.set_colorkey("black")
+        return surface
 
     def _update_state(self):
         """Get the state that player's in"""
@@ -290,27 +336,3 @@ class Coin(AnimatedSprite):
 
         # Update the rectangle to proper position (center)
         self.rect = self.image.get_rect(center=pos)
-
-
-class Cloud(GenericSprite):
-    """Cloud class"""
-    def __init__(self, pos, surface, group, dead_zone):
-        """Initialize the cloud"""
-        super().__init__(pos, surface, group, settings.LAYERS_DEPTH["clouds"])
-
-        # Cloud's position and a random speed
-        self.pos = vector(self.rect.topleft)
-        self.speed = randint(20, 30)
-
-        # Dead zone of clouds
-        self.dead_zone = dead_zone
-
-    def update(self, delta_time):
-        """Update the cloud"""
-        # Update cloud's horizontal position
-        self.pos.x -= self.speed * delta_time
-        self.rect.x = round(self.pos.x)
-
-        # Destroy the cloud if it's in the dead zone
-        if self.rect.x <= self.dead_zone:
-            self.kill()
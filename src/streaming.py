@@ -0,0 +1,296 @@
+import queue
+import threading
+
+import pygame
+
+from src.settings import settings
+from src import level_file
+from src.sprites import Coin
+from src.enemies import Tooth, set_patrols
+
+
+# IDs of the coins by their type
+COIN_IDS = {"gold": 4, "silver": 5, "diamond": 6}
+# ID of the tooth enemy
+TOOTH_ID = 8
+
+
+def split_grid(grid, chunk_pixels):
+    """Split the grid into the global part (player and horizon) and chunk grids, get the right-most terrain tile"""
+    global_grid = level_file.empty_grid()
+    chunks = {}
+    right = 0
+
+    # Go through every placement of every layer
+    for layer_name, layer in grid.items():
+        for pos, data in layer.items():
+            # Player and the horizon always exist
+            if layer_name == "fg objects" and data in (0, 1):
+                global_grid[layer_name][pos] = data
+            # Everything else goes into its chunk
+            else:
+                chunk_pos = (int(pos[0]) // chunk_pixels, int(pos[1]) // chunk_pixels)
+                if chunk_pos not in chunks:
+                    chunks[chunk_pos] = level_file.empty_grid()
+                chunks[chunk_pos][layer_name][pos] = data
+
+                # Save the right-most terrain tile
+                if layer_name == "terrain" and pos[0] > right:
+                    right = pos[0]
+
+    return global_grid, chunks, right
+
+
+class GridChunks:
+    """Chunk source made from the level grid"""
+    def __init__(self, grid):
+        """Initialize the source"""
+        # Size of the chunk in pixels
+        self.chunk_pixels = settings.LEVEL_CHUNK_SIZE * settings.TILE_SIZE
+        # Split the grid into chunks, save the right-most terrain tile
+        self.global_grid, self.chunks, self.right = split_grid(grid, self.chunk_pixels)
+
+    def positions(self):
+        """Get positions of all the chunks"""
+        return set(self.chunks)
+
+    def read(self, chunk_pos):
+        """Read the chunk's grid"""
+        return {name: dict(layer) for name, layer in self.chunks[chunk_pos].items()}
+
+
+class FileChunks:
+    """Chunk source reading a level file, only the requested chunks get decoded"""
+    def __init__(self, path):
+        """Open the level file"""
+        self.file = level_file.LevelFile(path)
+        # Size of the chunk in pixels
+        self.chunk_pixels = self.file.chunk_size * settings.TILE_SIZE
+
+        # Objects are kept in one table, split them between the chunks
+        global_level = level_file.LevelData("grid")
+        global_level.set_objects([obj for obj in self.file.objects.tolist() if obj[2] in (0, 1)])
+        self.global_grid = level_file.level_to_grid(global_level)
+        self.objects = {}
+        for obj in self.file.objects.tolist():
+            if obj[2] not in (0, 1):
+                chunk_pos = (obj[0] // self.chunk_pixels, obj[1] // self.chunk_pixels)
+                self.objects.setdefault(chunk_pos, []).append(obj)
+
+    def positions(self):
+        """Get positions of all the chunks"""
+        return self.file.chunk_positions() | set(self.objects)
+
+    def read(self, chunk_pos):
+        """Decode the chunk's grid"""
+        level = self.file.read_chunks({chunk_pos})
+        level.set_objects(self.objects.get(chunk_pos, []))
+        return level_file.level_to_grid(level)
+
+    def close(self):
+        """Close the level file"""
+        self.file.close()
+
+
+class ChunkReader(threading.Thread):
+    """Background thread that reads the requested chunks from the source"""
+    def __init__(self, source):
+        """Initialize the reader"""
+        super().__init__(daemon=True)
+        # Source of the chunks
+        self.source = source
+
+        # Requested chunk positions and the chunks that were read
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+
+    def run(self):
+        """Read the chunks until stopped"""
+        while True:
+            # Wait for the request, None stops the reader
+            chunk_pos = self.requests.get()
+            if chunk_pos is None:
+                break
+
+            self.results.put((chunk_pos, self.source.read(chunk_pos)))
+
+    def stop(self):
+        """Stop the reader"""
+        self.requests.put(None)
+
+
+class LoadedChunk:
+    """Chunk that has its sprites created"""
+    def __init__(self, grid):
+        """Initialize the loaded chunk"""
+        # Every sprite created for this chunk
+        self.group = pygame.sprite.Group()
+        # Grid of the chunk, coins and teeth get saved from the sprites on eviction
+        self.grid = grid
+        # Teeth that couldn't spawn yet (the ground under them might be in a chunk that isn't loaded)
+        self.unspawned = {}
+
+
+class LevelStreamer:
+    """Creates sprites of the chunks near the player and evicts the distant ones"""
+    def __init__(self, level, source, assets, radius=settings.STREAM_RADIUS):
+        """Initialize the level streamer"""
+        # Level that the sprites are created in, with its assets
+        self.level = level
+        self.assets = assets
+
+        # Source of the chunks and the size of them
+        self.source = source
+        self.chunk_pixels = source.chunk_pixels
+        # Every existing chunk
+        self.positions = source.positions()
+        # Radius of the loaded chunks around the player
+        self.radius = radius
+
+        # Evicted chunks, stored as grids
+        self.storage = {}
+        # Chunks with created sprites
+        self.loaded = {}
+        # Chunks that were requested from the reader
+        self.pending = set()
+        # Directions of the teeth, saved on eviction
+        self.directions = {}
+
+        # Start the background reader
+        self.reader = ChunkReader(source)
+        self.reader.start()
+
+    def update(self, center, wait=False):
+        """Load the chunks near the center and evict the distant ones"""
+        # Get the chunk in the center
+        center_x = int(center[0]) // self.chunk_pixels
+        center_y = int(center[1]) // self.chunk_pixels
+
+        # Get the needed chunks
+        needed = {(column, row)
+                  for column in range(center_x - self.radius, center_x + self.radius + 1)
+                  for row in range(center_y - self.radius, center_y + self.radius + 1)
+                  if (column, row) in self.positions}
+
+        # Chunks ready to be loaded
+        ready = {}
+        # Go through the missing chunks
+        for chunk_pos in needed - self.loaded.keys() - self.pending:
+            # Evicted chunks are already decoded
+            if chunk_pos in self.storage:
+                ready[chunk_pos] = self.storage.pop(chunk_pos)
+            # Otherwise request them from the reader
+            else:
+                self.pending.add(chunk_pos)
+                self.reader.requests.put(chunk_pos)
+
+        # Take the chunks that were read, wait for all of them if needed
+        while self.pending and (wait or not self.reader.results.empty()):
+            chunk_pos, grid = self.reader.results.get()
+            self.pending.discard(chunk_pos)
+            ready[chunk_pos] = grid
+
+        # Create the sprites of ready chunks
+        if ready:
+            self._load(ready)
+
+        # Evict the chunks out of the radius (with one more chunk, to not load and evict on the border)
+        evicted = False
+        for chunk_pos in list(self.loaded):
+            if max(abs(chunk_pos[0] - center_x), abs(chunk_pos[1] - center_y)) > self.radius + 1:
+                self._evict(chunk_pos)
+                evicted = True
+
+        # The floors might continue in the loaded chunks or end in the evicted ones, update patrols of the teeth
+        if ready or evicted:
+            set_patrols([sprite for chunk in self.loaded.values() for sprite in chunk.group
+                         if isinstance(sprite, Tooth)], self.level.collision_sprites)
+
+    def stop(self):
+        """Stop the background reader and close the source"""
+        self.reader.stop()
+        self.reader.join()
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+    def _load(self, ready):
+        """Create the sprites of the ready chunks"""
+        # Build the lower chunks first, so teeth have the ground created under them
+        for chunk_pos in sorted(ready, key=lambda pos: -pos[1]):
+            grid = ready[chunk_pos]
+            chunk = LoadedChunk(grid)
+            self.loaded[chunk_pos] = chunk
+
+            # Create the sprites
+            self.level._build_level(grid, self.assets, chunk.group)
+            # Save the teeth that didn't spawn
+            self._check_teeth(chunk, grid["enemies"])
+
+        # Try to spawn the teeth again, if the chunk under them got loaded now
+        for chunk_pos, chunk in self.loaded.items():
+            if chunk.unspawned and chunk_pos not in ready and (chunk_pos[0], chunk_pos[1] + 1) in ready:
+                grid = level_file.empty_grid()
+                grid["enemies"] = chunk.unspawned
+                self.level._build_level(grid, self.assets, chunk.group)
+                self._check_teeth(chunk, grid["enemies"])
+
+        # New sprites were added after the others, draw them in the depth order again (so they aren't over the player)
+        self.level.sprites.sort_sprites()
+
+    def _check_teeth(self, chunk, enemies):
+        """Save the teeth that didn't spawn and restore directions of the ones that did"""
+        # Get positions of the spawned teeth
+        spawned = {}
+        for sprite in chunk.group:
+            if isinstance(sprite, Tooth):
+                spawned[(sprite.rect.x, sprite.rect.bottom - settings.TILE_SIZE)] = sprite
+
+        # Go through every tooth that should spawn
+        chunk.unspawned = {}
+        for pos, enemy in enemies.items():
+            if enemy == TOOTH_ID:
+                tooth = spawned.get(pos)
+                # If it didn't spawn, remember it
+                if not tooth:
+                    chunk.unspawned[pos] = enemy
+                # Otherwise bring back its direction
+                elif pos in self.directions:
+                    tooth.direction.x = self.directions.pop(pos)
+                    tooth.orientation = "left" if tooth.direction.x < 0 else "right"
+
+    def _evict(self, chunk_pos):
+        """Save state of the chunk and destroy its sprites"""
+        chunk = self.loaded.pop(chunk_pos)
+
+        # Keep everything static, coins and teeth get saved from their sprites
+        grid = chunk.grid
+        grid["coins"] = {}
+        grid["enemies"] = {pos: enemy for pos, enemy in grid["enemies"].items() if enemy != TOOTH_ID}
+        grid["enemies"].update(chunk.unspawned)
+
+        # Go through every sprite of the chunk
+        for sprite in chunk.group.sprites():
+            # Save coins that weren't collected
+            if isinstance(sprite, Coin):
+                grid["coins"][sprite.rect.center] = COIN_IDS[sprite.coin_type]
+
+            # Save the teeth where they moved
+            elif isinstance(sprite, Tooth):
+                # If the tooth walked into another loaded chunk, give it to that chunk
+                current_chunk = (sprite.rect.centerx // self.chunk_pixels,
+                                 sprite.rect.centery // self.chunk_pixels)
+                if current_chunk != chunk_pos and current_chunk in self.loaded:
+                    chunk.group.remove(sprite)
+                    self.loaded[current_chunk].group.add(sprite)
+                    continue
+
+                # Save position (the one it was created with) and direction of it
+                pos = (sprite.rect.x, sprite.rect.bottom - settings.TILE_SIZE)
+                grid["enemies"][pos] = TOOTH_ID
+                self.directions[pos] = sprite.direction.x
+
+            # Destroy the sprite
+            sprite.kill()
+
+        # Store the chunk
+        self.storage[chunk_pos] = grid
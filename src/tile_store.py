@@ -0,0 +1,371 @@
+import sys
+import time
+
+import numpy
+
+from src.settings import settings
+from src.map_tile import MapTile
+from src import autotile
+
+
+# Styles of the items by their ID
+STYLES = {item_id: item["style"] for item_id, item in settings.EDITOR_INFO.items()}
+
+# Layers of a chunk, in order of their arrays
+LAYERS = ("terrain", "water", "coin", "enemy", "mask", "water_top")
+# Layers that are placed by the user
+TILE_LAYERS = ("terrain", "water", "coin", "enemy")
+
+
+class TileChunk:
+    """Square part of the map, each layer is an array of the cells"""
+    def __init__(self, size):
+        """Initialize the chunk"""
+        # All the layers in one block of memory
+        self.data = numpy.zeros((len(LAYERS), size, size), numpy.uint8)
+
+        # Terrain and water flags
+        self.terrain = self.data[0]
+        self.water = self.data[1]
+        # Coin and enemy IDs
+        self.coin = self.data[2]
+        self.enemy = self.data[3]
+        # Neighbor mask for auto-tiling and the water on top flag
+        self.mask = self.data[4]
+        self.water_top = self.data[5]
+
+        # Amount of non-empty cells
+        self.count = 0
+
+    def occupied(self, row, column):
+        """Check if the cell has anything placed"""
+        return bool(self.terrain[row, column] or self.water[row, column]
+                    or self.coin[row, column] or self.enemy[row, column])
+
+
+class TileStore:
+    """Map tiles stored in chunks of arrays, indexed by the cell position"""
+    def __init__(self, chunk_size=settings.LEVEL_CHUNK_SIZE):
+        """Initialize the tile store"""
+        # Size of the chunk in cells
+        self.chunk_size = chunk_size
+        # Chunks by their position
+        self.chunks = {}
+        # Amount of non-empty cells
+        self.count = 0
+        # Functions called with the left, top, right and bottom cell of every recalculated (so edited) region
+        self.listeners = []
+
+    def locate(self, cell):
+        """Get the chunk position and the row and column inside of it"""
+        chunk_x, column = divmod(cell[0], self.chunk_size)
+        chunk_y, row = divmod(cell[1], self.chunk_size)
+        return (chunk_x, chunk_y), row, column
+
+    def add(self, cell, tile_id):
+        """Add the item ID into the cell"""
+        chunk_pos, row, column = self.locate(cell)
+
+        # Create the chunk if needed
+        chunk = self.chunks.get(chunk_pos)
+        if chunk is None:
+            chunk = self.chunks[chunk_pos] = TileChunk(self.chunk_size)
+        was_occupied = chunk.occupied(row, column)
+
+        # Set the layer of the item's style
+        style = STYLES[tile_id]
+        if style == "terrain":
+            chunk.terrain[row, column] = 1
+        elif style == "water":
+            chunk.water[row, column] = 1
+        elif style == "coin":
+            chunk.coin[row, column] = tile_id
+        elif style == "enemy":
+            chunk.enemy[row, column] = tile_id
+        # Objects aren't stored in tiles
+        else:
+            return
+
+        # Count the new cell
+        if not was_occupied:
+            chunk.count += 1
+            self.count += 1
+
+    def remove(self, cell, tile_id):
+        """Remove the layer of item's style from the cell"""
+        chunk_pos, row, column = self.locate(cell)
+        chunk = self.chunks.get(chunk_pos)
+        # Nothing to remove if the cell is empty
+        if chunk is None or not chunk.occupied(row, column):
+            return
+
+        # Clear the layer of the item's style
+        style = STYLES[tile_id]
+        if style == "terrain":
+            chunk.terrain[row, column] = 0
+        elif style == "water":
+            chunk.water[row, column] = 0
+        elif style == "coin":
+            chunk.coin[row, column] = 0
+        elif style == "enemy":
+            chunk.enemy[row, column] = 0
+
+        # If the cell is empty now, clear it and forget it
+        if not chunk.occupied(row, column):
+            chunk.data[:, row, column] = 0
+            chunk.count -= 1
+            self.count -= 1
+            # Remove the empty chunk
+            if not chunk.count:
+                del self.chunks[chunk_pos]
+
+    def read(self, layer, left, top, width, height):
+        """Read a rectangle of cells from the layer into one array"""
+        index = LAYERS.index(layer)
+        size = self.chunk_size
+        result = numpy.zeros((height, width), numpy.uint8)
+
+        # Go through each chunk that overlaps the rectangle
+        for chunk_y in range(top // size, (top + height - 1) // size + 1):
+            for chunk_x in range(left // size, (left + width - 1) // size + 1):
+                chunk = self.chunks.get((chunk_x, chunk_y))
+                # Missing chunks are empty
+                if chunk is None:
+                    continue
+
+                # Get the overlapping area, copy it
+                start_x, end_x = max(left, chunk_x * size), min(left + width, (chunk_x + 1) * size)
+                start_y, end_y = max(top, chunk_y * size), min(top + height, (chunk_y + 1) * size)
+                result[start_y - top:end_y - top, start_x - left:end_x - left] = (
+                    chunk.data[index, start_y - chunk_y * size:end_y - chunk_y * size,
+                               start_x - chunk_x * size:end_x - chunk_x * size])
+        return result
+
+    def write(self, layer, left, top, values):
+        """Write an array of values into a rectangle of the layer, only existing chunks are written"""
+        index = LAYERS.index(layer)
+        size = self.chunk_size
+        height, width = values.shape
+
+        # Go through each chunk that overlaps the rectangle
+        for chunk_y in range(top // size, (top + height - 1) // size + 1):
+            for chunk_x in range(left // size, (left + width - 1) // size + 1):
+                chunk = self.chunks.get((chunk_x, chunk_y))
+                if chunk is None:
+                    continue
+
+                # Copy the overlapping area into the chunk
+                start_x, end_x = max(left, chunk_x * size), min(left + width, (chunk_x + 1) * size)
+                start_y, end_y = max(top, chunk_y * size), min(top + height, (chunk_y + 1) * size)
+                chunk.data[index, start_y - chunk_y * size:end_y - chunk_y * size,
+                           start_x - chunk_x * size:end_x - chunk_x * size] = (
+                    values[start_y - top:end_y - top, start_x - left:end_x - left])
+
+    def update_region(self, left, top, right, bottom):
+        """Recalculate neighbor masks and water on top flags of the cells in the region (including its edges)"""
+        width = right - left + 1
+        height = bottom - top + 1
+
+        # Read the terrain and water with their neighbors around the region
+        terrain = self.read("terrain", left - 1, top - 1, width + 2, height + 2)
+        water = self.read("water", left - 1, top - 1, width + 2, height + 2)
+
+        # Calculate the masks of the terrain cells
+        mask = autotile.neighbor_masks(terrain) * terrain[1:-1, 1:-1]
+        # Water is on top if the cell above has water too
+        water_top = water[1:-1, 1:-1] & water[:-2, 1:-1]
+
+        # Save them
+        self.write("mask", left, top, mask)
+        self.write("water_top", left, top, water_top)
+
+        # Tell the listeners that the region changed
+        for listener in self.listeners:
+            listener(left, top, right, bottom)
+
+    def update_all(self):
+        """Recalculate every cell of the map"""
+        size = self.chunk_size
+        for chunk_x, chunk_y in list(self.chunks):
+            self.update_region(chunk_x * size, chunk_y * size,
+                               (chunk_x + 1) * size - 1, (chunk_y + 1) * size - 1)
+
+    def clear(self):
+        """Remove every tile"""
+        size = self.chunk_size
+        # Tell the listeners about every removed chunk
+        for chunk_x, chunk_y in list(self.chunks):
+            del self.chunks[(chunk_x, chunk_y)]
+            for listener in self.listeners:
+                listener(chunk_x * size, chunk_y * size, (chunk_x + 1) * size - 1, (chunk_y + 1) * size - 1)
+        self.count = 0
+
+    def apply(self, left, top, values, where):
+        """Write arrays of layer values into the rectangle, only into the cells where the flag is set"""
+        size = self.chunk_size
+        height, width = where.shape
+
+        # Go through each chunk that overlaps the rectangle
+        for chunk_y in range(top // size, (top + height - 1) // size + 1):
+            for chunk_x in range(left // size, (left + width - 1) // size + 1):
+                # Get the overlapping area in the rectangle and in the chunk
+                start_x, end_x = max(left, chunk_x * size), min(left + width, (chunk_x + 1) * size)
+                start_y, end_y = max(top, chunk_y * size), min(top + height, (chunk_y + 1) * size)
+                area = (slice(start_y - top, end_y - top), slice(start_x - left, end_x - left))
+                chunk_area = (slice(start_y - chunk_y * size, end_y - chunk_y * size),
+                              slice(start_x - chunk_x * size, end_x - chunk_x * size))
+
+                # Skip the chunk if nothing changes in it
+                if not where[area].any():
+                    continue
+                # Create it if needed
+                chunk = self.chunks.get((chunk_x, chunk_y))
+                if chunk is None:
+                    chunk = self.chunks[(chunk_x, chunk_y)] = TileChunk(size)
+
+                # Write every given layer
+                for layer, layer_values in values.items():
+                    numpy.copyto(getattr(chunk, layer)[chunk_area], layer_values[area], where=where[area])
+
+                # Count the cells again
+                occupied = chunk.terrain | chunk.water | chunk.coin | chunk.enemy
+                self.count -= chunk.count
+                chunk.count = int(numpy.count_nonzero(occupied))
+                self.count += chunk.count
+                # Remove the chunk if it's empty now
+                if not chunk.count:
+                    del self.chunks[(chunk_x, chunk_y)]
+
+        # Recalculate the changed cells and their neighbors once
+        self.update_region(left - 1, top - 1, left + width, top + height)
+
+    def fill_rect(self, left, top, right, bottom, tile_id):
+        """Fill the rectangle of cells with the item"""
+        layer, value = _layer_value(tile_id)
+        if layer:
+            where = numpy.ones((bottom - top + 1, right - left + 1), bool)
+            self.apply(left, top, {layer: numpy.full(where.shape, value, numpy.uint8)}, where)
+
+    def erase_rect(self, left, top, right, bottom, tile_id=None):
+        """Erase the layer of item's style from the rectangle, or everything if no item is given"""
+        where = numpy.ones((bottom - top + 1, right - left + 1), bool)
+        layers = [_layer_value(tile_id)[0]] if tile_id is not None else TILE_LAYERS
+        self.apply(left, top, {layer: numpy.zeros(where.shape, numpy.uint8) for layer in layers if layer}, where)
+
+    def flood_fill(self, cell, tile_id, left, top, right, bottom):
+        """Fill the area connected to the cell that has the same value in item's layer, within the bounds"""
+        layer, value = _layer_value(tile_id)
+        # Only tiles can be filled and the cell has to be within bounds
+        if not layer or not (left <= cell[0] <= right and top <= cell[1] <= bottom):
+            return
+
+        # Get the cells with the same value as the starting one
+        current = self.read(layer, left, top, right - left + 1, bottom - top + 1)
+        start = (cell[1] - top, cell[0] - left)
+        same = current == current[start]
+        # Other layers are filled only within the same terrain, so the terrain works as walls
+        if layer != "terrain":
+            terrain = self.read("terrain", left, top, right - left + 1, bottom - top + 1)
+            same &= terrain == terrain[start]
+        # Nothing to do if the cell has this value already
+        if current[start] == value:
+            return
+
+        # Grow the filled area into the same neighbor cells until it stops changing
+        filled = numpy.zeros(same.shape, bool)
+        filled[start] = True
+        while True:
+            grown = filled.copy()
+            grown[1:] |= filled[:-1]
+            grown[:-1] |= filled[1:]
+            grown[:, 1:] |= filled[:, :-1]
+            grown[:, :-1] |= filled[:, 1:]
+            grown &= same
+            if (grown == filled).all():
+                break
+            filled = grown
+
+        self.apply(left, top, {layer: numpy.full(same.shape, value, numpy.uint8)}, filled)
+
+    def copy_rect(self, left, top, right, bottom):
+        """Copy the rectangle of cells into a stamp"""
+        width = right - left + 1
+        height = bottom - top + 1
+        return {layer: self.read(layer, left, top, width, height) for layer in TILE_LAYERS}
+
+    def paste(self, stamp, left, top):
+        """Paste the stamp with its top left cell at the given position, empty stamp cells are skipped"""
+        where = (stamp["terrain"] | stamp["water"] | stamp["coin"] | stamp["enemy"]) != 0
+        if where.any():
+            self.apply(left, top, stamp, where)
+
+    def cells(self):
+        """Get positions of all the non-empty cells"""
+        return [cell for cell, tile in self.items()]
+
+    def items(self):
+        """Yield every non-empty cell with its tile"""
+        for (chunk_x, chunk_y), chunk in list(self.chunks.items()):
+            # Get the occupied cells of the chunk
+            rows, columns = numpy.nonzero(chunk.terrain | chunk.water | chunk.coin | chunk.enemy)
+            for row, column in zip(rows.tolist(), columns.tolist()):
+                yield ((chunk_x * self.chunk_size + column, chunk_y * self.chunk_size + row),
+                       MapTile(chunk, row, column))
+
+    def memory_usage(self):
+        """Get the amount of bytes used by the chunks"""
+        return sum(chunk.data.nbytes + sys.getsizeof(chunk) for chunk in self.chunks.values())
+
+    def __contains__(self, cell):
+        """Check if the cell isn't empty"""
+        chunk_pos, row, column = self.locate(cell)
+        chunk = self.chunks.get(chunk_pos)
+        return chunk is not None and chunk.occupied(row, column)
+
+    def __getitem__(self, cell):
+        """Get the tile of the cell"""
+        chunk_pos, row, column = self.locate(cell)
+        chunk = self.chunks.get(chunk_pos)
+        if chunk is None or not chunk.occupied(row, column):
+            raise KeyError(cell)
+        return MapTile(chunk, row, column)
+
+    def __len__(self):
+        """Get the amount of non-empty cells"""
+        return self.count
+
+
+def _layer_value(tile_id):
+    """Get the layer of the item and the value it's stored with, no layer for objects"""
+    style = STYLES[tile_id]
+    if style in ("terrain", "water"):
+        return style, 1
+    if style in ("coin", "enemy"):
+        return style, tile_id
+    return None, 0
+
+
+def benchmark(size=512):
+    """Fill a square of cells, report memory used per cell and the amount of edits per second"""
+    store = TileStore()
+    cells = [(column, row) for column in range(size) for row in range(size)]
+
+    # Measure adding the terrain
+    start = time.perf_counter()
+    for cell in cells:
+        store.add(cell, 2)
+    add_time = time.perf_counter() - start
+    memory = store.memory_usage()
+
+    # Measure removing it
+    start = time.perf_counter()
+    for cell in cells:
+        store.remove(cell, 2)
+    remove_time = time.perf_counter() - start
+
+    return {
+        "cells": len(cells),
+        "bytes_per_cell": memory / len(cells),
+        "adds_per_second": len(cells) / add_time,
+        "removes_per_second": len(cells) / remove_time
+    }
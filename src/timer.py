@@ -1,35 +1,102 @@
-import pygame
+import heapq
+
+
+class Scheduler:
+    """Calls the functions when their time comes, driven by the frame time read once per frame"""
+    def __init__(self):
+        """Initialize the scheduler"""
+        # Simulated time in milliseconds
+        self.time = 0
+        # Scheduled calls ordered by their due time, each one is [due time, order, function, interval, active]
+        self.queue = []
+        # Order of scheduling, so calls due at the same time run in order
+        self.counter = 0
+
+        # Paused flag and the speed of the simulated time
+        self.paused = False
+        self.time_scale = 1
+
+    def tick(self, milliseconds):
+        """Advance the time by the frame's real time, call the due functions and return the simulated time"""
+        # Paused simulation doesn't move, otherwise scale the time
+        elapsed = 0 if self.paused else milliseconds * self.time_scale
+        self.time += elapsed
+
+        # Call everything that is due
+        while self.queue and self.queue[0][0] <= self.time:
+            call = heapq.heappop(self.queue)
+            # Skip the cancelled calls
+            if not call[4]:
+                continue
+
+            # Schedule the repeating calls again (skip the missed ones after a long frame)
+            if call[3]:
+                call[0] += call[3]
+                if call[0] <= self.time:
+                    call[0] = self.time + call[3]
+                heapq.heappush(self.queue, call)
+            else:
+                call[4] = False
+            call[2]()
+
+        return elapsed
+
+    def schedule(self, delay, function, repeat=False):
+        """Call the function after the delay (in milliseconds), every delay if repeating, return the call"""
+        self.counter += 1
+        call = [self.time + delay, self.counter, function, delay if repeat else 0, True]
+        heapq.heappush(self.queue, call)
+        return call
+
+    def cancel(self, call):
+        """Cancel the scheduled call"""
+        if call:
+            call[4] = False
+
+    def reset(self):
+        """Start the simulated time from zero at the normal speed, forgetting every scheduled call"""
+        self.time = 0
+        self.queue.clear()
+        self.counter = 0
+        self.paused = False
+        self.time_scale = 1
+
+    def pause(self):
+        """Pause the simulated time"""
+        self.paused = True
+
+    def resume(self):
+        """Resume the simulated time"""
+        self.paused = False
 
 
 class Timer:
-    """Timer class"""
+    """Timer class, stopped by the scheduler once its duration passes"""
     def __init__(self, duration):
         """Initialize the timer"""
         # Active flag
         self.active = False
         # Duration of the timer
         self.duration = duration
-        # Activate time
-        self.start_time = 0
-
-    def update(self):
-        """Update the timer"""
-        # Get the current time
-        current_time = pygame.time.get_ticks()
-        # If the timer duration passed, deactivate the timer
-        if current_time - self.start_time >= self.duration:
-            self.stop()
+        # Scheduled stop of the timer
+        self.call = None
 
     def start(self):
         """Start the timer"""
+        # Forget the previous stop if it's restarted
+        scheduler.cancel(self.call)
         # Activate it
         self.active = True
-        # Store the start time
-        self.start_time = pygame.time.get_ticks()
+        # Stop it after the duration
+        self.call = scheduler.schedule(self.duration, self.stop)
 
     def stop(self):
         """Stop the timer"""
         # Reset the active flag
         self.active = False
-        # Reset the start time back to 0
-        self.start_time = 0
+        # Cancel the scheduled stop
+        scheduler.cancel(self.call)
+        self.call = None
+
+
+scheduler = Scheduler()
@@ -10,7 +10,13 @@ class Utilities:
     """Class that gives utilities"""
     def __init__(self):
         """Initialize the utilities"""
-        pass
+        # Masks, flipped and scaled copies of the animation frames, by the ID of their list (kept with it, so the ID
+        # stays unique)
+        self.masks = {}
+        self.flipped = {}
+        self.scaled = {}
+        # Masks of single surfaces, by the ID of the surface (kept with it too)
+        self.surface_masks = {}
 
     def import_folder(self, path):
         """Import the folder"""
@@ -56,5 +62,122 @@ class Utilities:
         # Return the images dictionary
         return images_dict
 
+    def import_level_assets(self):
+        """Import all the assets used by the levels"""
+        # Get the directories inside of the folder
+        def folders(path):
+            return list(os.walk(path_join(settings.BASE_PATH, path)))[0][1]
+
+        # Load a single image
+        def image(path):
+            return pygame.image.load(path_join(settings.BASE_PATH, path)).convert_alpha()
+
+        return {
+            # Terrains, the land tiles, bottom water tile and the entire water animation
+            "land": self.import_folder_dict("../graphics/terrain/land"),
+            "water_bottom": image("../graphics/terrain/water/water_bottom.png"),
+            "water_top": self.import_folder("../graphics/terrain/water/animation"),
+
+            # Every coin graphic
+            "gold_coin": self.import_folder("../graphics/items/gold"),
+            "silver_coin": self.import_folder("../graphics/items/silver"),
+            "diamond_coin": self.import_folder("../graphics/items/diamond"),
+
+            # Enemies, the spikes and all the tooth animations
+            "spikes": image("../graphics/enemies/spikes/spikes.png"),
+            "tooth": {folder: self.import_folder(f"../graphics/enemies/tooth/{folder}")
+                      for folder in folders("../graphics/enemies/tooth")},
+            # Shells (only the left one, to get the right one just flip it) and their bullets
+            "shell": {folder: self.import_folder(f"../graphics/enemies/shell_left/{folder}")
+                      for folder in folders("../graphics/enemies/shell_left")},
+            "pearl": image("../graphics/enemies/pearl/pearl.png"),
+
+            # Player's animations
+            "player": {folder: self.import_folder(f"../graphics/player/{folder}")
+                       for folder in folders("../graphics/player")},
+
+            # Clouds
+            "clouds": self.import_folder("../graphics/clouds"),
+
+            # All the palms
+            "palms": {folder: self.import_folder(f"../graphics/terrain/palm/{folder}")
+                      for folder in folders("../graphics/terrain/palm")},
+
+            # Particles
+            "particle": self.import_folder("../graphics/items/particle"),
+        }
+
+    def line_cells(self, start, end):
+        """Get the cells on the line between two cells (Bresenham's line), including both of them"""
+        column, row = start
+        # Distance and direction of the line
+        distance_x = abs(end[0] - column)
+        distance_y = -abs(end[1] - row)
+        step_x = 1 if column < end[0] else -1
+        step_y = 1 if row < end[1] else -1
+        # Error of the current cell from the real line
+        error = distance_x + distance_y
+
+        cells = [(column, row)]
+        # Step towards the end, along the axis that drifted away from the line
+        while (column, row) != tuple(end):
+            double_error = 2 * error
+            if double_error >= distance_y:
+                error += distance_y
+                column += step_x
+            if double_error <= distance_x:
+                error += distance_x
+                row += step_y
+            cells.append((column, row))
+        return cells
+
+    def compose_tiles(self, tiles):
+        """Compose the animated tiles (frames by their position) into frames of one surface, get its position too"""
+        # Area covered by the tiles
+        rects = [frames[0].get_rect(topleft=pos) for pos, frames in tiles.items()]
+        area = rects[0].unionall(rects[1:])
+        # Every tile loops its own frames, static tiles have only one
+        count = max(len(frames) for frames in tiles.values())
+
+        composed = []
+        for frame in range(count):
+            surface = pygame.Surface(area.size, pygame.SRCALPHA)
+            # Tiles don't overlap, so copy their pixels with the alpha unchanged (a normal blit would blend it with
+            # the transparent surface and draw the tiles darker later)
+            for pos, frames in tiles.items():
+                surface.blit(frames[frame % len(frames)], (pos[0] - area.x, pos[1] - area.y),
+                             special_flags=pygame.BLEND_RGBA_MAX)
+            composed.append(surface)
+        return area.topleft, composed
+
+    def frame_masks(self, frames):
+        """Get masks of the frames, created once for every list of frames"""
+        cached = self.masks.get(id(frames))
+        if cached is None or cached[0] is not frames:
+            cached = self.masks[id(frames)] = (frames, [pygame.mask.from_surface(frame) for frame in frames])
+        return cached[1]
+
+    def flip_frames(self, frames):
+        """Get horizontally flipped copies of the frames, created once for every list of frames"""
+        cached = self.flipped.get(id(frames))
+        if cached is None or cached[0] is not frames:
+            cached = self.flipped[id(frames)] = (frames, [pygame.transform.flip(frame, True, False)
+                                                          for frame in frames])
+        return cached[1]
+
+    def scaled_frames(self, frames):
+        """Get copies of the frames scaled two times, created once for every list of frames"""
+        cached = self.scaled.get(id(frames))
+        if cached is None or cached[0] is not frames:
+            cached = self.scaled[id(frames)] = (frames, [pygame.transform.scale2x(frame) for frame in frames])
+        return cached[1]
+
+    def surface_mask(self, surface):
+        """Get mask of the surface, created once for every surface"""
+        cached = self.surface_masks.get(id(surface))
+        if cached is None or cached[0] is not surface:
+            cached = self.surface_masks[id(surface)] = (surface, pygame.mask.from_surface(surface))
+        return cached[1]
+
 
 utilities = Utilities()
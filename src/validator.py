@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from src.settings import settings
+from src import level_file
+
+
+# IDs of the objects and enemies
+PLAYER_ID = 0
+COIN_IDS = {4: "gold", 5: "silver", 6: "diamond"}
+ENEMY_IDS = {7: "spikes", 8: "tooth", 9: "shell_left", 10: "shell_right"}
+TOOTH_ID = 8
+SHELL_IDS = (9, 10)
+# Foreground palms with the offset of the block on their top that the player stands on, and the size of the block
+PALM_BLOCKS = {11: (0, 0), 12: (0, 0), 13: (0, 0), 14: (50, 0)}
+PALM_BLOCK_SIZE = (77, 50)
+
+# Player's jump in tiles, from his physics: he jumps at 2 * 300 pixels per second and the gravity slows him down by
+# 4 * 300 pixels per second every second, while he runs at 300 pixels per second
+JUMP_SPEED = 2 * 300
+GRAVITY = 4 * 300
+RUN_SPEED = 300
+# Rows above the floor he can land on and the columns he can pass in one jump
+JUMP_HEIGHT = int(JUMP_SPEED ** 2 / (2 * GRAVITY) // settings.TILE_SIZE)
+JUMP_DISTANCE = int(RUN_SPEED * 2 * JUMP_SPEED / GRAVITY // settings.TILE_SIZE)
+
+
+def occupancy(level):
+    """Get the dense arrays of the tile layers (rows first) covering the whole level, with the cell of their origin"""
+    # Chunks of every layer and the cells of the objects
+    chunk_positions = {chunk_pos for layer in level.layers.values() for chunk_pos in layer}
+    size = level.chunk_size
+    cells = [(x // settings.TILE_SIZE, y // settings.TILE_SIZE) for x, y, obj in level.objects.tolist()]
+
+    # Bounds of everything, in cells
+    columns = [chunk_x * size for chunk_x, chunk_y in chunk_positions] + [cell[0] for cell in cells]
+    rows = [chunk_y * size for chunk_x, chunk_y in chunk_positions] + [cell[1] for cell in cells]
+    if not columns:
+        return {name: numpy.zeros((0, 0), level_file.LAYERS[name]) for name in level.layers}, (0, 0)
+    left = min(columns) // size * size
+    top = min(rows) // size * size
+    # One more chunk after the last one, so the cells have something below and beside them
+    right = (max(columns) // size + 2) * size
+    bottom = (max(rows) // size + 2) * size
+
+    # Copy the chunks into the arrays
+    arrays = {}
+    for name, layer in level.layers.items():
+        array = numpy.zeros((bottom - top, right - left), level_file.LAYERS[name])
+        for (chunk_x, chunk_y), chunk in layer.items():
+            row = chunk_y * size - top
+            column = chunk_x * size - left
+            array[row:row + size, column:column + size] = chunk
+        arrays[name] = array
+    return arrays, (left, top)
+
+
+def _spread(mask, left, right, up=0, down=0):
+    """Spread the true cells of the mask by the amount of cells in every direction"""
+    spread = mask.copy()
+    for shift in range(1, left + 1):
+        spread[:, :-shift] |= mask[:, shift:]
+    for shift in range(1, right + 1):
+        spread[:, shift:] |= mask[:, :-shift]
+    horizontal = spread.copy()
+    for shift in range(1, up + 1):
+        spread[:-shift] |= horizontal[shift:]
+    for shift in range(1, down + 1):
+        spread[shift:] |= horizontal[:-shift]
+    return spread
+
+
+def _fall(air, free):
+    """Let the player fall from the air cells, drifting one column to the sides for every row, stopped by solid cells"""
+    fallen = air.copy()
+    for row in range(len(free) - 1):
+        fallen[row + 1] |= _spread(fallen[row:row + 1], 1, 1)[0] & free[row + 1]
+    return fallen
+
+
+def palm_blocks(objects, left, top):
+    """Get the cells covered by the blocks on top of the foreground palms, relative to the origin cell"""
+    tile = settings.TILE_SIZE
+    cells = []
+    for x, y, obj in objects:
+        offset = PALM_BLOCKS.get(obj)
+        if offset is not None:
+            block_x = x + offset[0]
+            block_y = y + offset[1]
+            for row in range(block_y // tile, (block_y + PALM_BLOCK_SIZE[1] - 1) // tile + 1):
+                for column in range(block_x // tile, (block_x + PALM_BLOCK_SIZE[0] - 1) // tile + 1):
+                    cells.append((column - left, row - top))
+    return cells
+
+
+def reachable_cells(solid, start):
+    """Get the cells that the player passes through from the start cell, walking, jumping and falling (walls inside
+    of the jump arc aren't checked, so the result is optimistic)"""
+    free = ~solid
+    # Cells that player can stand in, with a solid cell under them
+    standable = free.copy()
+    standable[:-1] &= solid[1:]
+    standable[-1] = False
+
+    # Fall down from the start
+    air = numpy.zeros_like(solid)
+    air[start[1], start[0]] = free[start[1], start[0]]
+    touched = _fall(air, free)
+    reached = touched & standable
+
+    # Jump (or walk) from every reached floor, until no new floor is reached
+    while True:
+        air = _spread(reached, JUMP_DISTANCE, JUMP_DISTANCE, JUMP_HEIGHT) & free
+        fallen = _fall(air, free)
+        touched |= fallen
+        new = fallen & standable & ~reached
+        if not new.any():
+            return touched
+        reached |= new
+
+
+def analyze(level):
+    """Check the level data, get its problems and counts of its entities"""
+    arrays, (left, top) = occupancy(level)
+    objects = level.objects.tolist()
+    coins = arrays["coins"]
+    enemies = arrays["enemies"]
+
+    # Solid cells, the terrain, shells and palm tops that the player stands on
+    solid = (arrays["terrain"] != 0) | numpy.isin(enemies, SHELL_IDS)
+    for column, row in palm_blocks(objects, left, top):
+        if 0 <= row < solid.shape[0] and 0 <= column < solid.shape[1]:
+            solid[row, column] = True
+
+    report = {
+        "counts": {
+            "terrain": int(numpy.count_nonzero(arrays["terrain"])),
+            "water": int(numpy.count_nonzero(arrays["water"])),
+            **{name: int(numpy.count_nonzero(coins == coin_id)) for coin_id, name in COIN_IDS.items()},
+            **{name: int(numpy.count_nonzero(enemies == enemy_id)) for enemy_id, name in ENEMY_IDS.items()},
+            "objects": len(objects),
+        },
+        "problems": [],
+    }
+    problems = report["problems"]
+
+    # Teeth need the ground under them, the level destroys the ones without it
+    teeth = enemies == TOOTH_ID
+    grounded = numpy.zeros_like(teeth)
+    grounded[:-1] = solid[1:]
+    floating = numpy.argwhere(teeth & ~grounded)
+    report["counts"]["floating_teeth"] = len(floating)
+    if len(floating):
+        problems.append(f"{len(floating)} teeth without the ground under them, first at cell "
+                        f"{(int(floating[0][1]) + left, int(floating[0][0]) + top)}")
+
+    # There has to be exactly one player
+    players = [(x, y) for x, y, obj in objects if obj == PLAYER_ID]
+    if len(players) != 1:
+        problems.append(f"{len(players)} player spawns")
+        report["counts"]["unreachable_coins"] = None
+        return report
+
+    # Cell of the player's hitbox center (the player image is wider than the tile)
+    player_x, player_y = players[0]
+    start = ((player_x + 50) // settings.TILE_SIZE - left, player_y // settings.TILE_SIZE - top)
+    if solid[start[1], start[0]]:
+        problems.append("player spawns inside the terrain")
+
+    # Coins that the player never passes through
+    touched = reachable_cells(solid, start)
+    unreachable = numpy.argwhere((coins != 0) & ~touched)
+    report["counts"]["unreachable_coins"] = len(unreachable)
+    if len(unreachable):
+        problems.append(f"{len(unreachable)} coins out of reach, first at cell "
+                        f"{(int(unreachable[0][1]) + left, int(unreachable[0][0]) + top)}")
+
+    return report
+
+
+def analyze_file(path):
+    """Load the level file and check it (worker process), errors are reported instead of raised"""
+    try:
+        report = analyze(level_file.load_level(path))
+    except Exception as error:
+        report = {"counts": {}, "problems": [], "error": f"{type(error).__name__}: {error}"}
+    report["path"] = path
+    return report
+
+
+def validate(paths, workers=None):
+    """Check the level files in a pool of processes, get the report of every one of them in order"""
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        # Send the files in batches, so small levels don't wait on the process communication
+        return list(executor.map(analyze_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+
+def summarize(reports):
+    """Aggregate the reports into totals of the entities, problems and errors"""
+    totals = {}
+    for report in reports:
+        for name, count in report["counts"].items():
+            totals[name] = totals.get(name, 0) + (count or 0)
+
+    return {
+        "levels": len(reports),
+        "valid": sum(1 for report in reports if not report["problems"] and "error" not in report),
+        "with_problems": [report["path"] for report in reports if report["problems"]],
+        "errors": [report["path"] for report in reports if "error" in report],
+        "totals": totals,
+    }
+
+
+def format_report(reports, summary):
+    """Format the reports and their summary as text"""
+    lines = []
+    for report in reports:
+        if "error" in report:
+            lines.append(f"{report['path']}: ERROR {report['error']}")
+        for problem in report["problems"]:
+            lines.append(f"{report['path']}: {problem}")
+
+    lines.append(f"{summary['valid']} of {summary['levels']} levels valid, {len(summary['with_problems'])} with "
+                 f"problems, {len(summary['errors'])} unreadable")
+    lines.append("Totals: " + ", ".join(f"{name} {count}" for name, count in summary["totals"].items()))
+    return "\n".join(lines)
+
+
+def main(arguments=None):
+    """Check the level files given on the command line, return the exit code"""
+    parser = argparse.ArgumentParser(prog="python -m src.validator", description="Check saved levels offline")
+    parser.add_argument("paths", nargs="+", help="level files and directories of them")
+    parser.add_argument("--workers", type=int, default=None, help="amount of worker processes")
+    parser.add_argument("--json", help="also save the reports and the summary into this JSON file")
+    options = parser.parse_args(arguments)
+
+    reports = validate(level_file.level_pack(options.paths), options.workers)
+    summary = summarize(reports)
+    print(format_report(reports, summary))
+
+    if options.json:
+        with open(options.json, "w") as file:
+            json.dump({"summary": summary, "levels": reports}, file, indent=2)
+
+    # Fail if any level has a problem
+    return 0 if summary["valid"] == summary["levels"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
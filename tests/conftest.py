@@ -0,0 +1,19 @@
+import pytest
+
+from src import simulate
+from src.timer import scheduler
+
+
+@pytest.fixture(scope="session")
+def assets():
+    """Open the hidden window and import the level assets once for every test"""
+    simulate.init_headless()
+    return simulate.assets
+
+
+@pytest.fixture(autouse=True)
+def fresh_scheduler():
+    """Start every test with the scheduler's time and calls cleared, so tests don't run each other's timers"""
+    scheduler.reset()
+    yield
+    scheduler.reset()
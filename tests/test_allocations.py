@@ -0,0 +1,25 @@
+from src.level import Level
+from src.profiling import reference_grid, measure_allocations
+
+
+# Budgets of one simulated and drawn frame: memory blocks and bytes still allocated after it, and the highest amount
+# of bytes allocated at once during it (temporary ones included)
+BLOCKS_PER_FRAME = 2
+BYTES_PER_FRAME = 1024
+PEAK_PER_FRAME = 16 * 1024
+
+
+def test_frame_allocations_stay_within_budget(assets):
+    """Frames of the reference level don't leak memory and don't allocate much while running"""
+    level = Level(reference_grid(), lambda *args: None, assets)
+    level.start()
+    try:
+        allocations = measure_allocations(level)
+    finally:
+        level.stop()
+
+    # Lines that kept the most blocks, shown if the budget is broken
+    lines = "\n".join(f"{line}: {count}" for line, count in allocations["lines"])
+    assert allocations["blocks"] <= BLOCKS_PER_FRAME, lines
+    assert allocations["bytes"] <= BYTES_PER_FRAME, lines
+    assert allocations["peak"] <= PEAK_PER_FRAME, lines
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+
+from src.autosave import Autosave, load_autosave, JOURNAL_HEADER, JOURNAL_MAGIC, RECORD, CHUNK_RECORD
+from src.tile_store import TileStore
+
+
+def _write(path, data):
+    """Write the bytes into the file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_empty_journal_is_no_autosave(tmp_path):
+    """Journal cut off in its header reads as no autosave instead of raising"""
+    _write(tmp_path / "journal", b"")
+    assert load_autosave(str(tmp_path)) is None
+
+    _write(tmp_path / "journal", JOURNAL_MAGIC)
+    assert load_autosave(str(tmp_path)) is None
+
+
+def test_foreign_journal_is_no_autosave(tmp_path):
+    """Journal with a wrong magic reads as no autosave"""
+    _write(tmp_path / "journal", JOURNAL_HEADER.pack(b"NOPE", 32, 0))
+    assert load_autosave(str(tmp_path)) is None
+
+
+def test_cut_off_record_is_skipped(tmp_path):
+    """Record cut off by a crash is skipped, the header alone gives an empty map"""
+    _write(tmp_path / "journal", JOURNAL_HEADER.pack(JOURNAL_MAGIC, 32, 0) + RECORD.pack(CHUNK_RECORD, 0, 0, 5000))
+    level = load_autosave(str(tmp_path))
+    assert level is not None
+    assert not any(level.layers.values())
+
+
+def test_damaged_autosave_starts_empty_and_saves_again(tmp_path):
+    """Damaged journal is set aside, so the editor starts empty and its next saves can be recovered"""
+    _write(tmp_path / "journal", b"\x01\x02")
+    map_data = TileStore()
+    autosave = Autosave(map_data, lambda: [(0, 0, 0)], str(tmp_path))
+    try:
+        assert autosave.recover() is None
+        assert os.path.exists(tmp_path / "journal.damaged")
+
+        # Save an edit and read it back
+        map_data.add((3, 4), 2)
+        map_data.update_all()
+        autosave.mark_objects()
+        autosave.save()
+    finally:
+        autosave.stop()
+
+    level = load_autosave(str(tmp_path))
+    assert level is not None
+    assert (0, 0) in level.layers["terrain"]
+    assert level.objects.tolist() == [[0, 0, 0]]
+
+
+def test_stop_writes_the_queued_save(tmp_path):
+    """Save queued for the writer is on the disk once the autosave stops"""
+    map_data = TileStore()
+    autosave = Autosave(map_data, lambda: [], str(tmp_path))
+    map_data.add((3, 4), 2)
+    map_data.update_all()
+    autosave.save()
+    autosave.stop()
+    # Stopping again does nothing
+    autosave.stop()
+
+    level = load_autosave(str(tmp_path))
+    assert level is not None
+    assert level.layers["terrain"][(0, 0)].any()
+
+
+def test_exit_writes_the_last_changes(tmp_path):
+    """Game quitting without stopping the autosave (like the level does) still writes the unsaved edits"""
+    script = "; ".join((
+        "import sys",
+        "from src.autosave import Autosave",
+        "from src.tile_store import TileStore",
+        "map_data = TileStore()",
+        f"autosave = Autosave(map_data, lambda: [], {str(tmp_path)!r})",
+        "map_data.add((3, 4), 2)",
+        "map_data.update_all()",
+        "sys.exit()",
+    ))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True)
+
+    level = load_autosave(str(tmp_path))
+    assert level is not None
+    assert level.layers["terrain"][(0, 0)].any()
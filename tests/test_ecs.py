@@ -0,0 +1,12 @@
+import pygame
+
+from src.ecs import World, EntityFactory
+
+
+def test_entity_masks_are_created_once(assets):
+    """Mask of the entity sprite is taken from the cache, not created again on every collision check"""
+    group = pygame.sprite.Group()
+    coin = EntityFactory(World()).coin((100, 100), assets["gold_coin"], group, "gold")
+
+    assert coin.mask is coin.mask
+    assert coin.mask.get_size() == coin.image.get_size()
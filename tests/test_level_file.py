@@ -0,0 +1,54 @@
+import builtins
+
+import pytest
+
+from src import level_file
+from src.profiling import reference_grid
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Files opened by the level file module, to check they get closed"""
+    files = []
+
+    def tracked_open(*args, **kwargs):
+        files.append(builtins.open(*args, **kwargs))
+        return files[-1]
+
+    monkeypatch.setattr(level_file, "open", tracked_open, raising=False)
+    return files
+
+
+def _saved(tmp_path):
+    """Save the reference level, get its path and bytes"""
+    path = tmp_path / "level.pml"
+    level_file.save_grid(str(path), reference_grid(40))
+    return path, path.read_bytes()
+
+
+def test_saved_level_is_read_back(tmp_path):
+    """Saved grid loads back with the same placements"""
+    path, data = _saved(tmp_path)
+    grid = level_file.load_grid(str(path))
+    assert grid == level_file.level_to_grid(level_file.grid_to_level(reference_grid(40)))
+
+
+@pytest.mark.parametrize("damage", ["empty", "header", "signature", "version", "index", "data"])
+def test_damaged_file_raises_value_error_and_closes(tmp_path, opened, damage):
+    """Damaged files raise one ValueError naming the file, the file doesn't stay open"""
+    path, data = _saved(tmp_path)
+    header_end = level_file.HEADER.size
+    index_end = header_end + level_file.LAYER_ENTRY.size * len(level_file.LAYERS)
+    damaged = {
+        "empty": b"",
+        "header": data[:header_end - 3],
+        "signature": b"NOPE" + data[4:],
+        "version": data[:4] + (level_file.VERSION + 1).to_bytes(2, "little") + data[6:],
+        "index": data[:index_end + 4],
+        "data": data[:len(data) - 100],
+    }[damage]
+    path.write_bytes(damaged)
+
+    with pytest.raises(ValueError, match="level.pml"):
+        level_file.LevelFile(str(path))
+    assert opened and all(file.closed for file in opened)
@@ -0,0 +1,62 @@
+import threading
+
+from src import level_file
+from src import playlist as playlist_module
+from src.playlist import Playlist
+from src.profiling import reference_grid
+
+
+def _pack(tmp_path, names):
+    """Create the level files of the pack, every name is a playable grid, an empty file or an editor map"""
+    paths = []
+    for index, name in enumerate(names):
+        path = str(tmp_path / f"{index:03}.pml")
+        if name == "grid":
+            level_file.save_grid(path, reference_grid(20, seed=index))
+        elif name == "empty":
+            open(path, "wb").close()
+        else:
+            level_file.save_level(path, level_file.LevelData("map"))
+        paths.append(path)
+    return paths
+
+
+def _play(playlist):
+    """Advance through the whole pack, get the index of every played level"""
+    played = []
+    while True:
+        level = playlist.advance()
+        if level is None:
+            return played
+        played.append(playlist.index)
+        level.stop()
+
+
+def test_broken_levels_are_skipped(tmp_path, assets):
+    """Empty files and editor maps in the pack are skipped instead of stopping the game"""
+    paths = _pack(tmp_path, ["grid", "empty", "grid", "map", "grid"])
+    playlist = Playlist(paths, lambda *args: None, lambda: None, assets)
+    assert _play(playlist) == [0, 2, 4]
+
+
+def test_pack_without_playable_levels_ends(tmp_path, assets):
+    """Pack of only broken levels ends right away"""
+    paths = _pack(tmp_path, ["empty", "map"])
+    playlist = Playlist(paths, lambda *args: None, lambda: None, assets)
+    assert playlist.advance() is None
+
+
+def test_levels_are_built_on_the_main_thread(tmp_path, assets, monkeypatch):
+    """Only the files are decoded in the background, the levels (surfaces and sounds) are made on the main thread"""
+    threads = []
+
+    class RecordedLevel(playlist_module.Level):
+        def __init__(self, *args, **kwargs):
+            threads.append(threading.current_thread())
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(playlist_module, "Level", RecordedLevel)
+    paths = _pack(tmp_path, ["grid", "grid"])
+    playlist = Playlist(paths, lambda *args: None, lambda: None, assets)
+    assert _play(playlist) == [0, 1]
+    assert threads == [threading.main_thread()] * 2
@@ -0,0 +1,59 @@
+from src import level_file
+from src.profiling import reference_grid
+from src.quality import governor
+from src.settings import settings
+from src.simulate import simulate
+from src.timer import scheduler
+
+
+def _run(path, **options):
+    """Simulate the level file, without the speed (it differs between runs)"""
+    result = simulate(path, **options)
+    result.pop("steps_per_second", None)
+    return result
+
+
+def test_unplayable_files_are_errors(tmp_path):
+    """Editor's maps and grids without the player are reported as errors, not played"""
+    map_path = str(tmp_path / "map.pml")
+    level_file.save_level(map_path, level_file.LevelData("map"))
+    empty_path = str(tmp_path / "empty.pml")
+    level_file.save_grid(empty_path, level_file.empty_grid())
+
+    for path in (map_path, empty_path):
+        result = _run(path, steps=10)
+        assert result["outcome"] == "error"
+        assert "error" in result
+
+
+def test_run_ignores_the_scheduler_left_by_others(tmp_path, assets):
+    """Run plays out the same after the scheduler was left moved, paused, slowed down and with a pending call"""
+    # Player standing next to a shell, its cooldown and the pearls follow the scheduler
+    tile = settings.TILE_SIZE
+    grid = level_file.empty_grid()
+    grid["fg objects"][(3 * tile, 5 * tile)] = 0
+    grid["fg objects"][(0, 3 * tile)] = 1
+    for x in range(14):
+        grid["terrain"][(x * tile, 7 * tile)] = "X"
+    grid["enemies"][(9 * tile, 6 * tile)] = 9
+    path = str(tmp_path / "level.pml")
+    level_file.save_grid(path, grid)
+
+    first = _run(path, script="idle", steps=900)
+    scheduler.tick(1234.5)
+    scheduler.schedule(100, scheduler.resume)
+    scheduler.time_scale = 0.5
+    scheduler.pause()
+    assert _run(path, script="idle", steps=900) == first
+
+
+def test_entity_world_plays_like_the_sprites(tmp_path, assets, monkeypatch):
+    """Levels with the entities stored in the component arrays play out the same as with the sprites, on every
+    quality tier (the low ones update the enemies only near the player)"""
+    path = str(tmp_path / "level.pml")
+    level_file.save_grid(path, reference_grid(120))
+
+    for tier in settings.QUALITY_TIERS:
+        monkeypatch.setattr(governor, "tier", tier)
+        sprites = _run(path, script="wander", steps=1200, seed=1)
+        assert _run(path, script="wander", steps=1200, seed=1, ecs=True) == sprites
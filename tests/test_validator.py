@@ -0,0 +1,35 @@
+from src import level_file
+from src.settings import settings
+from src.validator import analyze
+
+
+def _level(palm):
+    """Create a level with a coin over a ledge, a palm (if the flag is set) is the only way up to it"""
+    tile = settings.TILE_SIZE
+    grid = level_file.empty_grid()
+
+    # Player above the flat ground
+    grid["fg objects"][(2 * tile, 8 * tile)] = 0
+    for column in range(16):
+        grid["terrain"][(column * tile, 10 * tile)] = "X"
+
+    # Coin four rows above the ground, higher than a jump from it, and a tooth standing on the palm
+    grid["coins"][(8 * tile + tile // 2, 5 * tile + tile // 2)] = 4
+    if palm:
+        grid["fg objects"][(8 * tile, 8 * tile)] = 11
+        grid["enemies"][(8 * tile, 7 * tile)] = 8
+    return level_file.grid_to_level(grid)
+
+
+def test_coin_above_ground_is_out_of_reach():
+    """Coin higher than a jump from the only floor is reported"""
+    report = analyze(_level(palm=False))
+    assert report["counts"]["unreachable_coins"] == 1
+
+
+def test_palm_tops_are_floors():
+    """Palm's top is a floor, the coin reached from it and the tooth standing on it aren't reported"""
+    report = analyze(_level(palm=True))
+    assert report["counts"]["unreachable_coins"] == 0
+    assert report["counts"]["floating_teeth"] == 0
+    assert report["problems"] == []